@@ -0,0 +1,193 @@
+"""
+Accounts of xiaohongshu.com. Each account has its own cookies, xhshow signing session
+and rate limiters, so that requests can be spread over several accounts.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+
+from cookies import cookies_dir, cookies_path, is_expired, read_cookies
+from rate_limit import new_limiters
+
+# Responses that mean the website rejects the account: status codes of unauthorized
+# and risk control, and API codes of expired login.
+rejected_status_codes = {401, 403, 461}
+rejected_api_codes = {-100, -101}
+
+
+class Account:
+    def __init__(self, name: str, cookies: dict, expiration_date: float | None = None,
+                 rejection_cooldown: float = 600):
+        self.name = name
+        self.cookies = cookies
+        self.expiration_date = expiration_date
+        self.rejection_cooldown = rejection_cooldown
+        self.limiters = new_limiters()
+        # xhshow.SessionManager, created at the first request.
+        self.xhs_session = None
+        self.rejected_until = 0.0
+        self.rejections = 0
+
+    def update(self, cookies: dict, expiration_date: float | None):
+        """
+        Take the cookies reloaded from the file. The rate limiters and the rejection
+        state are kept, except that new cookies (such as after logging in again) end the
+        rejection.
+        """
+        if cookies != self.cookies:
+            if cookies.get('a1') != self.cookies.get('a1'):
+                self.xhs_session = None
+            if self.rejected_until > time.time():
+                logging.info(f"Account {self.name} has new cookies, so it's back in "
+                             f"rotation.")
+            self.rejected_until = 0.0
+            self.cookies = cookies
+        self.expiration_date = expiration_date
+
+    def usable(self) -> bool:
+        return not is_expired(self.expiration_date) and time.time() >= self.rejected_until
+
+    def report(self, kind: str, healthy: bool, rejected: bool = False):
+        """
+        Report the result of a request of the class of endpoints ("html" or "api").
+        Args:
+            healthy: whether the status code is 200 and the API returns "success".
+            rejected: whether the website rejects the account (expired login or risk
+            control); the account is out of rotation for "rejection_cooldown" seconds.
+        """
+        self.limiters[kind].report(healthy)
+        if rejected:
+            self.rejections += 1
+            self.rejected_until = time.time() + self.rejection_cooldown
+            logging.warning(f"Account {self.name} is rejected by the website, and is out "
+                            f"of rotation for {self.rejection_cooldown:.0f} seconds.")
+
+    def stats(self) -> dict:
+        return {
+            "usable": self.usable(),
+            "expired": is_expired(self.expiration_date),
+            "rejections": self.rejections,
+            "rejected_until": self.rejected_until,
+            "rate_limit": {kind: limiter.stats() for kind, limiter in self.limiters.items()},
+        }
+
+
+# a1 cookie (device ID) -> Account, so that the state of an account is found from its
+# cookies. Entries are never replaced, so that cookies still used by requests in flight
+# after a reload find the same account.
+registry = {}
+registry_lock = threading.Lock()
+
+
+def get_account(cookies: dict) -> Account:
+    """
+    Find the account of the cookies. Cookies not loaded by AccountPool, such as in the
+    scripts in "tests", get an account on the fly.
+    """
+    key = cookies.get('a1', '')
+    with registry_lock:
+        account = registry.get(key)
+        if account is None:
+            account = registry[key] = Account(key or "default", cookies)
+        return account
+
+
+class AccountPool:
+    """
+    All accounts whose cookies are in "directory" (one file per account), or the single
+    account in "fallback_path" if the directory is empty. Files are reloaded when they
+    change, without restarting the server.
+    Args:
+        reload_interval: seconds between checks of the files' modification time.
+        rejection_cooldown: seconds that a rejected account is out of rotation.
+    """
+    def __init__(self, directory: str = cookies_dir, fallback_path: str = cookies_path,
+                 reload_interval: float = 5, rejection_cooldown: float = 600):
+        self.directory = directory
+        self.fallback_path = fallback_path
+        self.reload_interval = reload_interval
+        self.rejection_cooldown = rejection_cooldown
+        self.accounts = {}  # name -> Account
+        # name -> Account of every account loaded, also the removed ones, so that an
+        # account keeps its rate limiters and rejection state when its file comes back.
+        self._loaded = {}
+        self._mtimes = {}  # path -> modification time
+        self._checked_at = 0.0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.reload(force=True)
+        if not self.accounts:
+            raise Exception(f"No cookies can be loaded from {directory} or {fallback_path}. "
+                            f"Please update cookies.")
+
+    def _paths(self) -> dict[str, str]:
+        paths = {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.json")))
+        }
+        return paths or {"default": self.fallback_path}
+
+    def reload(self, force: bool = False):
+        now = time.time()
+        if not force and now < self._checked_at + self.reload_interval:
+            return
+        self._checked_at = now
+        paths = self._paths()
+        for name, path in paths.items():
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+            if not force and self._mtimes.get(path) == mtime and name in self.accounts:
+                continue
+            try:
+                cookies, expiration_date = read_cookies(path)
+            except Exception as e:
+                logging.warning(f"Fail to load cookies of account {name} from {path}. "
+                                f"{type(e).__name__}: {e}")
+                with self._lock:
+                    self.accounts.pop(name, None)
+                continue
+            with self._lock:
+                account = self._loaded.get(name)
+                if account is None:
+                    account = self._loaded[name] = Account(
+                        name, cookies, expiration_date, self.rejection_cooldown)
+                else:
+                    account.update(cookies, expiration_date)
+                self.accounts[name] = account
+                self._mtimes[path] = mtime
+            with registry_lock:
+                registry[cookies.get('a1', '')] = account
+            logging.info(f"Load cookies of account {name}.")
+        with self._lock:
+            for name in set(self.accounts) - set(paths):
+                del self.accounts[name]
+                logging.info(f"Remove account {name}, because its cookies file is deleted.")
+
+    def get(self, name: str) -> Account | None:
+        with self._lock:
+            return self.accounts.get(name)
+
+    def pick(self, kind: str) -> Account:
+        """
+        Choose the usable account with the most available rate budget for the class of
+        endpoints ("html" or "api"). Ties are broken in turn.
+        """
+        self.reload()
+        with self._lock:
+            accounts = [account for account in self.accounts.values() if account.usable()]
+            if not accounts:
+                raise Exception("No usable account: cookies are expired or rejected by the "
+                                "website. Please update cookies.")
+            self._next += 1
+            n = len(accounts)
+            accounts = accounts[self._next % n:] + accounts[:self._next % n]
+        return max(accounts, key=lambda account: account.limiters[kind].available())
+
+    def stats(self) -> dict:
+        with self._lock:
+            accounts = dict(self.accounts)
+        return {name: account.stats() for name, account in accounts.items()}
@@ -0,0 +1,41 @@
+"""
+Baseline numbers of benchmarks, saved in "benchmarks/baseline_*.json", so that later
+runs report regressions.
+"""
+import json
+import os
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(benchmarks_dir, f"baseline_{name}.json")
+
+
+def load_baseline(name: str) -> dict:
+    path = baseline_path(name)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(name: str, results: dict):
+    path = baseline_path(name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Baseline is saved to {path}")
+
+
+def compare(value: float, baseline_value: float | None, tolerance: float) -> tuple[str, bool]:
+    """
+    Compare a duration with its baseline.
+    Returns:
+        (text of the ratio to print, whether it is a regression)
+    """
+    if not baseline_value:
+        return "", False
+    ratio = value / baseline_value
+    if ratio > 1 + tolerance:
+        return f"{ratio:>9.2f}x  REGRESSION", True
+    return f"{ratio:>9.2f}x", False
@@ -0,0 +1,65 @@
+"""
+Bytes transferred and time-to-result of fetching post detail pages from the local
+stand-in server: reading the whole page (as before), compared with the streamed read of
+get_data.read_detail_page, which stops after the window.__INITIAL_STATE__ script.
+Run from the root folder of this program:
+    python -m benchmarks.bench_detail_stream --bandwidth 2000000
+"""
+import random
+import statistics
+import time
+from argparse import ArgumentParser
+
+import get_data
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+from html_extract import find_initial_state, find_og_images
+from transport import HostConfig, Transport
+
+
+def full_read(transport, url):
+    response = transport.get(url, headers=get_data.header_explore)
+    html_content = response.content.decode("utf-8")
+    return html_content, get_data.wire_bytes(response)
+
+
+def streamed_read(transport, url):
+    response = transport.get(url, headers=get_data.header_explore, stream=True)
+    return get_data.read_detail_page(response)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--notes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds of latency of the stand-in server.")
+    parser.add_argument("--bandwidth", type=float, default=2e6,
+                        help="Bytes per second of each response; 0 is unlimited.")
+    parser.add_argument("--http2", action="store_true", help="Read with httpx.")
+    cmd, _ = parser.parse_known_args()
+
+    server = ReplayServer(latency=cmd.latency, bandwidth=cmd.bandwidth).start()
+    transport = Transport(hosts={server.origin: HostConfig()}, http2=cmd.http2)
+    rng = random.Random(0)
+    id_list = [random_id(rng) for _ in range(cmd.notes)]
+    print(f"{'method':<10}{'KB/note':>10}{'p50 ms':>10}{'max ms':>10}{'total s':>10}")
+    for name, read in (("full", full_read), ("streamed", streamed_read)):
+        sizes = []
+        latencies = []
+        for id_ in id_list:
+            start = time.perf_counter()
+            html_content, n_bytes = read(transport, f"{server.origin}/explore/{id_}")
+            images = find_og_images(html_content)
+            note = find_initial_state(html_content)['note']['noteDetailMap'][id_]['note']
+            latencies.append(time.perf_counter() - start)
+            sizes.append(n_bytes)
+            assert images and note['noteId'] == id_, f"Wrong result of post {id_}."
+        print(f"{name:<10}{statistics.mean(sizes) / 1024:>10.1f}"
+              f"{statistics.median(latencies) * 1000:>10.1f}"
+              f"{max(latencies) * 1000:>10.1f}{sum(latencies):>10.2f}")
+    server.stop()
+    transport.close()
+
+
+if __name__ == '__main__':
+    main()
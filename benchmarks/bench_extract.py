@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of extracting "og:image" and window.__INITIAL_STATE__ from pages.
+Compare the raw text scanner (html_extract) with the BeautifulSoup based path.
+Run from the root folder of this program:
+    python -m benchmarks.bench_extract
+"""
+import json
+import re
+import timeit
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import ensure_fixtures
+from html_extract import find_initial_state, find_og_images
+from xhshow_contrib import extract_initial_state
+
+
+def legacy_detail_parse(html_content: str):
+    # The parsing of post detail page before html_extract.
+    tree = BeautifulSoup(html_content, "html.parser")
+    images = [
+        image.get('content')
+        for image in tree.find_all('meta', {'name': 'og:image'})
+    ]
+    initial_state_regex = re.compile("window.__INITIAL_STATE__")
+    script_tag = tree.find("script", string=initial_state_regex)
+    script_text = script_tag.text
+    script_text = re.sub("window.__INITIAL_STATE__=", "", script_text)
+    script_text = re.sub("undefined", "null", script_text)
+    return images, json.loads(script_text)
+
+
+def fast_detail_parse(html_content: str):
+    return find_og_images(html_content), find_initial_state(html_content)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    cmd, _ = parser.parse_known_args()
+
+    candidates = {
+        "bs4 detail": legacy_detail_parse,
+        "xhshow_contrib": extract_initial_state,
+        "html_extract": fast_detail_parse,
+    }
+    print(f"{'fixture':<45}{'KB':>7}" + ''.join(f"{name:>17}" for name in candidates))
+    for path in ensure_fixtures():
+        with open(path, encoding="utf-8") as f:
+            html_content = f.read()
+        images, state = fast_detail_parse(html_content)
+        assert state is not None, f"No initial state in {path}"
+        assert images == legacy_detail_parse(html_content)[0], \
+            f"og:image mismatch in {path}"
+        row = f"{path.rsplit('/', 1)[-1][:44]:<45}{len(html_content) / 1024:>7.0f}"
+        for name, parse in candidates.items():
+            seconds = min(timeit.repeat(lambda: parse(html_content), number=1,
+                                        repeat=cmd.repeat))
+            row += f"{seconds * 1000:>14.2f} ms"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
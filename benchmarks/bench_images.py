@@ -0,0 +1,55 @@
+"""
+Time of getting images of posts from the local stand-in server: downloading every time
+(as agents did before "get_images"), compared with the image store, first with an empty
+store and then again with the images stored. Several URLs share the same content, as
+covers and images of reposted posts do.
+Run from the root folder of this program:
+    python -m benchmarks.bench_images --images 100
+"""
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from benchmarks.replay_server import ReplayServer
+from image_store import ImageStore
+from transport import HostConfig, Transport
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds of latency of the stand-in server.")
+    parser.add_argument("--bandwidth", type=float, default=5e6,
+                        help="Bytes per second of each response; 0 is unlimited.")
+    parser.add_argument("--max_side", type=int, default=0)
+    cmd, _ = parser.parse_known_args()
+
+    server = ReplayServer(latency=cmd.latency, bandwidth=cmd.bandwidth).start()
+    transport = Transport(hosts={server.origin: HostConfig(pool_size=16)})
+    urls = [f"{server.origin}/images/{i}.png" for i in range(cmd.images)]
+    print(f"{'method':<16}{'seconds':>10}{'downloads':>11}")
+
+    start = time.perf_counter()
+    for url in urls:
+        transport.get(url).content
+    print(f"{'download':<16}{time.perf_counter() - start:>10.2f}{len(urls):>11}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = ImageStore(transport, directory=temp_dir, origins=[server.origin])
+        for name in ("store, empty", "store, stored"):
+            downloads = store.counters["downloads"]
+            start = time.perf_counter()
+            results = store.get_many(urls, cmd.max_side, include_data=True)
+            seconds = time.perf_counter() - start
+            assert all(result['status'] == "ok" for result in results)
+            print(f"{name:<16}{seconds:>10.2f}"
+                  f"{store.counters['downloads'] - downloads:>11}")
+        print(f"{store.stats()['entries']} files stored for {len(urls)} URLs.")
+        store.close()
+    server.stop()
+    transport.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Load test of the MCP server in streamable-http mode: several simulated MCP clients call
+"search" and "get_details" on one server process at the same time, against the local
+stand-in server. Reports p50 and p99 latency of each tool, the throughput, and the time
+of the graceful shutdown.
+Run from the root folder of this program:
+    python -m benchmarks.bench_load --clients 20 --calls 10
+"""
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from argparse import ArgumentParser
+
+import anyio
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from benchmarks.baseline import benchmarks_dir
+from benchmarks.bench_tools import benchmark_cookies
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+
+root_dir = os.path.dirname(benchmarks_dir)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(url: str, timeout: float = 30):
+    start = time.monotonic()
+    while time.monotonic() < start + timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise Exception(f"The MCP server isn't healthy at {url} within {timeout} seconds.")
+
+
+async def run_client(url: str, n_calls: int, batch: int, rng: random.Random,
+                     latencies: dict[str, list[float]], errors: list[str]):
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for _ in range(n_calls):
+                if rng.random() < 0.5:
+                    tool = "search"
+                    arguments = {"query": f"query {rng.random()}", "pages": 1,
+                                 "fields": ["id", "xsec_token", "title"]}
+                else:
+                    tool = "get_details"
+                    arguments = {"id_list": [random_id(rng) for _ in range(batch)],
+                                 "xsec_token_list": ["token"] * batch,
+                                 "fields": ["id", "status", "title"]}
+                start = time.perf_counter()
+                result = await session.call_tool(tool, arguments)
+                latencies[tool].append(time.perf_counter() - start)
+                if result.isError:
+                    errors.append(result.content[0].text)
+
+
+async def run_clients(url: str, n_clients: int, n_calls: int, batch: int):
+    latencies = {"search": [], "get_details": []}
+    errors = []
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for _ in range(n_clients):
+            tg.start_soon(run_client, url, n_calls, batch, random.Random(), latencies,
+                          errors)
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=10,
+                        help="Number of tool calls of each client, one after another.")
+    parser.add_argument("--batch", type=int, default=5,
+                        help="Number of posts in each \"get_details\" call.")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds of latency of the stand-in server.")
+    parser.add_argument("--max_concurrent_calls", type=int, default=16)
+    parser.add_argument("--throttled", action="store_true",
+                        help="Keep the rate limits; otherwise they are lifted so that "
+                             "the benchmark measures this program instead of the policy.")
+    cmd, _ = parser.parse_known_args()
+
+    replay = ReplayServer(latency=cmd.latency, jitter=cmd.latency).start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cookies_path = os.path.join(temp_dir, "cookies.json")
+        with open(cookies_path, "w") as f:
+            json.dump({"expirationDate": None, "cookies": benchmark_cookies}, f)
+        args = [sys.executable, "server.py", "--transport", "streamable-http",
+                "--port", str(port), "--origin", replay.origin,
+                "--cookies_path", cookies_path, "--cookies_dir", temp_dir,
+                "--max_concurrent_calls", str(cmd.max_concurrent_calls)]
+        if not cmd.throttled:
+            args += ["--html_rate", "1000", "--api_rate", "1000"]
+        log_path = os.path.join(temp_dir, "server.log")
+        with open(log_path, "w") as log:
+            server = subprocess.Popen(args, cwd=root_dir, stderr=log)
+        try:
+            wait_until_healthy(f"http://127.0.0.1:{port}/health")
+            latencies, errors, seconds = anyio.run(
+                run_clients, f"http://127.0.0.1:{port}/mcp", cmd.clients, cmd.calls,
+                cmd.batch)
+        except BaseException:
+            server.kill()
+            with open(log_path) as f:
+                print(f.read()[-3000:], file=sys.stderr)
+            raise
+        start = time.perf_counter()
+        server.send_signal(signal.SIGTERM if os.name != "nt" else signal.CTRL_C_EVENT)
+        server.wait(timeout=60)
+        shutdown_seconds = time.perf_counter() - start
+    replay.stop()
+
+    n_calls = sum(len(values) for values in latencies.values())
+    print(f"{'tool':<13}{'calls':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for tool, values in latencies.items():
+        if values:
+            print(f"{tool:<13}{len(values):>7}{statistics.median(values) * 1000:>10.0f}"
+                  f"{percentile(values, 0.99) * 1000:>10.0f}")
+    print(f"{cmd.clients} clients, {n_calls} calls in {seconds:.2f} s: "
+          f"{n_calls / seconds:.1f} calls/s, {len(errors)} errors; "
+          f"shutdown in {shutdown_seconds:.2f} s.")
+    for error in errors[:5]:
+        print(f"  {error[:200]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Payload size and encoding time of tool output: the previous "json.dumps" of all fields,
+compared with compact JSON (standard library and orjson), the "table" layout, and
+projection to a few fields. The posts are fetched from the local stand-in server by the
+same get_data calls as the tools.
+Run from the root folder of this program:
+    python -m benchmarks.bench_output
+"""
+import json
+import random
+import timeit
+from argparse import ArgumentParser
+
+import get_data
+import output
+import rate_limit
+from benchmarks.bench_tools import benchmark_cookies
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+from transport import HostConfig, Transport
+
+
+def fetch_posts(n_search_pages: int, n_details: int) -> dict[str, list[dict]]:
+    for policy in rate_limit.policies.values():
+        policy.update(rate=1000, burst=1000, jitter=0)
+    server = ReplayServer(latency=0, search_pages=n_search_pages).start()
+    get_data.www_origin = get_data.edith_origin = server.origin
+    transport = Transport(hosts={server.origin: HostConfig(pool_size=16)})
+    try:
+        rng = random.Random(0)
+        id_list = [random_id(rng) for _ in range(n_details)]
+        return {
+            "search": get_data.search_pages(transport, benchmark_cookies, "query",
+                                            n_search_pages),
+            "get_details": get_data.get_details_(transport, benchmark_cookies, id_list,
+                                                 ["token"] * n_details),
+        }
+    finally:
+        server.stop()
+        transport.close()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=10,
+                        help="Number of searching result pages (20 posts per page).")
+    parser.add_argument("--details", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    cmd, _ = parser.parse_known_args()
+
+    encoders = {"json.dumps": json.dumps,
+                "compact": lambda obj: json.dumps(obj, ensure_ascii=False,
+                                                  separators=(",", ":"))}
+    if output.orjson is not None:
+        encoders["orjson"] = output.dumps
+    fields = {"search": ["id", "xsec_token", "title"],
+              "get_details": ["id", "status", "title", "description", "labels"]}
+    print(f"{'tool':<13}{'posts':>6}  {'shape':<18}{'encoder':<12}{'KB':>9}{'ms':>9}")
+    for tool, posts in fetch_posts(cmd.pages, cmd.details).items():
+        shapes = {
+            "records": output.encode_posts(posts),
+            "table": output.encode_posts(posts, layout="table"),
+            "records, fields": output.encode_posts(posts, fields[tool]),
+            "table, fields": output.encode_posts(posts, fields[tool], "table"),
+        }
+        for shape, obj in shapes.items():
+            for name, encode in encoders.items():
+                if name == "json.dumps" and shape != "records":
+                    continue
+                size = len(encode(obj).encode("utf-8"))
+                seconds = min(timeit.repeat(lambda: encode(obj), number=1,
+                                            repeat=cmd.repeat))
+                print(f"{tool:<13}{len(posts):>6}  {shape:<18}{name:<12}"
+                      f"{size / 1024:>9.1f}{seconds * 1000:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
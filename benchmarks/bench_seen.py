@@ -0,0 +1,56 @@
+"""
+Size, time of lookup and of saving, and measured false positive rate of the seen filter
+of "unseen_only" as it grows, compared with a Python set of the same post IDs.
+Run from the root folder of this program:
+    python -m benchmarks.bench_seen --ids 1000000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from benchmarks.fixtures import random_id
+from seen_filter import SeenFilter, SeenStore
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--ids", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    cmd, _ = parser.parse_known_args()
+
+    rng = random.Random(0)
+    seen = SeenFilter()
+    temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+    store = SeenStore(os.path.join(temp_dir.name, "seen.sqlite"))
+    store.filters["default"] = seen
+    ids = set()
+    print(f"{'ids':>10}{'filter MB':>11}{'save ms':>9}{'set MB':>8}{'lookup us':>11}"
+          f"{'false pos %':>13}")
+    checkpoints = sorted({n for n in (10_000, 100_000, 1_000_000, cmd.ids) if n <= cmd.ids})
+    for n in checkpoints:
+        batch = [random_id(rng) for _ in range(n - len(ids))]
+        for i in range(0, len(batch), 1000):
+            seen.add_many(batch[i:i + 1000])
+        ids.update(batch)
+        unseen = [random_id(rng) for _ in range(cmd.lookups)]
+        start = time.perf_counter()
+        false_positives = sum(id_ in seen for id_ in unseen if id_ not in ids)
+        lookup = (time.perf_counter() - start) / cmd.lookups
+        # The set and its strings, as the IDs would be kept in memory without the filter.
+        set_bytes = sys.getsizeof(ids) + sum(sys.getsizeof(id_) for id_ in ids)
+        # Saving merges the filter with the saved one, as with several server processes.
+        start = time.perf_counter()
+        store.save("default")
+        save = time.perf_counter() - start
+        stats = seen.stats()
+        print(f"{len(ids):>10}{stats['bytes'] / 1e6:>11.2f}{save * 1e3:>9.1f}"
+              f"{set_bytes / 1e6:>8.1f}{lookup * 1e6:>11.1f}"
+              f"{false_positives / cmd.lookups * 100:>13.3f}")
+
+    temp_dir.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Startup time of the MCP server, as an MCP client launching it over stdio sees it: time
+until the "initialize" handshake completes, until "list_tools" responds, and until the
+first "get_feed" call responds (against the local stand-in server).
+Run from the root folder of this program:
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from benchmarks.baseline import benchmarks_dir, compare, load_baseline, save_baseline
+from benchmarks.bench_tools import benchmark_cookies
+from benchmarks.replay_server import ReplayServer
+
+root_dir = os.path.dirname(benchmarks_dir)
+
+
+async def measure_once(origin: str, cookies_path: str) -> dict:
+    parameters = StdioServerParameters(
+        command=sys.executable,
+        args=["server.py", "--origin", origin, "--cookies_path", cookies_path,
+              "--cookies_dir", os.path.dirname(cookies_path)],
+        cwd=root_dir,
+    )
+    timings = {}
+    start = time.perf_counter()
+    async with stdio_client(parameters) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            timings["initialize"] = time.perf_counter() - start
+            await session.list_tools()
+            timings["list_tools"] = time.perf_counter() - start
+            result = await session.call_tool("get_feed", {"pages": 1})
+            assert not result.isError, result.content[0].text
+            timings["first_tool_response"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save_baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    cmd, _ = parser.parse_known_args()
+
+    server = ReplayServer().start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cookies_path = os.path.join(temp_dir, "cookies.json")
+        with open(cookies_path, "w") as f:
+            json.dump({"expirationDate": None, "cookies": benchmark_cookies}, f)
+        runs = [anyio.run(measure_once, server.origin, cookies_path)
+                for _ in range(cmd.repeat)]
+    server.stop()
+
+    baseline = load_baseline("startup")
+    results = {}
+    regression = False
+    print(f"{'stage':<22}{'p50 ms':>10}{'max ms':>10}{'baseline':>10}")
+    for stage in runs[0]:
+        durations = [run[stage] for run in runs]
+        results[stage] = {"p50": statistics.median(durations), "max": max(durations)}
+        text, regression_ = compare(results[stage]["p50"],
+                                    baseline.get(stage, {}).get("p50"), cmd.tolerance)
+        regression |= regression_
+        print(f"{stage:<22}{results[stage]['p50'] * 1000:>10.0f}"
+              f"{results[stage]['max'] * 1000:>10.0f}{text}")
+    if cmd.save_baseline:
+        save_baseline("startup", results)
+    if regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
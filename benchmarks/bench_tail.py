@@ -0,0 +1,62 @@
+"""
+Tail latency of get_details batches when some detail pages are stragglers: without
+hedging or deadline (as before), with hedged requests, and with hedged requests and a
+deadline. The stand-in server delays a fraction of its responses by several seconds.
+Run from the root folder of this program:
+    python -m benchmarks.bench_tail --slow_rate 0.02 --deadline 1.5
+"""
+import random
+import statistics
+import time
+from argparse import ArgumentParser
+
+import get_data
+import rate_limit
+from benchmarks.bench_tools import benchmark_cookies
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+from transport import HostConfig, Transport
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds of latency of the stand-in server.")
+    parser.add_argument("--slow_rate", type=float, default=0.02)
+    parser.add_argument("--slow_seconds", type=float, default=3.0)
+    parser.add_argument("--deadline", type=float, default=1.5)
+    cmd, _ = parser.parse_known_args()
+
+    for policy in rate_limit.policies.values():
+        policy.update(rate=1000, burst=1000, jitter=0)
+    server = ReplayServer(latency=cmd.latency, jitter=cmd.latency,
+                          slow_rate=cmd.slow_rate, slow_seconds=cmd.slow_seconds).start()
+    get_data.www_origin = get_data.edith_origin = server.origin
+    transport = Transport(hosts={server.origin: HostConfig(pool_size=16)})
+    transport.warm_up(background=False)
+    rng = random.Random(0)
+    modes = {"plain": {"hedge": False}, "hedged": {"hedge": True},
+             "hedged, deadline": {"hedge": True, "deadline": cmd.deadline}}
+    print(f"{'mode':<18}{'p50 s':>8}{'p99 s':>8}{'max s':>8}{'ok %':>8}")
+    for name, kwargs in modes.items():
+        latencies = []
+        n_ok = 0
+        for _ in range(cmd.batches):
+            id_list = [random_id(rng) for _ in range(cmd.batch)]
+            start = time.perf_counter()
+            posts = get_data.get_details_(transport, benchmark_cookies, id_list,
+                                          ["token"] * cmd.batch, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            n_ok += sum(post["status"] == "ok" for post in posts)
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+        print(f"{name:<18}{statistics.median(latencies):>8.2f}{p99:>8.2f}"
+              f"{latencies[-1]:>8.2f}{n_ok / (cmd.batches * cmd.batch) * 100:>8.1f}")
+    server.stop()
+    transport.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+End-to-end benchmark of the tools "get_feed", "search", "search_many" and "get_details"
+against the local stand-in server (benchmarks/replay_server.py), at different page
+counts and batch sizes. Each scenario runs the same get_data calls and JSON encoding as
+the tool.
+
+Results are compared with the baseline saved by "--save_baseline"; a scenario whose
+median latency is slower than the baseline by more than "--tolerance" is reported as a
+regression, and the exit code is 1.
+Run from the root folder of this program:
+    python -m benchmarks.bench_tools --latency 0.05
+"""
+import random
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+import get_data
+import output
+from benchmarks.baseline import compare, load_baseline, save_baseline
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+import rate_limit
+from transport import HostConfig, Transport
+
+# Any values are accepted by the stand-in server, but signing needs these keys.
+benchmark_cookies = {"a1": "19a0b1c2d3e4f5a6b7c8d9e0f1a2b3c4d5e6f7a8", "webId": "0" * 32,
+                     "web_session": "0" * 40, "xsecappid": "xhs-pc-web"}
+
+
+def scenarios(transport):
+    rng = random.Random(0)
+    for pages in (1, 3, 5):
+        yield f"get_feed pages={pages}", lambda pages=pages: get_data.feed_pages(
+            transport, benchmark_cookies, pages)
+    for pages in (1, 3, 5):
+        yield f"search pages={pages}", lambda pages=pages: get_data.search_pages(
+            transport, benchmark_cookies, f"query {rng.random()}", pages)
+    for n_queries in (3, 10):
+        yield f"search_many queries={n_queries}", \
+            lambda n_queries=n_queries: get_data.search_many(
+                transport, benchmark_cookies,
+                [f"query {rng.random()}" for _ in range(n_queries)], 2)['merged']
+    for batch in (1, 10, 30):
+        def details(batch=batch):
+            id_list = [random_id(rng) for _ in range(batch)]
+            return get_data.get_details_(transport, benchmark_cookies, id_list,
+                                         ["token"] * batch)
+        yield f"get_details batch={batch}", details
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds of latency of the stand-in server.")
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--throttled", action="store_true",
+                        help="Keep the rate limits; otherwise they are lifted so that "
+                             "the benchmark measures this program instead of the policy.")
+    parser.add_argument("--save_baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    cmd, _ = parser.parse_known_args()
+
+    if not cmd.throttled:
+        for policy in rate_limit.policies.values():
+            policy.update(rate=1000, burst=1000, jitter=0)
+    server = ReplayServer(latency=cmd.latency, error_rate=cmd.error_rate).start()
+    get_data.www_origin = get_data.edith_origin = server.origin
+    transport = Transport(hosts={server.origin: HostConfig(pool_size=16)})
+    transport.warm_up(background=False)
+
+    baseline = load_baseline("tools")
+    results = {}
+    regressions = []
+    print(f"{'scenario':<26}{'p50 ms':>10}{'max ms':>10}{'items/s':>10}{'errors':>8}"
+          f"{'baseline':>10}")
+    for name, run in scenarios(transport):
+        latencies = []
+        items = 0
+        errors = 0
+        for _ in range(cmd.repeat):
+            start = time.perf_counter()
+            try:
+                posts = run()
+            except Exception:
+                errors += 1
+                posts = []
+            output.dumps(output.encode_posts(posts))
+            latencies.append(time.perf_counter() - start)
+            items += sum(post.get('status', 'ok') == 'ok' for post in posts)
+        p50 = statistics.median(latencies)
+        results[name] = {"p50": p50, "max": max(latencies),
+                         "throughput": items / sum(latencies), "errors": errors}
+        row = (f"{name:<26}{p50 * 1000:>10.1f}{max(latencies) * 1000:>10.1f}"
+               f"{results[name]['throughput']:>10.1f}{errors:>8}")
+        text, regression = compare(p50, baseline.get(name, {}).get("p50"), cmd.tolerance)
+        if regression:
+            regressions.append(name)
+        print(row + text)
+    server.stop()
+    transport.close()
+
+    if cmd.save_baseline:
+        save_baseline("tools", results)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
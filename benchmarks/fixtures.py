@@ -0,0 +1,249 @@
+"""
+Synthetic pages of xiaohongshu.com used by the benchmarks. They follow the layout of the
+real pages: a <head> with many meta tags and inline styles, the server-rendered
+window.__INITIAL_STATE__ script (a JavaScript object with "undefined" values and
+"\\u002F" escaped URLs), then the page markup and bundled scripts.
+
+Pages saved from the website can be put in "benchmarks/fixtures" as well; the benchmarks
+use every "*.html" file there.
+"""
+import json
+import os
+import random
+import string
+import struct
+import zlib
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+fixture_note_ids = ["68f1a2b3000000000700a1b2", "68f1a2b3000000000700c3d4",
+                    "68f1a2b3000000000700e5f6"]
+cjk = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+
+
+def random_text(rng: random.Random, n: int) -> str:
+    return ''.join(rng.choice(cjk) for _ in range(n))
+
+
+def random_id(rng: random.Random) -> str:
+    return ''.join(rng.choice("0123456789abcdef") for _ in range(24))
+
+
+def random_token(rng: random.Random) -> str:
+    return "AB" + ''.join(rng.choice(string.ascii_letters + string.digits + "-_")
+                          for _ in range(42)) + "="
+
+
+def image_url(rng: random.Random) -> str:
+    return (f"http://sns-webpic-qc.xhscdn.com/202510181200/{random_id(rng)}/"
+            f"1040g2sg31{random_id(rng)}!nd_dft_wlteh_webp_3")
+
+
+def png_image(seed: int = 0, width: int = 320, height: int = 240) -> bytes:
+    """
+    Valid PNG file of random colors, standing in for images of posts.
+    """
+    rng = random.Random(seed)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data)))
+
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def user(rng: random.Random) -> dict:
+    return {
+        "userId": random_id(rng),
+        "nickname": random_text(rng, 5),
+        "avatar": image_url(rng),
+        "xsecToken": random_token(rng),
+    }
+
+
+def note(rng: random.Random, id_: str) -> dict:
+    return {
+        "noteId": id_,
+        "type": "normal",
+        "title": random_text(rng, 18),
+        # Strings may contain braces, quotes and the word "undefined".
+        "desc": random_text(rng, 300) + " {undefined} \"引用\" " + random_text(rng, 200),
+        "time": 1700000000000 + rng.randrange(10 ** 10),
+        "lastUpdateTime": 1700000000000 + rng.randrange(10 ** 10),
+        "ipLocation": rng.choice(["上海", "北京", "广东", "浙江", "四川"]),
+        "user": user(rng),
+        "tagList": [{"id": random_id(rng), "name": random_text(rng, 4), "type": "topic"}
+                    for _ in range(rng.randrange(1, 8))],
+        "imageList": [{"urlDefault": image_url(rng), "urlPre": image_url(rng),
+                       "width": 1080, "height": 1440, "livePhoto": False,
+                       "fileId": None, "traceId": None}
+                      for _ in range(rng.randrange(1, 9))],
+        "interactInfo": {"liked": False, "likedCount": str(rng.randrange(10000)),
+                         "collected": False, "commentCount": str(rng.randrange(1000)),
+                         "shareCount": str(rng.randrange(100)), "relation": None},
+        "atUserList": [],
+        "shareInfo": {"unShare": False},
+        "video": None,
+    }
+
+
+def feed_item(rng: random.Random) -> dict:
+    return {
+        "id": random_id(rng),
+        "modelType": "note",
+        "xsecToken": random_token(rng),
+        "trackId": None,
+        "noteCard": {
+            "type": "normal",
+            "displayTitle": random_text(rng, 16),
+            "user": {"userId": random_id(rng), "nickName": random_text(rng, 5),
+                     "avatar": image_url(rng), "xsecToken": random_token(rng)},
+            "interactInfo": {"liked": False, "likedCount": str(rng.randrange(10000))},
+            "cover": {"urlDefault": image_url(rng), "urlPre": image_url(rng),
+                      "width": 1080, "height": 1440, "fileId": None, "url": None},
+        },
+    }
+
+
+def to_js(obj) -> str:
+    """
+    Serialize like the server-side renderer: None becomes undefined, "/" becomes \\u002F.
+    """
+    js = json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    return js.replace("null", "undefined").replace("/", "\\u002F")
+
+
+def page(rng: random.Random, state: dict, images: list[str]) -> str:
+    head = ['<!doctype html><html><head><meta charset="utf-8">',
+            '<title>小红书 - 你的生活指南</title>']
+    for i in range(30):
+        head.append(f'<meta name="meta-{i}" content="{random_text(rng, 20)}">')
+    for url in images:
+        head.append(f'<meta name="og:image" content="{url}">')
+    head.append('<style>' + ''.join(
+        f'.c{i}{{margin:{i}px;color:#{i % 999:03d}}}' for i in range(3000)) + '</style>')
+    head.append('</head>')
+    body = ['<body><div id="app">']
+    for i in range(200):
+        body.append(f'<div class="note-item c{i}"><span>{random_text(rng, 30)}</span></div>')
+    body.append('</div><script>window.__SSR__=true;var s={"a":{"b":1}}</script>')
+    body.append('<script>window.__INITIAL_STATE__=' + to_js(state) + '</script>')
+    for i in range(6):
+        bundle = ';'.join(f'function f{i}_{j}(a){{return a+"{random_text(rng, 10)}"}}'
+                          for j in range(1000))
+        body.append(f'<script>{bundle}</script>')
+    body.append('</body></html>')
+    return ''.join(head) + ''.join(body)
+
+
+def common_state(rng: random.Random) -> dict:
+    return {
+        "global": {"appSettings": {"notificationInterval": 30, "prefix": None},
+                   "serverTime": 1760760000000, "galaxy": None},
+        "user": {"loggedIn": True, "activeTab": None, "userInfo": user(rng),
+                 "follow": [], "notes": [[] for _ in range(4)]},
+        "search": {"keyword": "", "feeds": [], "history": [random_text(rng, 4)
+                                                          for _ in range(20)]},
+        "board": {"boardListData": {}, "isLoadingBoardList": False},
+    }
+
+
+def note_page(id_: str, seed: int = 0) -> str:
+    rng = random.Random(f"note-{id_}-{seed}")
+    state = common_state(rng)
+    state["note"] = {
+        "firstNoteId": id_,
+        "currentNoteId": id_,
+        "noteDetailMap": {id_: {"comments": {"list": [], "cursor": "", "hasMore": True},
+                                "currentTime": 1760760000000,
+                                "note": note(rng, id_)}},
+        "serverRequestInfo": {"state": "success", "errorCode": 0, "errMsg": None},
+    }
+    state["feed"] = {"feeds": [feed_item(rng) for _ in range(20)]}
+    images = [item["urlDefault"] for item in
+              state["note"]["noteDetailMap"][id_]["note"]["imageList"]]
+    return page(rng, state, images)
+
+
+def explore_page(seed: int = 0) -> str:
+    rng = random.Random(f"explore-{seed}")
+    state = common_state(rng)
+    state["note"] = {"noteDetailMap": {}, "serverRequestInfo": None}
+    state["feed"] = {"feeds": [feed_item(rng) for _ in range(39)], "isFetching": False,
+                     "currentChannel": "homefeed_recommend"}
+    return page(rng, state, [])
+
+
+def api_item(rng: random.Random) -> dict:
+    # The same as feed_item, in the snake case used by edith APIs.
+    return {
+        "id": random_id(rng),
+        "model_type": "note",
+        "xsec_token": random_token(rng),
+        "track_id": random_id(rng),
+        "note_card": {
+            "type": "normal",
+            "display_title": random_text(rng, 16),
+            "user": {"user_id": random_id(rng), "nick_name": random_text(rng, 5),
+                     "avatar": image_url(rng), "xsec_token": random_token(rng)},
+            "interact_info": {"liked": False, "liked_count": str(rng.randrange(10000))},
+            "cover": {"url_default": image_url(rng), "url_pre": image_url(rng),
+                      "width": 1080, "height": 1440},
+        },
+    }
+
+
+def homefeed_response(page: int, seed: int = 0) -> dict:
+    rng = random.Random(f"homefeed-{page}-{seed}")
+    return {
+        "code": 0,
+        "success": True,
+        "msg": "成功",
+        "data": {
+            "cursor_score": f"1.76076{page:07d}",
+            "items": [api_item(rng) for _ in range(15)],
+        },
+    }
+
+
+def search_response(keyword: str, page: int, last_page: int = 5, seed: int = 0) -> dict:
+    """
+    Args:
+        page: page number, starts from 1.
+        last_page: the last page that has results; later pages have no "items".
+    """
+    if page > last_page:
+        return {"code": 0, "success": True, "msg": "成功", "data": {"has_more": False}}
+    rng = random.Random(f"search-{keyword}-{page}-{seed}")
+    items = [api_item(rng) for _ in range(20)]
+    items.insert(rng.randrange(20), {"id": random_id(rng), "model_type": "hot_query",
+                                     "hot_query": {"queries": [random_text(rng, 4)]}})
+    return {
+        "code": 0,
+        "success": True,
+        "msg": "成功",
+        "data": {"has_more": page < last_page, "items": items},
+    }
+
+
+def ensure_fixtures() -> list[str]:
+    """
+    Write the synthetic pages to the fixtures folder if they don't exist.
+    Returns:
+        Paths of all HTML fixtures, including pages saved from the website.
+    """
+    os.makedirs(fixtures_dir, exist_ok=True)
+    synthetic = {"synthetic_explore.html": explore_page}
+    for id_ in fixture_note_ids:
+        synthetic[f"synthetic_note_{id_}.html"] = lambda id_=id_: note_page(id_)
+    for name, generate in synthetic.items():
+        path = os.path.join(fixtures_dir, name)
+        if not os.path.isfile(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate())
+    return sorted(
+        os.path.join(fixtures_dir, name) for name in os.listdir(fixtures_dir)
+        if name.endswith(".html")
+    )
@@ -0,0 +1,127 @@
+"""
+Baseline of bench_tools measured on the original program (commit 8bf78d4), saved as
+"benchmarks/baseline_tools.json", so that bench_tools compares later versions with it.
+The scenarios have the same names as in bench_tools and run what the original tools did:
+pages fetched one by one, and the details of posts one by one. "search_many" didn't exist,
+so it's measured as "search" of each query in turn. The original program only requests
+xiaohongshu.com, so its requests are redirected to the local stand-in server.
+Run from the root folder of this program:
+    git worktree add ../original 8bf78d4
+    python -m benchmarks.original_baseline --original_dir ../original
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+
+import requests
+
+from benchmarks.baseline import save_baseline
+from benchmarks.fixtures import random_id
+from benchmarks.replay_server import ReplayServer
+
+# Same as bench_tools.benchmark_cookies, which can't be imported with the original get_data.
+benchmark_cookies = {"a1": "19a0b1c2d3e4f5a6b7c8d9e0f1a2b3c4d5e6f7a8", "webId": "0" * 32,
+                     "web_session": "0" * 40, "xsecappid": "xhs-pc-web"}
+origins = ("https://www.xiaohongshu.com", "https://edith.xiaohongshu.com")
+
+
+class RedirectSession(requests.Session):
+    def __init__(self, origin: str):
+        super().__init__()
+        self.origin = origin
+
+    def request(self, method, url, *args, **kwargs):
+        for origin in origins:
+            if url.startswith(origin):
+                url = self.origin + url[len(origin):]
+        return super().request(method, url, *args, **kwargs)
+
+
+def scenarios(get_data, origin):
+    # The original tools create a session in each call.
+    def get_feed(pages):
+        session = RedirectSession(origin)
+        posts = get_data.feed_first_page(session, benchmark_cookies)
+        cursor_score = ""
+        for page in range(1, pages):
+            new_posts, cursor_score = get_data.feed_subsequent_page(
+                session, benchmark_cookies, len(posts) - 1, page, cursor_score)
+            posts += new_posts
+        return posts
+
+    def search(query, pages):
+        session = RedirectSession(origin)
+        posts = []
+        for page in range(pages):
+            new_posts, has_more = get_data.search_page(session, benchmark_cookies, query,
+                                                       page)
+            posts += new_posts
+            if not has_more:
+                break
+        return posts
+
+    rng = random.Random(0)
+    for pages in (1, 3, 5):
+        yield f"get_feed pages={pages}", lambda pages=pages: get_feed(pages)
+    for pages in (1, 3, 5):
+        yield f"search pages={pages}", lambda pages=pages: search(f"query {rng.random()}",
+                                                                   pages)
+    for n_queries in (3, 10):
+        yield f"search_many queries={n_queries}", lambda n_queries=n_queries: [
+            post for _ in range(n_queries) for post in search(f"query {rng.random()}", 2)]
+    for batch in (1, 10, 30):
+        def details(batch=batch):
+            id_list = [random_id(rng) for _ in range(batch)]
+            return get_data.get_details_(RedirectSession(origin), benchmark_cookies,
+                                         id_list, ["token"] * batch)
+        yield f"get_details batch={batch}", details
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--original_dir", required=True,
+                        help="Folder of the original program, such as a git worktree.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds of latency of the stand-in server.")
+    cmd, _ = parser.parse_known_args()
+
+    # The original get_data reads "headers" relative to the working folder.
+    cwd = os.getcwd()
+    os.chdir(cmd.original_dir)
+    sys.path.insert(0, os.path.abspath("."))
+    import get_data
+    os.chdir(cwd)
+
+    server = ReplayServer(latency=cmd.latency).start()
+    results = {}
+    print(f"{'scenario':<26}{'p50 ms':>10}{'max ms':>10}{'items/s':>10}{'errors':>8}")
+    for name, run in scenarios(get_data, server.origin):
+        latencies = []
+        items = 0
+        errors = 0
+        for _ in range(cmd.repeat):
+            start = time.perf_counter()
+            try:
+                posts = run()
+            except Exception:
+                errors += 1
+                posts = []
+            json.dumps(posts)
+            latencies.append(time.perf_counter() - start)
+            items += len(posts)
+        p50 = statistics.median(latencies)
+        results[name] = {"p50": p50, "max": max(latencies),
+                         "throughput": items / sum(latencies), "errors": errors}
+        print(f"{name:<26}{p50 * 1000:>10.1f}{max(latencies) * 1000:>10.1f}"
+              f"{results[name]['throughput']:>10.1f}{errors:>8}")
+    server.stop()
+    save_baseline("tools", results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Local stand-in of xiaohongshu.com for offline testing and benchmarks. It replays
+recorded responses of the endpoints used by get_data, with configurable latency and
+error injection.
+
+Recorded responses are read from "benchmarks/fixtures":
+    explore.html: home page
+    note_*.html: post detail pages; the post ID in the page is replaced with the
+    requested one, so any ID can be requested.
+    homefeed.json: response of /api/sns/web/v1/homefeed
+    search_notes.json: response of /api/sns/web/v1/search/notes
+Missing ones are replaced by synthetic responses (benchmarks/fixtures.py). Any path under
+/images/ returns one of a few synthetic PNG images, standing in for the image CDN.
+
+Run from the root folder of this program:
+    python -m benchmarks.replay_server --port 8765 --latency 0.2 --error_rate 0.05
+Then start the MCP server with "--origin http://127.0.0.1:8765".
+"""
+import glob
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from benchmarks.fixtures import (ensure_fixtures, fixtures_dir, homefeed_response,
+                                 png_image, search_response)
+
+
+def load_recordings() -> dict:
+    ensure_fixtures()
+
+    def read(pattern):
+        paths = sorted(glob.glob(os.path.join(fixtures_dir, pattern)))
+        recorded = [path for path in paths
+                    if not os.path.basename(path).startswith("synthetic_")]
+        result = []
+        for path in recorded or paths:
+            with open(path, encoding="utf-8") as f:
+                result.append(f.read())
+        return result
+
+    notes = []
+    for html_content in read("*note_*.html"):
+        match = re.search(r'"noteDetailMap":\{"([0-9a-f]+)"', html_content)
+        if match:
+            notes.append((match.group(1), html_content))
+    homefeed = read("homefeed.json")
+    search_notes = read("search_notes.json")
+    return {
+        "explore": read("*explore.html")[0],
+        "notes": notes,
+        "homefeed": json.loads(homefeed[0]) if homefeed else None,
+        "search_notes": json.loads(search_notes[0]) if search_notes else None,
+    }
+
+
+class HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients may close the connection without reading the whole response.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class ReplayServer:
+    """
+    Args:
+        port: listening port; 0 means a random free port.
+        latency: seconds added to each response.
+        jitter: random extra seconds added to each response, uniformly from 0 to this.
+        error_rate: probability that a request fails. Pages fail with status code 500;
+        APIs fail with status code 500 or {"success": false} equally.
+        search_pages: number of searching result pages that have results.
+        bandwidth: bytes per second of each response body; 0 means unlimited.
+        slow_rate: probability that a response is a straggler, delayed by "slow_seconds"
+        more.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, search_pages: int = 5,
+                 bandwidth: float = 0, slow_rate: float = 0.0, slow_seconds: float = 2.0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.bandwidth = bandwidth
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.search_pages = search_pages
+        self.recordings = load_recordings()
+        self.images = [png_image(seed) for seed in range(8)]
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.httpd = HTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def origin(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _delay_and_fail(self) -> str | None:
+        slow = self.slow_seconds if random.random() < self.slow_rate else 0
+        time.sleep(self.latency + random.uniform(0, self.jitter) + slow)
+        with self._lock:
+            self.requests += 1
+            if random.random() >= self.error_rate:
+                return None
+            self.errors += 1
+        return random.choice(["status", "success"])
+
+    def note_page(self, id_: str) -> str:
+        if not self.recordings["notes"]:
+            raise KeyError("No recorded post detail page.")
+        recorded_id, html_content = self.recordings["notes"][
+            hash(id_) % len(self.recordings["notes"])]
+        return html_content.replace(recorded_id, id_)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send(self, status: int, body: str | bytes, content_type: str):
+                data = body if isinstance(body, bytes) else body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                if self.command == "HEAD":
+                    return
+                chunk_size = 16 * 1024 if server.bandwidth else len(data) or 1
+                try:
+                    for i in range(0, len(data), chunk_size):
+                        self.wfile.write(data[i:i + chunk_size])
+                        if server.bandwidth:
+                            self.wfile.flush()
+                            time.sleep(min(chunk_size, len(data) - i) / server.bandwidth)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stops reading early.
+                    self.close_connection = True
+
+            def do_HEAD(self):
+                self.send(200, "", "text/html; charset=utf-8")
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                failure = server._delay_and_fail()
+                if failure:
+                    self.send(500, "Injected error.", "text/plain")
+                elif path == "/explore":
+                    self.send(200, server.recordings["explore"], "text/html; charset=utf-8")
+                elif path.startswith("/explore/"):
+                    self.send(200, server.note_page(path.rsplit("/", 1)[-1]),
+                              "text/html; charset=utf-8")
+                elif path.startswith("/images/"):
+                    self.send(200, server.images[hash(path) % len(server.images)],
+                              "image/png")
+                else:
+                    self.send(404, "Not found.", "text/plain")
+
+            def do_POST(self):
+                path = urlsplit(self.path).path
+                length = int(self.headers.get("content-length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                failure = server._delay_and_fail()
+                if path == "/api/sns/web/v1/homefeed":
+                    response = server.recordings["homefeed"] or homefeed_response(
+                        payload.get("note_index", 0))
+                elif path == "/api/sns/web/v1/search/notes":
+                    response = server.recordings["search_notes"] or search_response(
+                        payload.get("keyword", ""), payload.get("page", 1),
+                        last_page=server.search_pages)
+                else:
+                    self.send(404, "Not found.", "text/plain")
+                    return
+                if failure == "status":
+                    self.send(500, "Injected error.", "text/plain")
+                    return
+                if failure == "success":
+                    response = {"code": -1, "success": False, "msg": "Injected error."}
+                self.send(200, json.dumps(response, ensure_ascii=False),
+                          "application/json; charset=utf-8")
+
+        return Handler
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--search_pages", type=int, default=5)
+    parser.add_argument("--bandwidth", type=float, default=0,
+                        help="Bytes per second of each response body; 0 is unlimited.")
+    parser.add_argument("--slow_rate", type=float, default=0.0)
+    parser.add_argument("--slow_seconds", type=float, default=2.0)
+    cmd, _ = parser.parse_known_args()
+
+    server = ReplayServer(cmd.host, cmd.port, cmd.latency, cmd.jitter, cmd.error_rate,
+                          cmd.search_pages, cmd.bandwidth, cmd.slow_rate, cmd.slow_seconds)
+    print(f"Replaying xiaohongshu.com at {server.origin}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
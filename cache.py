@@ -0,0 +1,208 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from database import connect
+
+detail_cache_path = "raw/cache.sqlite"
+
+
+class DetailCache:
+    """
+    On-disk cache of post details (the dictionaries made by get_data.get_detail), keyed
+    by post ID. SQLite in WAL mode lets several server processes read and write the same
+    file. Each thread has its own connection.
+    Args:
+        path: path of the SQLite database.
+        ttl: seconds that a post stays valid after being fetched.
+        max_bytes: when the total size of cached posts exceeds this value, the least
+        recently used posts are evicted until it's 90% of this value.
+        expire_interval: number of puts between removals of expired posts. Expired posts
+        are never returned, so they only need to be removed once in a while.
+    """
+    def __init__(self, path: str = detail_cache_path, ttl: float = 86400,
+                 max_bytes: int = 256 * 1024 * 1024, expire_interval: int = 1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.expire_interval = expire_interval
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS detail (
+                id TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS detail_accessed_at ON detail (accessed_at);
+            CREATE INDEX IF NOT EXISTS detail_fetched_at ON detail (fetched_at);
+            BEGIN IMMEDIATE;
+            -- Total size of the posts, kept by triggers, so that putting a post doesn't
+            -- sum the sizes of all posts.
+            CREATE TABLE IF NOT EXISTS detail_size (total INTEGER NOT NULL);
+            INSERT INTO detail_size SELECT COALESCE(SUM(size), 0) FROM detail
+            WHERE NOT EXISTS (SELECT 1 FROM detail_size);
+            CREATE TRIGGER IF NOT EXISTS detail_insert AFTER INSERT ON detail BEGIN
+                UPDATE detail_size SET total = total + new.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS detail_delete AFTER DELETE ON detail BEGIN
+                UPDATE detail_size SET total = total - old.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS detail_update AFTER UPDATE OF size ON detail BEGIN
+                UPDATE detail_size SET total = total + new.size - old.size;
+            END;
+            COMMIT;
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def get(self, id_: str) -> dict | None:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, fetched_at FROM detail WHERE id = ?", (id_,)
+        ).fetchone()
+        now = time.time()
+        if row is None or row[1] + self.ttl < now:
+            self._count("misses")
+            metrics.count("cache_misses", "detail")
+            return None
+        conn.execute("UPDATE detail SET accessed_at = ? WHERE id = ?", (now, id_))
+        self._count("hits")
+        metrics.count("cache_hits", "detail")
+        return json.loads(row[0])
+
+    def contains(self, id_: str) -> bool:
+        """
+        Whether the post is cached and valid, without counting as a hit or miss.
+        """
+        row = self._connect().execute(
+            "SELECT fetched_at FROM detail WHERE id = ?", (id_,)
+        ).fetchone()
+        return row is not None and row[0] + self.ttl >= time.time()
+
+    def put(self, id_: str, post: dict):
+        value = json.dumps(post, ensure_ascii=False)
+        now = time.time()
+        conn = self._connect()
+        # An upsert instead of "INSERT OR REPLACE", whose deletion doesn't run the
+        # triggers of the total size.
+        conn.execute(
+            "INSERT INTO detail (id, value, size, fetched_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET value = excluded.value, "
+            "size = excluded.size, fetched_at = excluded.fetched_at, "
+            "accessed_at = excluded.accessed_at",
+            (id_, value, len(value), now, now),
+        )
+        with self._lock:
+            self._puts += 1
+            expire = self._puts % self.expire_interval == 0
+        if expire or self._total_size(conn) > self.max_bytes:
+            self._evict(conn, now)
+
+    @staticmethod
+    def _total_size(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM detail_size").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "DELETE FROM detail WHERE fetched_at < ?", (now - self.ttl,)
+            ).rowcount
+            total_size = self._total_size(conn)
+            evicted = 0
+            # Evict a bit more than needed, so that the next puts don't evict again.
+            target = self.max_bytes * 0.9
+            while total_size > target and (evicted or total_size > self.max_bytes):
+                rows = conn.execute(
+                    "SELECT id, size FROM detail ORDER BY accessed_at LIMIT 100").fetchall()
+                if not rows:
+                    break
+                for id_, size in rows:
+                    conn.execute("DELETE FROM detail WHERE id = ?", (id_,))
+                    evicted += 1
+                    total_size -= size
+                    if total_size <= target:
+                        break
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if expired + evicted:
+            logging.info(f"Detail cache evicts {expired} expired and {evicted} least "
+                         f"recently used posts.")
+            self._count("evictions", expired + evicted)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM detail").fetchone()[0]
+        total_size = self._total_size(conn)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+
+class MemoryCache:
+    """
+    Short-lived cache in the memory of this server process, such as for searching result
+    pages, which change quickly but are often requested again within a minute.
+    Args:
+        ttl: seconds that an entry stays valid.
+        max_entries: when exceeded, the oldest entries are evicted.
+    """
+    def __init__(self, ttl: float = 60, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (stored_at, value)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] + self.ttl < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic(), value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "ttl": self.ttl,
+            }
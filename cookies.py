@@ -1,38 +1,95 @@
+import csv
 import json
 import os
 import time
 from argparse import ArgumentParser
 
-import pandas as pd
-
+cookies_path = "raw/cookies.json"
+# Each file in this folder is the cookies of one account, made by dump_cookies or exported
+# from the browser.
+cookies_dir = "raw/cookies"
+# Format of older versions, still readable.
 cookies_csv_path = "raw/cookies.csv"
 
 
-def dump_cookies(cookies_path):
-    with open(cookies_path) as f:
-        raw_cookies = json.load(f)
-    cookies = pd.DataFrame(raw_cookies['cookies'])
-    cookies.to_csv(cookies_csv_path, index=False)
+def dump_cookies(input_path, output_path=cookies_path):
+    """
+    Convert the cookies exported from the browser (format: cookies_schema.json) to the
+    cookie store of this program: a JSON object with the expiry time of the earliest
+    expiring cookie and the name-value pairs.
+    """
+    cookies, expiration_date = read_cookies_file(input_path)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump({"expirationDate": expiration_date, "cookies": cookies}, f)
+
+
+def read_cookies_file(path):
+    """
+    Read a cookies file, either made by dump_cookies or exported from the browser
+    (format: cookies_schema.json).
+    Returns:
+        (name-value pairs of cookies, expiry time of the earliest expiring cookie or None)
+    """
+    with open(path) as f:
+        store = json.load(f)
+    if isinstance(store['cookies'], list):
+        expiration_date = min(
+            (cookie['expirationDate'] for cookie in store['cookies']
+             if 'expirationDate' in cookie),
+            default=None,
+        )
+        return {cookie['name']: cookie['value'] for cookie in store['cookies']}, \
+            expiration_date
+    return store['cookies'], store['expirationDate']
+
 
+def is_expired(expiration_date):
+    return expiration_date is not None and time.time() > expiration_date + 86400
 
-def load_cookies():
-    if not os.path.isfile(cookies_csv_path):
+
+def read_cookies(path=cookies_path):
+    """
+    Read the cookie store of this program, or the CSV file of older versions if the store
+    at the default path doesn't exist.
+    Returns:
+        (name-value pairs of cookies, expiry time of the earliest expiring cookie or None)
+    """
+    if os.path.isfile(path):
+        cookies, expiration_date = read_cookies_file(path)
+    elif path == cookies_path and os.path.isfile(cookies_csv_path):
+        with open(cookies_csv_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        expiration_date = min(
+            (float(row['expirationDate']) for row in rows if row.get('expirationDate')),
+            default=None,
+        )
+        cookies = {row['name']: row['value'] for row in rows}
+    else:
         raise Exception("Cookies file doesn't exist.")
-    cookies = pd.read_csv(cookies_csv_path)
-    expiry_datetime = cookies['expirationDate'].min() + 86400
-    if time.time() > expiry_datetime:
+    return cookies, expiration_date
+
+
+def load_cookies(path=cookies_path):
+    cookies, expiration_date = read_cookies(path)
+    if is_expired(expiration_date):
         raise Exception("Cookies expired. ")
-    cookies = {row['name']: row['value'] for _, row in cookies.iterrows()}
     return cookies
 
 
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument("--input_path", required=True)
+    parser.add_argument("--account", default="",
+                        help="Save as an additional account with this name, so that the "
+                             "server spreads requests over all accounts.")
     cmd, _ = parser.parse_known_args()
 
     try:
-        dump_cookies(cmd.input_path)
+        if cmd.account:
+            dump_cookies(cmd.input_path, os.path.join(cookies_dir, f"{cmd.account}.json"))
+        else:
+            dump_cookies(cmd.input_path)
     except FileNotFoundError:
         raise Exception(
             f"Cookies file not found at {cmd.input_path}")
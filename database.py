@@ -0,0 +1,29 @@
+"""
+Connections to the local SQLite databases (caches, index, job queue). Every database is
+opened the same way: WAL mode, so that several threads and server processes can read
+while one writes, and one connection per thread and database, because a connection
+can't be shared by threads.
+"""
+import sqlite3
+import threading
+
+# Seconds that a statement waits for the write lock held by another connection.
+busy_timeout = 30
+_local = threading.local()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Connection of this thread to the database at "path", in autocommit mode; use
+    "BEGIN IMMEDIATE" for transactions.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+    return conn
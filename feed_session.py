@@ -0,0 +1,97 @@
+"""
+Resumable crawl of the home feed. A feed session keeps the cursor of the website and the
+IDs of posts already returned, so that "get_feed" can continue from where the previous
+call stopped instead of fetching the home page again.
+"""
+import json
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+
+from database import connect
+
+feed_sessions_path = "raw/feed_sessions.sqlite"
+
+
+@dataclass
+class FeedState:
+    handle: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # Number of pages fetched, including the home page.
+    page: int = 0
+    cursor_score: str = ""
+    # Index of the last post delivered by the website, counted from 0.
+    note_index: int = -1
+    seen_ids: list[str] = field(default_factory=list)
+    # Name of the account whose home feed is crawled; the cursor is only valid for it.
+    account: str = ""
+    updated_at: float = field(default_factory=time.time)
+
+
+class FeedSessionStore:
+    """
+    Feed sessions persisted in SQLite, one row per session, so that they survive
+    restarts of the server, and server processes sharing the file don't overwrite each
+    other's sessions. Saving a session writes only its row.
+    Args:
+        path: path of the SQLite database.
+        ttl: seconds that an unused session is kept. The website's cursor becomes stale
+        after a while.
+        max_sessions: maximum number of sessions; the least recently used ones are removed.
+        max_seen: maximum number of post IDs remembered by each session.
+    """
+    def __init__(self, path: str = feed_sessions_path, ttl: float = 86400,
+                 max_sessions: int = 100, max_seen: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_seen = max_seen
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS feed_session (
+                handle TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS feed_session_updated_at
+            ON feed_session (updated_at);
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def get(self, handle: str) -> FeedState | None:
+        row = self._connect().execute(
+            "SELECT state FROM feed_session WHERE handle = ? AND updated_at >= ?",
+            (handle, time.time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+        try:
+            return FeedState(**json.loads(row[0]))
+        except (ValueError, TypeError):
+            return None
+
+    def create(self) -> FeedState:
+        return FeedState()
+
+    def save(self, state: FeedState):
+        state.updated_at = time.time()
+        if len(state.seen_ids) > self.max_seen:
+            del state.seen_ids[:len(state.seen_ids) - self.max_seen]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO feed_session (handle, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (handle) DO UPDATE SET state = excluded.state, "
+                "updated_at = excluded.updated_at",
+                (state.handle, json.dumps(asdict(state)), state.updated_at))
+            conn.execute("DELETE FROM feed_session WHERE updated_at < ?",
+                         (state.updated_at - self.ttl,))
+            conn.execute(
+                "DELETE FROM feed_session WHERE updated_at < (SELECT updated_at FROM "
+                "feed_session ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_sessions - 1,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
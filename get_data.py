@@ -1,14 +1,27 @@
 import json
 import logging
 import random
-import re
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from functools import partial
 
-import pandas as pd
-from bs4 import BeautifulSoup
-from xhshow import Xhshow, SessionManager, CryptoConfig
+from httpx import TransportError
 
-from xhshow_contrib import extract_initial_state, search_id
+import metrics
+from accounts import get_account, rejected_api_codes, rejected_status_codes
+from feed_session import FeedState
+from html_extract import InitialStateScanner, find_initial_state, find_og_images
+from retry import LatencyTracker, RetryBudget
+from singleflight import SingleFlight
+from xhshow_contrib import search_id
+
+# Origins of the website. They can be pointed to a local stand-in server, such as
+# benchmarks/replay_server.py, for offline testing.
+www_origin = "https://www.xiaohongshu.com"
+edith_origin = "https://edith.xiaohongshu.com"
 
 with open("headers/explore.json", "r") as f:
     header_explore = json.load(f)
@@ -21,31 +34,268 @@ with open("headers/search.json", "r") as f:
 assert header_explore['user-agent'] == header_homefeed['user-agent'] == header_search ['user-agent'], \
     ("Source code check fails, because user agent of explore & homefeed & search header are "
      "not unified.")
-client_config = CryptoConfig().with_overrides(
-    PUBLIC_USERAGENT=header_explore['user-agent']
-)
-client = Xhshow(config=client_config)
-# Intermediate constant may be generated
-xhs_session = SessionManager()
+# China Standard Time, no daylight saving.
+timezone_shanghai = timezone(timedelta(hours=8))
+# Chunk size of reading post detail pages.
+detail_chunk_size = 16 * 1024
+# After the useful part of a post detail page, read at most this number of bytes to reach
+# the end of the page. Then the connection can be reused; otherwise it's closed, which is
+# cheaper than downloading a long tail (and free with HTTP/2).
+detail_drain_limit = 64 * 1024
+# Status codes of temporary failures, which are retried.
+retryable_status_codes = {429, 500, 502, 503, 504}
+# Number of attempts of each request, and seconds of waiting before the first retry,
+# doubled before each following retry.
+max_attempts = 3
+retry_backoff = 0.5
+retry_budget = RetryBudget()
+# A post detail taking longer than this percentile of recent ones is requested again.
+hedge_percentile = 0.95
+detail_latency = LatencyTracker()
+signer = None
+signer_lock = threading.Lock()
+
+
+def get_signer(cookies=None):
+    """
+    Create the xhshow client and session at the first request instead of at import time,
+    so that the MCP server starts faster. The client is shared, and each account has its
+    own session.
+    Returns:
+        (xhshow.Xhshow, xhshow.SessionManager)
+    """
+    global signer
+    with signer_lock:
+        if signer is None:
+            from xhshow import Xhshow, SessionManager, CryptoConfig
+
+            client_config = CryptoConfig().with_overrides(
+                PUBLIC_USERAGENT=header_explore['user-agent']
+            )
+            # Intermediate constant may be generated in the session.
+            signer = Xhshow(config=client_config), SessionManager()
+        if cookies is None:
+            return signer
+        account = get_account(cookies)
+        if account.xhs_session is None:
+            from xhshow import SessionManager
+
+            account.xhs_session = SessionManager()
+        return signer[0], account.xhs_session
+
+
+def pick_cookies(cookies, kind):
+    """
+    Args:
+        cookies: name-value pairs of cookies, or accounts.AccountPool to choose the
+        account with the most rate budget for the class of endpoints ("html" or "api").
+    Returns:
+        name-value pairs of cookies
+    """
+    if isinstance(cookies, dict):
+        return cookies
+    return cookies.pick(kind).cookies
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RequestFailed(Exception):
+    """
+    The website returns an error status code, or an API returns "success": false.
+    Args:
+        retryable: whether the failure is temporary.
+        rejected: whether the website rejects the account; another account may succeed.
+    """
+    def __init__(self, message, status_code=None, retryable=False, rejected=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.rejected = rejected
+
+
+def check_status(response, message):
+    if response.status_code != 200:
+        raise RequestFailed(
+            f"{message} Status code: {response.status_code}.", response.status_code,
+            retryable=response.status_code in retryable_status_codes,
+            rejected=response.status_code in rejected_status_codes)
+
+
+def check_success(response_json, message):
+    if response_json.get('success') != True:
+        rejected = response_json.get('code') in rejected_api_codes
+        raise RequestFailed(f"{message} Website's message: {response_json.get('msg')}.",
+                            200, retryable=not rejected, rejected=rejected)
+
+
+def with_retries(func, cookies, cancel=None):
+    """
+    Call "func" without arguments, and retry temporary failures (network errors, status
+    codes in "retryable_status_codes", and "success": false) with exponential backoff,
+    within the retry budget. Rejections by the website are retried only with
+    accounts.AccountPool, which chooses another account.
+    """
+    retry_budget.deposit()
+    attempt = 1
+    while True:
+        try:
+            return func()
+        except (RequestFailed, OSError, TransportError) as e:
+            retryable = not isinstance(e, RequestFailed) or e.retryable or \
+                (e.rejected and not isinstance(cookies, dict))
+            if not retryable or attempt >= max_attempts or not retry_budget.try_spend():
+                raise
+            delay = retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logging.warning(f"Retry in {delay:.1f} seconds, because {type(e).__name__}: "
+                            f"{e}")
+            metrics.count("retries")
+        attempt += 1
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise Cancelled("The tool call is cancelled.")
+
+
+def wait_result(future, cancel=None, deadline_at=None):
+    """
+    Wait for the result of the future.
+    Args:
+        cancel: threading.Event which is set when the tool call is cancelled, or None.
+        deadline_at: time.monotonic() when to stop waiting, or None.
+    Raises:
+        Cancelled: if "cancel" is set.
+        TimeoutError: if the deadline passes.
+    """
+    while True:
+        timeout = 0.1 if deadline_at is None else min(0.1, deadline_at - time.monotonic())
+        if timeout <= 0:
+            raise TimeoutError("Deadline exceeded.")
+        done, _ = wait([future], timeout=timeout)
+        if done:
+            return future.result()
+        if cancel is not None and cancel.is_set():
+            raise Cancelled("The tool call is cancelled.")
+
+
+# Identical requests in flight are sent once (see singleflight.py).
+flights = SingleFlight(Cancelled)
+
+
+def account_key(cookies):
+    """
+    Account part of coalescing and cache keys. Requests through accounts.AccountPool can
+    be sent by any account, so they share one key.
+    """
+    return get_account(cookies).name if isinstance(cookies, dict) else "pool"
+
+
+def wait_for_rate_limit(cookies, kind, cancel=None, low_priority=False):
+    """
+    Wait until the account's rate limiter of the class of endpoints ("html" or "api")
+    allows the next request.
+    Args:
+        cookies: name-value pairs of cookies of the account.
+        kind: class of endpoints.
+        cancel: threading.Event which is set when the tool call is cancelled, or None.
+        Raise Cancelled instead of sending the request if it's set.
+        low_priority: only use the spare rate budget, which is not needed by tool calls.
+    """
+    with metrics.span("wait", kind):
+        wait_for_rate_limit_(get_account(cookies).limiters[kind], cancel, low_priority)
+
+
+def wait_for_rate_limit_(limiter, cancel, low_priority):
+    if low_priority:
+        while True:
+            granted, delay = limiter.reserve_spare()
+            if granted:
+                break
+            if cancel is None:
+                time.sleep(delay)
+            elif cancel.wait(delay):
+                raise Cancelled("The tool call is cancelled.")
+    else:
+        delay = limiter.reserve()
+    if cancel is None:
+        time.sleep(delay)
+    elif cancel.wait(delay):
+        raise Cancelled("The tool call is cancelled.")
+
+
+def wire_bytes(response) -> int:
+    """
+    Number of bytes of the body received from the network, before decompression, and
+    only the part read of a streamed response.
+    """
+    if hasattr(response, "num_bytes_downloaded"):  # httpx
+        return response.num_bytes_downloaded
+    return response.raw.tell()  # requests
+
+
+def record_response(endpoint, response):
+    metrics.count("pages_fetched", endpoint)
+    metrics.count("bytes_downloaded", endpoint, wire_bytes(response))
+
+
+def report_html_response(cookies, response):
+    """
+    Report to the account whether the response of an HTML page is healthy.
+    """
+    get_account(cookies).report(
+        'html', response.status_code == 200,
+        rejected=response.status_code in rejected_status_codes)
+
+
+def parse_api_response(cookies, response):
+    """
+    Parse the JSON body of an edith API response, and report to the account whether the
+    response is healthy.
+    """
+    try:
+        response_json = response.json()
+    except ValueError:
+        response_json = {}
+    get_account(cookies).report(
+        'api', response.status_code == 200 and response_json.get('success') == True,
+        rejected=response.status_code in rejected_status_codes or
+                 response_json.get('code') in rejected_api_codes)
+    return response_json
 
 
-def feed_first_page(session, cookies):
+def feed_first_page(session, cookies, cancel=None):
+    return flights.do(("explore", account_key(cookies)), lambda: with_retries(
+        lambda: feed_first_page_(session, cookies, cancel), cookies, cancel), cancel)
+
+
+def feed_first_page_(session, cookies, cancel):
+    cookies = pick_cookies(cookies, 'html')
+    wait_for_rate_limit(cookies, 'html', cancel)
+    client, xhs_session = get_signer(cookies)
     current_timestamp = int(time.time() * 1000)
-    header = client.sign_headers_get(
-        uri="https://www.xiaohongshu.com/explore",
-        cookies=cookies,
-        xsec_appid=cookies['xsecappid'],
-        timestamp=current_timestamp,
-        session=xhs_session,
-    )
+    with metrics.span("sign", "explore"):
+        header = client.sign_headers_get(
+            uri=f"{www_origin}/explore",
+            cookies=cookies,
+            xsec_appid=cookies['xsecappid'],
+            timestamp=current_timestamp,
+            session=xhs_session,
+        )
     header.update(header_explore)
-    response = session.get(
-        url="https://www.xiaohongshu.com/explore",
-        headers=header,
-        cookies=cookies,
-    )
-    assert response.status_code == 200, "Fail to fetch home page of xiaohongshu."
-    initial_state = extract_initial_state(response.text)
+    with metrics.span("http", "explore"):
+        response = session.get(
+            url=f"{www_origin}/explore",
+            headers=header,
+            cookies=cookies,
+        )
+    record_response("explore", response)
+    report_html_response(cookies, response)
+    check_status(response, "Fail to fetch home page of xiaohongshu.")
+    with metrics.span("parse", "explore"):
+        initial_state = find_initial_state(response.text)
+    assert initial_state is not None, \
+        "Fail to find initial state in home page of xiaohongshu."
     posts = []
     for feed in initial_state['feed']['feeds']:
         post = {
@@ -60,15 +310,17 @@ def feed_first_page(session, cookies):
             'user_xsec_token': feed['noteCard']['user']['xsecToken'],
         }
         posts.append(post)
-    time.sleep(random.uniform(0.7, 1.3))
     return posts
 
 
-def feed_subsequent_page(session, cookies, note_index, page, cursor_score):
+def feed_subsequent_page(session, cookies, note_index, page, cursor_score, cancel=None):
     if page == 1:  # second page
         refresh_type = 1
     else:
         refresh_type = 3
+    cookies = pick_cookies(cookies, 'api')
+    wait_for_rate_limit(cookies, 'api', cancel)
+    client, xhs_session = get_signer(cookies)
     current_timestamp = int(time.time() * 1000)
     payload = {
         "cursor_score": cursor_score,
@@ -85,30 +337,32 @@ def feed_subsequent_page(session, cookies, note_index, page, cursor_score):
         "need_filter_image": False,
     }
 
-    header = client.sign_headers_post(
-        uri="https://edith.xiaohongshu.com/api/sns/web/v1/homefeed",
-        cookies=cookies,
-        xsec_appid=cookies['xsecappid'],
-        payload=payload,
-        timestamp=current_timestamp,
-        session=xhs_session,
-    )
+    with metrics.span("sign", "homefeed"):
+        header = client.sign_headers_post(
+            uri=f"{edith_origin}/api/sns/web/v1/homefeed",
+            cookies=cookies,
+            xsec_appid=cookies['xsecappid'],
+            payload=payload,
+            timestamp=current_timestamp,
+            session=xhs_session,
+        )
     header.update(header_homefeed)
     logging.info(f"POST --URL /api/sns/web/v1/homefeed --Payload {payload}")
     payload_str = client.build_json_body(payload)
 
-    response = session.post(
-        url="https://edith.xiaohongshu.com/api/sns/web/v1/homefeed",
-        data=payload_str,
-        cookies=cookies,
-        headers=header,
-    )
-    assert response.status_code == 200, \
-        (f"Fail to fetch xiaohongshu thread. Page: {page} (starts from 0). "
-         f"Status code: {response.status_code}. Text: {response.text}")
-    response_json = response.json()
-    assert response_json['success'] == True, \
-        f"Fail to fetch, website's message: {response_json['msg']}."
+    with metrics.span("http", "homefeed"):
+        response = session.post(
+            url=f"{edith_origin}/api/sns/web/v1/homefeed",
+            data=payload_str,
+            cookies=cookies,
+            headers=header,
+        )
+    record_response("homefeed", response)
+    with metrics.span("parse", "homefeed"):
+        response_json = parse_api_response(cookies, response)
+    check_status(response, f"Fail to fetch xiaohongshu thread. Page: {page} (starts from "
+                           f"0).")
+    check_success(response_json, "Fail to fetch.")
     cursor_score = response_json['data']['cursor_score']
     posts = []
     for item in response_json['data']['items']:
@@ -122,11 +376,137 @@ def feed_subsequent_page(session, cookies, note_index, page, cursor_score):
             'user_xsec_token': item['note_card']['user']['xsec_token'],
         }
         posts.append(post)
-    time.sleep(random.uniform(0.7, 1.3))
     return posts, cursor_score
 
 
-def search_page(session, cookies, query, page):
+def feed_pages(session, cookies, pages, cancel=None, state=None, deadline=None,
+               failures=None, on_page=None, collect=True, seen=None, min_posts=0,
+               max_pages=0):
+    """
+    Fetch "pages" pages of the home feed.
+    Args:
+        state: feed_session.FeedState to continue from. If provided, the crawl resumes
+        from its cursor, posts already in its "seen_ids" are skipped, and it's updated
+        after each page.
+        deadline: seconds after which the crawl stops, also in the middle of a page
+        being requested or retried, or None.
+        failures: list, or None. If provided, the crawl stops at the first failed page
+        or at the deadline, which is appended as {"page", "error"}, and the posts
+        fetched so far are returned; otherwise the error is raised.
+        on_page: function called with the number of the page in this call (from 1) and
+        its new posts as soon as each page is parsed, or None.
+        collect: whether to return the posts. If False, they are only passed to
+        "on_page", so that memory use doesn't grow with the number of pages.
+        seen: post IDs to skip, such as seen_filter.SeenFilter, or None.
+        min_posts: if fewer posts are found in "pages" pages, more pages are fetched
+        until there are this number of posts, up to "max_pages" pages.
+    The home feed is personalized, so all pages are fetched with one account: the
+    account of "cookies", or if "cookies" is accounts.AccountPool, the account of "state"
+    or the usable account with the most rate budget.
+    """
+    if state is None:
+        state = FeedState()
+    if isinstance(cookies, dict):
+        account = get_account(cookies)
+    else:
+        account = cookies.get(state.account) if state.account else None
+        if account is None or not account.usable():
+            account = cookies.pick('api')
+        cookies = account.cookies
+    if state.account and state.account != account.name:
+        logging.info(f"Account {state.account} is not usable, so the home feed restarts "
+                     f"with account {account.name}.")
+        state.page, state.cursor_score, state.note_index = 0, "", -1
+    state.account = account.name
+    posts = []
+    n_posts = 0
+
+    def add(i, new_posts):
+        nonlocal n_posts
+        seen_ids = set(state.seen_ids)
+        fresh = []
+        for post in new_posts:
+            if post['id'] in seen_ids or (seen is not None and post['id'] in seen):
+                continue
+            seen_ids.add(post['id'])
+            state.seen_ids.append(post['id'])
+            fresh.append(post)
+        state.note_index += len(new_posts)
+        state.page += 1
+        n_posts += len(fresh)
+        if collect:
+            posts.extend(fresh)
+        if on_page is not None:
+            on_page(i + 1, fresh)
+
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    # Set when this function returns, so that a page in flight after the deadline stops
+    # before its next request.
+    stop = threading.Event()
+    # Each page is requested in a worker thread, so that the deadline is enforced also
+    # while the page is in flight or retried, as in search_pages.
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        for i in range(max(pages, max_pages)):
+            if i >= pages and n_posts >= min_posts:
+                break
+            try:
+                if state.page == 0:
+                    future = executor.submit(feed_first_page, session, cookies, stop)
+                    add(i, wait_result(future, cancel, deadline_at))
+                    continue
+                future = executor.submit(with_retries, partial(
+                    feed_subsequent_page,
+                    session=session,
+                    cookies=cookies,
+                    note_index=state.note_index,
+                    page=state.page,
+                    cursor_score=state.cursor_score,
+                    cancel=stop,
+                ), cookies, stop)
+                new_posts, cursor_score = wait_result(future, cancel, deadline_at)
+                state.cursor_score = cursor_score
+                add(i, new_posts)
+            except Cancelled:
+                raise
+            except Exception as e:
+                if failures is None:
+                    raise
+                logging.warning(f"Fail to fetch page {state.page} of the home feed. "
+                                f"{type(e).__name__}: {e}")
+                failures.append({"page": state.page, "error": f"{type(e).__name__}: {e}"})
+                break
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return posts
+
+
+def search_page(session, cookies, query, page, cancel=None, cache=None):
+    """
+    Fetch one page of searching results, or share the same request in flight.
+    Args:
+        cache: cache.MemoryCache of recently fetched pages, or None.
+    Returns:
+        (posts, whether there are more pages)
+    """
+    query = " ".join(query.split())
+    key = ("search", account_key(cookies), query, page)
+    if cache is not None:
+        result = cache.get(key)
+        if result is not None:
+            return result
+    result = flights.do(key, lambda: with_retries(
+        lambda: search_page_(session, cookies, query, page, cancel), cookies, cancel), cancel)
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def search_page_(session, cookies, query, page, cancel):
+    cookies = pick_cookies(cookies, 'api')
+    wait_for_rate_limit(cookies, 'api', cancel)
+    client, xhs_session = get_signer(cookies)
     current_timestamp = int(time.time() * 1000)
     payload = {
         "keyword": query,
@@ -145,29 +525,31 @@ def search_page(session, cookies, query, page):
         "image_formats": ["jpg", "webp", "avif"],
     }
 
-    header = client.sign_headers_post(
-        uri="https://edith.xiaohongshu.com/api/sns/web/v1/search/notes",
-        cookies=cookies,
-        xsec_appid=cookies['xsecappid'],
-        payload=payload,
-        timestamp=current_timestamp,
-        session=xhs_session,
-    )
+    with metrics.span("sign", "search"):
+        header = client.sign_headers_post(
+            uri=f"{edith_origin}/api/sns/web/v1/search/notes",
+            cookies=cookies,
+            xsec_appid=cookies['xsecappid'],
+            payload=payload,
+            timestamp=current_timestamp,
+            session=xhs_session,
+        )
     header.update(header_search)
     logging.info(f"POST --URL /api/sns/web/v1/search/notes --Payload {payload}")
     payload_str = client.build_json_body(payload)
 
-    response = session.post(
-        url="https://edith.xiaohongshu.com/api/sns/web/v1/search/notes",
-        data=payload_str,
-        cookies=cookies,
-        headers=header,
-    )
-    assert response.status_code == 200, \
-        f"Fail to fetch searching results of page {page+1}."
-    response_json = response.json()
-    assert response_json['success'] == True, \
-        f"Fail to fetch, website's message: {response_json['msg']}."
+    with metrics.span("http", "search"):
+        response = session.post(
+            url=f"{edith_origin}/api/sns/web/v1/search/notes",
+            data=payload_str,
+            cookies=cookies,
+            headers=header,
+        )
+    record_response("search", response)
+    with metrics.span("parse", "search"):
+        response_json = parse_api_response(cookies, response)
+    check_status(response, f"Fail to fetch searching results of page {page+1}.")
+    check_success(response_json, "Fail to fetch.")
     posts = []
     if 'items' not in response_json['data'].keys():
         logging.info(f"The current page is {page+1} and no more searching results.")
@@ -189,50 +571,340 @@ def search_page(session, cookies, query, page):
         }
         posts.append(post)
     has_more = response_json['data']['has_more']
-    time.sleep(random.uniform(0.7, 1.3))
     return posts, has_more
 
 
-def get_details_(session, cookies, id_list: list[str], xsec_token_list: list[str]):
+def search_pages(session, cookies, query, pages, max_workers=3, cancel=None, cache=None,
+                 deadline=None, failures=None, on_page=None, collect=True, seen=None,
+                 min_posts=0, max_pages=0):
+    """
+    Fetch the first "pages" pages of searching results. Pages are addressed by number,
+    so up to "max_workers" pages are requested at the same time (under the rate limit)
+    and assembled in order. Pages after the first page without more results are
+    discarded, and posts are de-duplicated by ID across pages.
+    If "cache" (cache.MemoryCache) is provided, recently fetched pages are reused.
+    If "failures" (list) is provided, failed pages are appended as {"page", "error"}
+    and skipped, and the pages not fetched within "deadline" seconds are appended as one
+    failure; otherwise the error is raised.
+    If "on_page" is provided, it's called with the page number (from 1) and the new posts
+    of each page in order, as soon as the page and the pages before it are parsed. If
+    "collect" is False, posts are only passed to "on_page" and not returned, so that
+    memory use doesn't grow with the number of pages.
+    If "seen" (such as seen_filter.SeenFilter) is provided, posts in it are skipped. If
+    fewer than "min_posts" posts are found in "pages" pages, more pages are fetched until
+    there are, up to "max_pages" pages; those pages are only requested while posts are
+    still missing.
+    """
+    posts = []
+    n_posts = 0
+    seen_ids = set()
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    # Set when this function returns, so that the pages still waiting are not requested.
+    stop = threading.Event()
+    max_workers = max(1, max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Pages are submitted a few ahead of the page being assembled, so that the parsed
+    # pages waiting in memory don't grow with the number of pages.
+    futures = deque()
+    max_pages = max(pages, max_pages)
+    try:
+        for page in range(max_pages):
+            if page >= pages and n_posts >= min_posts:
+                break
+            while len(futures) < 2 * max_workers and page + len(futures) < max_pages \
+                    and (page + len(futures) < pages or n_posts < min_posts):
+                futures.append(executor.submit(search_page, session, cookies, query,
+                                               page + len(futures), stop, cache))
+            future = futures.popleft()
+            try:
+                new_posts, has_more = wait_result(future, cancel, deadline_at)
+            except Cancelled:
+                raise
+            except Exception as e:
+                if failures is None:
+                    raise
+                logging.warning(f"Fail to search {query} on page {page + 1}. "
+                                f"{type(e).__name__}: {e}")
+                failures.append({"page": page + 1, "error": f"{type(e).__name__}: {e}"})
+                if isinstance(e, TimeoutError):
+                    break
+                continue
+            fresh = []
+            for post in new_posts:
+                if post['id'] in seen_ids or (seen is not None and post['id'] in seen):
+                    continue
+                seen_ids.add(post['id'])
+                fresh.append(post)
+            n_posts += len(fresh)
+            if collect:
+                posts.extend(fresh)
+            if on_page is not None:
+                on_page(page + 1, fresh)
+            if not has_more:
+                break
+    finally:
+        # Pages not started yet are no longer needed, and pages in flight are discarded.
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return posts
+
+
+def search_many(session, cookies, queries: list[str], pages: int, max_workers=3,
+                cancel=None, cache=None, deadline=None, seen=None):
+    """
+    Search several queries at the same time. Each query runs as "search_pages", so the
+    requests share the connections of "session" and the rate limits of the accounts.
+    Posts in "seen" are skipped, as in "search_pages".
+    Returns:
+        {"results": [{"query", "status", "posts", "failures"}, ...] in the order of
+         "queries", where "status" is "ok", "partial" (some pages failed) or "error"
+         (no page is fetched), and "failures" are the failed pages as in search_pages,
+         "merged": posts of all queries de-duplicated by ID, in the order of their first
+         appearance, each with a "queries" field listing the queries that matched it}
+    """
+    queries = list(dict.fromkeys(queries))
     results = []
-    for id_, xsec_token in zip(id_list, xsec_token_list):
-        url = f"https://www.xiaohongshu.com/explore/{id_}?xsec_token={xsec_token}"
-        response = session.get(url, cookies=cookies, headers=header_explore)
-        assert response.status_code == 200, \
-            f"Fail to fetch the post's detail from xiaohongshu. URL: {url}"
-        logging.info(f"GET --URL {url}")
-        tree = BeautifulSoup(response.text, "html.parser")
-        images = [
-            image.get('content')
-            for image in tree.find_all('meta', {'name': 'og:image'})
+    merged = {}
+    failures = {query: [] for query in queries}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(len(queries), max_workers)))
+    try:
+        futures = [
+            executor.submit(search_pages, session, cookies, query, pages, max_workers,
+                            cancel, cache, deadline, failures[query], seen=seen)
+            for query in queries
         ]
+        for query, future in zip(queries, futures):
+            posts = future.result()
+            if not failures[query]:
+                status = "ok"
+            else:
+                status = "partial" if posts else "error"
+            results.append({"query": query, "status": status, "posts": posts,
+                            "failures": failures[query]})
+            for post in posts:
+                if post['id'] not in merged:
+                    merged[post['id']] = dict(post, queries=[])
+                merged[post['id']]['queries'].append(query)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {"results": results, "merged": list(merged.values())}
 
-        initial_state_regex = re.compile("window.__INITIAL_STATE__")
-        script_tag = tree.find("script", string=initial_state_regex)
-        script_text = script_tag.text
-        script_text = re.sub("window.__INITIAL_STATE__=", "", script_text)
-        script_text = re.sub("undefined", "null", script_text)
-        initial_state = json.loads(script_text)
 
-        try:
-            note = initial_state['note']['noteDetailMap'][id_]['note']
-        except KeyError:
-            logging.warning(f"Post {url} does not exist.")
-            continue
-        published_time_stamp = note.get('time')
-        if published_time_stamp:
-            published_time = pd.Timestamp(
-                published_time_stamp, unit='ms', tz='Asia/Shanghai')
-            published_time = published_time.strftime("%Y-%m-%d %H:%M:%S %z")
+class NoteNotFound(Exception):
+    pass
+
+
+def read_detail_page(response):
+    """
+    Read a streamed post detail page until the window.__INITIAL_STATE__ script is
+    complete, instead of the whole page. The response is closed.
+    Returns:
+        (HTML text up to the end of the script, or the whole page if the script doesn't
+         exist; number of bytes received, see "wire_bytes")
+    """
+    scanner = InitialStateScanner()
+    try:
+        if hasattr(response, "iter_content"):  # requests
+            chunks = response.iter_content(detail_chunk_size)
+        else:  # httpx
+            chunks = response.iter_bytes(detail_chunk_size)
+        drained = 0
+        for chunk in chunks:
+            if scanner.feed(chunk):
+                for chunk_ in chunks:
+                    drained += len(chunk_)
+                    if drained > detail_drain_limit:
+                        break
+                break
+    finally:
+        response.close()
+    end = scanner.end if scanner.end >= 0 else len(scanner.data)
+    # The website always serves UTF-8, while requests guesses ISO-8859-1 for HTML
+    # without a charset in headers.
+    return scanner.data[:end].decode("utf-8", errors="replace"), wire_bytes(response)
+
+
+def get_detail(session, cookies, id_: str, xsec_token: str, cancel=None,
+               low_priority=False, on_send=None):
+    """
+    Fetch the detail of a post, or share the same request in flight. Low-priority
+    requests don't make others wait for them.
+    Args:
+        on_send: function called when the request (or each retry) is sent, after the
+        rate limiter allows it, or None. It's not called when joining a request in
+        flight.
+    """
+    return flights.do(("detail", account_key(cookies), id_), lambda: with_retries(
+        lambda: get_detail_(session, cookies, id_, xsec_token, cancel, low_priority,
+                            on_send),
+        cookies, cancel), cancel, lead=not low_priority)
+
+
+def get_detail_(session, cookies, id_, xsec_token, cancel, low_priority, on_send=None):
+    url = f"{www_origin}/explore/{id_}?xsec_token={xsec_token}"
+    cookies = pick_cookies(cookies, 'html')
+    wait_for_rate_limit(cookies, 'html', cancel, low_priority)
+    if on_send is not None:
+        on_send()
+    start = time.perf_counter()
+    with metrics.span("http", "detail"):
+        response = session.get(url, cookies=cookies, headers=header_explore, stream=True)
+        report_html_response(cookies, response)
+        if response.status_code == 200:
+            html_content, n_bytes = read_detail_page(response)
+        else:
+            response.close()
+    # Only the time on the network, without waiting for the rate limiter, so that
+    # hedging reacts to slow responses instead of to throttling.
+    detail_latency.add(time.perf_counter() - start)
+    check_status(response, f"Fail to fetch the post's detail from xiaohongshu. URL: {url}")
+    record_response("detail", response)
+    logging.info(f"GET --URL {url} --Bytes {n_bytes} "
+                 f"--Seconds {time.perf_counter() - start:.3f}")
+    with metrics.span("parse", "detail"):
+        images = find_og_images(html_content)
+        initial_state = find_initial_state(html_content)
+    assert initial_state is not None, \
+        f"Fail to find the post's initial state in the page. URL: {url}"
+
+    try:
+        note = initial_state['note']['noteDetailMap'][id_]['note']
+    except KeyError:
+        raise NoteNotFound(f"Post {url} does not exist.")
+    published_time_stamp = note.get('time')
+    if published_time_stamp:
+        published_time = datetime.fromtimestamp(
+            published_time_stamp / 1000, tz=timezone_shanghai)
+        published_time = published_time.strftime("%Y-%m-%d %H:%M:%S %z")
+    else:
+        published_time = ''
+    return {
+        "url": url,
+        "title": note.get('title', ''),
+        "description": note.get('desc', ''),
+        "images": images,
+        "labels": [a.get('name', '') for a in note.get('tagList')],
+        "location": note.get('ipLocation', ''),
+        "published_time": published_time
+    }
+
+
+def get_detail_to_cache(session, cookies, id_: str, xsec_token: str, cache, cancel,
+                        index=None, hedged=False, on_send=None):
+    """
+    Args:
+        hedged: whether this is a hedged request of a slow one. It's sent once, without
+        joining the request in flight (which is the slow one) or retrying.
+        on_send: as in get_detail.
+    """
+    if hedged:
+        post = get_detail_(session, cookies, id_, xsec_token, cancel, False, on_send)
+    else:
+        post = get_detail(session, cookies, id_, xsec_token, cancel, on_send=on_send)
+    if cache is not None:
+        cache.put(id_, post)
+    if index is not None:
+        index.put(id_, post)
+    return post
+
+
+def get_details_(session, cookies, id_list: list[str], xsec_token_list: list[str],
+                 max_workers: int = 4, cache=None, cancel=None, index=None,
+                 deadline=None, hedge=True):
+    """
+    Fetch the details of several posts concurrently. The results keep the order of
+    "id_list", and each of them has a "status" field: "ok" when the post is fetched,
+    "not_found" when the post doesn't exist, "error" when the request or parsing fails,
+    "timeout" when the post isn't fetched within "deadline" seconds (the reason is in
+    "error" field). One failed post doesn't affect the others.
+    If "cache" (cache.DetailCache) is provided, cached posts are returned without
+    requesting the website, and newly fetched posts are saved to it.
+    If "index" (note_index.NoteIndex) is provided, newly fetched posts are added to it.
+    If "hedge" is true, a post taking longer than "hedge_percentile" of recent posts is
+    requested again in parallel (within the retry budget), and the first result is used.
+    If "cancel" (threading.Event) is set, posts not requested yet are skipped and
+    Cancelled is raised.
+    """
+    assert len(id_list) == len(xsec_token_list), \
+        "The number of post IDs and xsec tokens must be the same."
+    cached = {}
+    if cache is not None:
+        for id_ in id_list:
+            post = cache.get(id_)
+            if post is not None:
+                cached[id_] = post
+    xsec_tokens = dict(zip(id_list, xsec_token_list))
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    # Set when this function returns, so that the posts still waiting are not requested.
+    stop = threading.Event()
+    attempts = {}  # post ID -> futures of the request and the hedged request
+    # Post ID -> time.monotonic() when the latest attempt of the request is sent. Posts
+    # still waiting for the rate limiter aren't in it, so they are not hedged.
+    sent = {}
+    outcomes = {}  # post ID -> post or exception
+
+    def fetch(id_, hedged=False):
+        on_send = None if hedged else lambda: sent.__setitem__(id_, time.monotonic())
+        return get_detail_to_cache(session, cookies, id_, xsec_tokens[id_], cache, stop,
+                                   index, hedged, on_send)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    hedge_executor = ThreadPoolExecutor(max_workers=max(1, max_workers // 2))
+    try:
+        for id_ in xsec_tokens:
+            if id_ not in cached:
+                attempts[id_] = [executor.submit(fetch, id_)]
+        while len(outcomes) < len(attempts):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled("The tool call is cancelled.")
+            now = time.monotonic()
+            if deadline_at is not None and now >= deadline_at:
+                break
+            waiting = []
+            hedge_after = detail_latency.percentile(hedge_percentile) if hedge else None
+            for id_, futures in attempts.items():
+                if id_ in outcomes:
+                    continue
+                done = [future for future in futures if future.done()]
+                succeeded = [future for future in done if future.exception() is None]
+                if succeeded:
+                    outcomes[id_] = succeeded[0].result()
+                    continue
+                if len(done) == len(futures):
+                    outcomes[id_] = done[0].exception()
+                    continue
+                if hedge_after is not None and len(futures) == 1 and id_ in sent \
+                        and now - sent[id_] > hedge_after and retry_budget.try_spend():
+                    logging.info(f"Hedge the request of post {id_}, which takes longer "
+                                 f"than {hedge_after:.2f} seconds.")
+                    metrics.count("hedged", "detail")
+                    futures.append(hedge_executor.submit(fetch, id_, True))
+                waiting += [future for future in futures if not future.done()]
+            if waiting:
+                timeout = 0.05 if deadline_at is None else \
+                    max(0.0, min(0.05, deadline_at - now))
+                wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED)
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for id_ in id_list:
+        outcome = cached.get(id_, outcomes.get(id_))
+        if outcome is None:
+            logging.warning(f"Post {id_} isn't fetched within {deadline} seconds.")
+            results.append({"id": id_, "status": "timeout",
+                            "error": f"Not fetched within {deadline} seconds."})
+        elif isinstance(outcome, NoteNotFound):
+            logging.warning(str(outcome))
+            results.append({"id": id_, "status": "not_found"})
+        elif isinstance(outcome, Exception):
+            logging.warning(f"Fail to fetch post {id_}. {type(outcome).__name__}: "
+                            f"{outcome}")
+            results.append({"id": id_, "status": "error", "error": str(outcome)})
         else:
-            published_time = ''
-        results.append({
-            "url": url,
-            "title": note.get('title', ''),
-            "description": note.get('desc', ''),
-            "images": images,
-            "labels": [a.get('name', '') for a in note.get('tagList')],
-            "location": note.get('ipLocation', ''),
-            "published_time": published_time
-        })
+            post = dict(outcome)
+            post.update({"id": id_, "status": "ok"})
+            results.append(post)
     return results
@@ -0,0 +1,138 @@
+"""
+Extract data from xiaohongshu.com pages by scanning the raw HTML text, without building
+a DOM tree. The pages are several hundred KB, but only the "og:image" meta tags in
+<head> and the "window.__INITIAL_STATE__" script are useful, so the download can stop
+after that script (InitialStateScanner).
+"""
+import json
+import re
+from html import unescape
+
+initial_state_marker = "window.__INITIAL_STATE__"
+# The assignment, not other uses such as "if (window.__INITIAL_STATE__)" in earlier scripts.
+initial_state_regex = re.compile(r"window\.__INITIAL_STATE__\s*=")
+initial_state_regex_bytes = re.compile(initial_state_regex.pattern.encode())
+# A JSON string literal, with escape sequences.
+string_regex = re.compile(r'("(?:[^"\\]|\\.)*")', re.S)
+meta_regex = re.compile(r"<meta\s[^>]*>", re.I)
+og_image_regex = re.compile(r"""name\s*=\s*["']og:image["']""", re.I)
+content_regex = re.compile(r"""content\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+initial_state_marker_bytes = initial_state_marker.encode()
+script_end_bytes = b"</script>"
+
+
+class InitialStateScanner:
+    """
+    Receive a page chunk by chunk, and find where the window.__INITIAL_STATE__ script
+    ends, so that the rest of the page doesn't need to be downloaded. Each byte is
+    scanned once.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        # Position after the "=" of the assignment, or -1 if not received.
+        self.marker = -1
+        # Position after the "</script>" of the initial state, or -1 if not received.
+        self.end = -1
+        # Where the assignment or "</script>" is searched from at the next chunk.
+        self._position = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Returns:
+            Whether the initial state script is complete.
+        """
+        self.data += chunk
+        if self.marker < 0:
+            match = initial_state_regex_bytes.search(self.data, self._position)
+            if match is None:
+                # The assignment may be split across chunks: search again from a marker
+                # followed only by whitespace so far, or from the last bytes, which may
+                # be the start of a marker.
+                last = self.data.rfind(initial_state_marker_bytes, self._position)
+                rest = last + len(initial_state_marker_bytes)
+                if last >= 0 and not self.data[rest:].strip():
+                    self._position = last
+                else:
+                    self._position = max(self._position,
+                                         len(self.data) - len(initial_state_marker_bytes))
+                return False
+            self.marker = self._position = match.end()
+        end = self.data.find(script_end_bytes, self._position)
+        if end >= 0:
+            self.end = end + len(script_end_bytes)
+        else:
+            self._position = max(self._position, len(self.data) - len(script_end_bytes))
+        return self.end >= 0
+
+
+def find_initial_state_span(html_content: str) -> tuple[int, int] | None:
+    """
+    Locate the JavaScript object assigned to window.__INITIAL_STATE__.
+    Args:
+        html_content: the HTML text of the page.
+
+    Returns:
+        (start, end) such that html_content[start:end] is the object literal, or None if
+        the page doesn't contain the script.
+    """
+    match = initial_state_regex.search(html_content)
+    if match is None:
+        return None
+    marker = match.end()
+    start = html_content.find("{", marker)
+    # The object is the only statement of its <script>, and "</script>" cannot appear
+    # inside a script literally, so the object ends at the last "}" before it.
+    script_end = html_content.find("</script>", marker)
+    if script_end < 0:
+        script_end = len(html_content)
+    end = html_content.rfind("}", start, script_end) + 1
+    if start < 0 or end <= start:
+        return None
+    return start, end
+
+
+def js_object_to_json(js_str: str) -> str:
+    """
+    Replace JavaScript "undefined" values with "null", leaving string contents intact.
+    """
+    if "undefined" not in js_str:
+        return js_str
+    # Odd indices are string literals, even indices are the code between them.
+    parts = string_regex.split(js_str)
+    for i in range(0, len(parts), 2):
+        if "undefined" in parts[i]:
+            parts[i] = parts[i].replace("undefined", "null")
+    return "".join(parts)
+
+
+def find_initial_state(html_content: str) -> dict | None:
+    """
+    Extract window.__INITIAL_STATE__ from HTML and convert to JSON.
+    Args:
+        html_content: the HTML text of the page.
+
+    Returns:
+        The initial state, or None if the page doesn't contain it.
+    """
+    span = find_initial_state_span(html_content)
+    if span is None:
+        return None
+    return json.loads(js_object_to_json(html_content[span[0]:span[1]]))
+
+
+def find_og_images(html_content: str) -> list[str]:
+    """
+    Extract the URLs in <meta name="og:image" content="..."> tags of the page.
+    """
+    head_end = html_content.find("</head>")
+    if head_end < 0:
+        head_end = len(html_content)
+    images = []
+    for meta in meta_regex.finditer(html_content, 0, head_end):
+        tag = meta.group(0)
+        if not og_image_regex.search(tag):
+            continue
+        content = content_regex.search(tag)
+        if content:
+            images.append(unescape(content.group(1) or content.group(2) or ''))
+    return images
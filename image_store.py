@@ -0,0 +1,420 @@
+"""
+Content-addressed store of images of posts, such as "cover_median_url" of listings and
+"images" of post details. Each file is named by the SHA-256 of its content, and each URL
+is mapped to the hash of its content, so an image is downloaded once, and the same image
+under different URLs is stored once. Repeat reads are served from memory-mapped files.
+Thumbnails are made on demand with package "Pillow", and stored the same way.
+"""
+import hashlib
+import io
+import logging
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import metrics
+from database import connect
+from get_data import Cancelled
+from singleflight import SingleFlight
+from transport import origin_of
+
+image_store_dir = "raw/images"
+# Image CDN of xiaohongshu.com. Images are only downloaded from these hosts and their
+# subdomains, so that "get_images" can't be used to fetch other URLs.
+image_hosts = ("xhscdn.com", "xhscdn.net")
+# PIL.Image, or False if package "Pillow" is not installed; None before the first use.
+pil_image = None
+pil_lock = threading.Lock()
+
+
+def get_pil_image():
+    """
+    Import PIL.Image at the first thumbnail instead of at the start of the server.
+    Returns:
+        PIL.Image, or None if package "Pillow" is not installed (logged once).
+    """
+    global pil_image
+    with pil_lock:
+        if pil_image is None:
+            try:
+                from PIL import Image
+            except ImportError:
+                logging.warning("Package \"Pillow\" is not installed, so images are not "
+                                "downscaled. Install it by \"pip install Pillow\".")
+                pil_image = False
+            else:
+                pil_image = Image
+    return pil_image or None
+
+
+class ImageStore:
+    """
+    The SQLite index in the folder maps URLs to hashes, and records the size and last
+    access time of each file. It's in WAL mode, so several server processes can share the
+    folder. Each thread has its own connection.
+    Args:
+        session: HTTP client, such as transport.Transport.
+        directory: folder of the images and the index.
+        max_bytes: when the total size of images and thumbnails exceeds this value, the
+        least recently used ones are evicted.
+        max_workers: number of images downloaded at the same time.
+        headers: HTTP headers of downloading images.
+        max_mapped: number of memory-mapped files kept open for repeat reads.
+        origins: origins allowed besides the hosts of "image_hosts", such as a stand-in
+        server.
+        max_image_bytes: downloads larger than this value are stopped.
+    """
+    def __init__(self, session, directory: str = image_store_dir,
+                 max_bytes: int = 1024 * 1024 * 1024, max_workers: int = 8,
+                 headers: dict | None = None, max_mapped: int = 64,
+                 origins: list[str] | None = None, max_image_bytes: int = 20 * 1024 * 1024):
+        self.session = session
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.headers = headers
+        self.max_mapped = max_mapped
+        self.origins = set(origins or [])
+        self.max_image_bytes = max_image_bytes
+        self.counters = {"hits": 0, "downloads": 0, "duplicates": 0, "thumbnails": 0,
+                         "evictions": 0, "failures": 0}
+        self.flights = SingleFlight(Cancelled)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="image")
+        self._pinned = {}  # hash -> number of calls using the file
+        self._mapped = OrderedDict()  # hash -> mmap.mmap, least recently read first
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS image (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                content_type TEXT NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS image_accessed_at ON image (accessed_at);
+            CREATE TABLE IF NOT EXISTS url (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS url_hash ON url (hash);
+            CREATE TABLE IF NOT EXISTS thumbnail (
+                hash TEXT NOT NULL,
+                max_side INTEGER NOT NULL,
+                thumbnail_hash TEXT NOT NULL,
+                PRIMARY KEY (hash, max_side)
+            );
+            CREATE INDEX IF NOT EXISTS thumbnail_thumbnail_hash ON thumbnail (thumbnail_hash);
+            BEGIN IMMEDIATE;
+            -- Total size of the files, kept by triggers, so that storing a file doesn't
+            -- sum the sizes of all files.
+            CREATE TABLE IF NOT EXISTS image_size (total INTEGER NOT NULL);
+            INSERT INTO image_size SELECT COALESCE(SUM(size), 0) FROM image
+            WHERE NOT EXISTS (SELECT 1 FROM image_size);
+            CREATE TRIGGER IF NOT EXISTS image_insert AFTER INSERT ON image BEGIN
+                UPDATE image_size SET total = total + new.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS image_delete AFTER DELETE ON image BEGIN
+                UPDATE image_size SET total = total - old.size;
+            END;
+            COMMIT;
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(os.path.join(self.directory, "index.sqlite"))
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def path(self, hash_: str) -> str:
+        return os.path.join(self.directory, hash_[:2], hash_)
+
+    def _stored(self, row) -> tuple[str, str] | None:
+        """
+        (hash, content type) of a row of the index, if its file still exists.
+        """
+        if row is None or not os.path.isfile(self.path(row[0])):
+            return None
+        return row[0], row[1]
+
+    def _put(self, data: bytes | bytearray, content_type: str) -> str:
+        hash_ = hashlib.sha256(data).hexdigest()
+        path = self.path(hash_)
+        if os.path.isfile(path):
+            self._count("duplicates")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written to a temporary file first, so that readers never see a partial file.
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        # An upsert instead of "INSERT OR REPLACE", whose deletion doesn't run the
+        # triggers of the total size. The same hash always has the same size.
+        self._connect().execute(
+            "INSERT INTO image (hash, size, content_type, accessed_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET accessed_at = excluded.accessed_at",
+            (hash_, len(data), content_type, time.time()))
+        return hash_
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return False
+        if origin_of(url) in self.origins:
+            return True
+        return any(parts.hostname == host or parts.hostname.endswith("." + host)
+                   for host in image_hosts)
+
+    def _download(self, url: str) -> tuple[str, str]:
+        start = time.perf_counter()
+        # Not following redirects, which could leave the allowed hosts.
+        response = self.session.get(url, headers=self.headers, stream=True,
+                                    allow_redirects=False)
+        try:
+            if response.status_code != 200:
+                raise Exception(f"Status code of image {url} is {response.status_code}.")
+            content_type = response.headers.get("content-type", "").split(";")[0].strip()
+            if not content_type.startswith("image/"):
+                raise Exception(f"{url} isn't an image.")
+            too_large = Exception(f"Image {url} is larger than {self.max_image_bytes} bytes.")
+            if int(response.headers.get("content-length") or 0) > self.max_image_bytes:
+                raise too_large
+            # Read in chunks, so that a huge response is stopped at the limit instead of
+            # being held in memory.
+            chunks = response.iter_content(65536) if hasattr(response, "iter_content") \
+                else response.iter_bytes(65536)
+            buffer = bytearray()
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) > self.max_image_bytes:
+                    raise too_large
+        finally:
+            response.close()
+        if not buffer:
+            raise Exception(f"{url} isn't an image.")
+        logging.info(f"GET --URL {url} --Bytes {len(buffer)} "
+                     f"--Seconds {time.perf_counter() - start:.3f}")
+        hash_ = self._put(buffer, content_type)
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO url (url, hash) VALUES (?, ?)", (url, hash_))
+        self._count("downloads")
+        metrics.count("downloads", "image")
+        self._evict(conn, keep=hash_)
+        return hash_, content_type
+
+    def _thumbnail(self, hash_: str, content_type: str,
+                   max_side: int) -> tuple[str, str]:
+        conn = self._connect()
+        stored = self._stored(conn.execute(
+            "SELECT thumbnail_hash, content_type FROM thumbnail "
+            "JOIN image ON thumbnail_hash = image.hash "
+            "WHERE thumbnail.hash = ? AND max_side = ?", (hash_, max_side)).fetchone())
+        if stored is not None:
+            return stored
+        try:
+            with get_pil_image().open(self.path(hash_)) as image:
+                if max(image.size) <= max_side:
+                    thumbnail = (hash_, content_type)
+                else:
+                    image.thumbnail((max_side, max_side))
+                    if image.mode not in ("RGB", "L"):
+                        image = image.convert("RGB")
+                    buffer = io.BytesIO()
+                    image.save(buffer, "JPEG", quality=85)
+                    thumbnail = (self._put(buffer.getvalue(), "image/jpeg"), "image/jpeg")
+                    self._count("thumbnails")
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            logging.warning(f"Fail to downscale image {hash_}, so the original is used. "
+                            f"{type(e).__name__}: {e}")
+            return hash_, content_type
+        conn.execute(
+            "INSERT OR REPLACE INTO thumbnail (hash, max_side, thumbnail_hash) "
+            "VALUES (?, ?, ?)", (hash_, max_side, thumbnail[0]))
+        self._evict(conn, keep=thumbnail[0])
+        return thumbnail
+
+    @contextmanager
+    def _pin(self, hash_: str):
+        """
+        Keep the file from being evicted by other calls of this process while it's used.
+        """
+        with self._lock:
+            self._pinned[hash_] = self._pinned.get(hash_, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pinned[hash_] -= 1
+                if not self._pinned[hash_]:
+                    del self._pinned[hash_]
+
+    def get(self, url: str, max_side: int = 0, cancel=None,
+            include_data: bool = False) -> dict:
+        """
+        Args:
+            url: URL of the image, on a host of "image_hosts" or an origin of "origins";
+            it's downloaded unless stored already.
+            max_side: if positive and Pillow is installed, the image is downscaled (as
+            JPEG) so that its width and height are at most this number of pixels.
+            cancel: threading.Event, which stops waiting for a download by another call.
+            include_data: whether to return the content of the file in "data" field.
+        Returns:
+            {"hash", "path", "bytes", "content_type", "thumbnail": whether it's downscaled}
+        """
+        if not self.allowed(url):
+            raise Exception(f"{url} isn't an image URL of xiaohongshu.com.")
+        for attempt in range(3):
+            try:
+                return self._get(url, max_side, cancel, include_data)
+            except FileNotFoundError:
+                # Evicted by another call in the meantime, so it's downloaded again.
+                if attempt == 2:
+                    raise
+
+    def _get(self, url: str, max_side: int, cancel, include_data: bool) -> dict:
+        conn = self._connect()
+        stored = self._stored(conn.execute(
+            "SELECT image.hash, content_type FROM url JOIN image ON url.hash = image.hash "
+            "WHERE url = ?", (url,)).fetchone())
+        if stored is not None:
+            self._count("hits")
+            metrics.count("cache_hits", "image")
+        else:
+            stored = self.flights.do(("image", url), lambda: self._download(url), cancel)
+        with self._pin(stored[0]):
+            hash_, content_type = stored
+            if max_side > 0 and get_pil_image() is not None:
+                hash_, content_type = self._thumbnail(stored[0], stored[1], max_side)
+            with self._pin(hash_):
+                conn.execute("UPDATE image SET accessed_at = ? WHERE hash IN (?, ?)",
+                             (time.time(), stored[0], hash_))
+                result = {"hash": hash_, "path": os.path.abspath(self.path(hash_)),
+                          "bytes": os.path.getsize(self.path(hash_)),
+                          "content_type": content_type, "thumbnail": hash_ != stored[0]}
+                if include_data:
+                    result["data"] = self.read(hash_)
+        return result
+
+    def get_many(self, urls: list[str], max_side: int = 0, cancel=None,
+                 include_data: bool = False) -> list[dict]:
+        """
+        Get several images concurrently (see "get"). The results keep the order of "urls", and each
+        of them has "url" and "status" fields: "ok" with the fields of "get", or "error"
+        with the reason in "error" field. One failed image doesn't affect the others.
+        If "cancel" (threading.Event) is set, images not downloaded yet are skipped and
+        Cancelled is raised.
+        """
+        futures = {url: self.executor.submit(self.get, url, max_side, cancel, include_data)
+                   for url in dict.fromkeys(urls)}
+        pending = set(futures.values())
+        while pending:
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+                raise Cancelled("The tool call is cancelled.")
+            _, pending = wait(pending, timeout=0.1)
+        results = []
+        for url in urls:
+            error = futures[url].exception()
+            if error is None:
+                results.append(dict(futures[url].result(), url=url, status="ok"))
+                continue
+            logging.warning(f"Fail to get image {url}. {type(error).__name__}: {error}")
+            self._count("failures")
+            results.append({"url": url, "status": "error", "error": str(error)})
+        return results
+
+    def read(self, hash_: str) -> bytes:
+        """
+        Content of a stored file. The file stays memory-mapped, so reading it again costs
+        a memory copy from the page cache instead of opening and reading the file.
+        """
+        with self._lock:
+            mapped = self._mapped.get(hash_)
+            if mapped is not None:
+                self._mapped.move_to_end(hash_)
+                return mapped[:]
+        with open(self.path(hash_), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            self._mapped[hash_] = mapped
+            while len(self._mapped) > self.max_mapped:
+                self._mapped.popitem(last=False)[1].close()
+            return mapped[:]
+
+    @staticmethod
+    def _total_size(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM image_size").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        if self._total_size(conn) <= self.max_bytes:
+            return
+        with self._lock:
+            skipped = list(set(self._pinned) | {keep})
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total_size = self._total_size(conn)
+            evicted = []
+            # Evict a bit more than needed, so that the next downloads don't evict again.
+            target = self.max_bytes * 0.9
+            while total_size > target and (evicted or total_size > self.max_bytes):
+                rows = conn.execute(
+                    f"SELECT hash, size FROM image "
+                    f"WHERE hash NOT IN ({', '.join('?' * len(skipped))}) "
+                    f"ORDER BY accessed_at LIMIT 100", skipped).fetchall()
+                if not rows:
+                    break
+                for hash_, size in rows:
+                    conn.execute("DELETE FROM image WHERE hash = ?", (hash_,))
+                    conn.execute("DELETE FROM url WHERE hash = ?", (hash_,))
+                    conn.execute("DELETE FROM thumbnail WHERE hash = ? OR thumbnail_hash = ?",
+                                 (hash_, hash_))
+                    evicted.append(hash_)
+                    total_size -= size
+                    if total_size <= target:
+                        break
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for hash_ in evicted:
+            with self._lock:
+                mapped = self._mapped.pop(hash_, None)
+                if mapped is not None:
+                    mapped.close()
+            try:
+                os.remove(self.path(hash_))
+            except OSError:
+                pass
+        if evicted:
+            logging.info(f"Image store evicts {len(evicted)} least recently used images.")
+            self._count("evictions", len(evicted))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for mapped in self._mapped.values():
+                mapped.close()
+            self._mapped.clear()
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM image").fetchone()[0]
+        total_size = self._total_size(conn)
+        urls = conn.execute("SELECT COUNT(*) FROM url").fetchone()[0]
+        with self._lock:
+            counters = dict(self.counters)
+            mapped = len(self._mapped)
+        return dict(counters, entries=entries, urls=urls, bytes=total_size,
+                    max_bytes=self.max_bytes, mapped=mapped,
+                    thumbnails_supported=get_pil_image() is not None)
@@ -0,0 +1,478 @@
+"""
+Background crawl jobs for collections too large for one tool call, such as many pages of
+several queries with the details of every post found. A job is split into tasks of one
+request each (a searching result page, a home feed page or a post detail), kept in a
+local SQLite queue. Worker threads run the tasks under the same rate limits and accounts
+as tool calls, and each task is committed together with its results, so that a restarted
+server continues the jobs without fetching finished pages or posts again.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Literal, get_args
+
+import get_data
+from database import connect
+from feed_session import FeedState
+
+jobs_path = "raw/jobs.sqlite"
+JobKind = Literal["search", "feed", "details"]
+ResultKind = Literal["posts", "details"]
+
+
+class JobQueue:
+    """
+    Tables:
+        job: one row per job, with its parameters, status ("queued", "running", "done"
+        or "cancelled") and, for home feed jobs, the feed cursor.
+        task: one row per request, with status "pending", "running", "done", "failed"
+        or "skipped" (searching result pages after the last page).
+        result: posts ("posts", from searching results or the home feed) and post
+        details ("details") found by the jobs, de-duplicated by post ID in each job.
+    Args:
+        session: HTTP client, such as transport.Transport.
+        cookies: cookies of the account, or accounts.AccountPool.
+        path: path of the SQLite database.
+        workers: number of worker threads. 0 means that the jobs are only queued, to be
+        run by another server process sharing the database.
+        cache: cache.DetailCache where fetched posts are also saved, or None.
+        index: note_index.NoteIndex where fetched posts are also saved, or None.
+        lease: seconds after which a running task is considered abandoned and is run
+        again. The lease of a running task is renewed every "lease" / 3 seconds by its
+        process, so only the tasks of stopped processes expire, however long a task
+        waits for the rate limits. On POSIX systems, the tasks of stopped processes on
+        this computer are also run again at start, without waiting for the lease.
+        max_attempts: a task failing this number of times is marked as failed.
+    """
+    def __init__(self, session, cookies, path: str = jobs_path, workers: int = 2,
+                 cache=None, index=None, lease: float = 30, max_attempts: int = 3):
+        self.session = session
+        self.cookies = cookies
+        self.path = path
+        self.cache = cache
+        self.index = index
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.counters = {"tasks_done": 0, "task_errors": 0}
+        self._lock = threading.Lock()
+        # (job ID, task key) of the tasks run by the workers of this process.
+        self._running = set()
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS job (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                state TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS task (
+                job_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                spec TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                host TEXT,
+                pid INTEGER,
+                error TEXT,
+                PRIMARY KEY (job_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS task_status ON task (status);
+            CREATE TABLE IF NOT EXISTS result (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                item TEXT NOT NULL,
+                UNIQUE (job_id, kind, key)
+            );
+        """)
+        if workers > 0:
+            self._recover()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="job-lease",
+                                                  daemon=True)
+        if workers > 0:
+            self._heartbeat_thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def submit(self, kind: JobKind, queries: list[str] | None = None, pages: int = 1,
+               id_list: list[str] | None = None, xsec_token_list: list[str] | None = None,
+               details: bool = False) -> str:
+        """
+        Args:
+            kind: "search" (the first "pages" pages of each of "queries"), "feed"
+            ("pages" pages of the home feed) or "details" (the posts of "id_list" and
+            "xsec_token_list").
+            details: for "search" and "feed", also fetch the details of every post found.
+        Returns:
+            ID of the job.
+        """
+        assert kind in get_args(JobKind), \
+            f"Kind of job must be one of {', '.join(get_args(JobKind))}."
+        queries = list(dict.fromkeys(queries or []))
+        id_list = id_list or []
+        xsec_token_list = xsec_token_list or []
+        if kind == "details":
+            assert id_list and len(id_list) == len(xsec_token_list), \
+                "The number of post IDs and xsec tokens must be the same and positive."
+            tasks = [self._detail_task(id_, xsec_token)
+                     for id_, xsec_token in zip(id_list, xsec_token_list)]
+        else:
+            assert pages >= 1, "Number of pages must be a positive integer."
+            if kind == "search":
+                assert queries, "At least one query is required."
+                tasks = [(f"search:{page}:{query}",
+                          {"type": "search", "query": query, "page": page})
+                         for page in range(pages) for query in queries]
+            else:
+                tasks = [(f"feed:{page}", {"type": "feed", "page": page})
+                         for page in range(pages)]
+        job_id = uuid.uuid4().hex
+        params = {"queries": queries, "pages": pages, "details": details} \
+            if kind != "details" else {"posts": len(id_list)}
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO job (id, kind, params, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), now, now))
+            self._add_tasks(conn, job_id, tasks)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logging.info(f"Submit {kind} job {job_id} with {len(tasks)} tasks.")
+        self._wake_up.set()
+        return job_id
+
+    @staticmethod
+    def _detail_task(id_: str, xsec_token: str) -> tuple[str, dict]:
+        return f"detail:{id_}", {"type": "detail", "id": id_, "xsec_token": xsec_token}
+
+    @staticmethod
+    def _add_tasks(conn: sqlite3.Connection, job_id: str, tasks: list[tuple[str, dict]]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO task (job_id, key, spec, status) "
+            "VALUES (?, ?, ?, 'pending')",
+            [(job_id, key, json.dumps(spec, ensure_ascii=False)) for key, spec in tasks])
+
+    def _recover(self):
+        """
+        Put back to the queue the running tasks of stopped server processes on this
+        computer, so that they don't wait for their lease to expire. Whether a process
+        is running can only be checked on POSIX systems; elsewhere, the tasks of other
+        processes are run again when their lease expires.
+        """
+        host = socket.gethostname()
+        conn = self._connect()
+        stopped = []
+        for pid, in conn.execute("SELECT DISTINCT pid FROM task "
+                                 "WHERE status = 'running' AND host = ?", (host,)):
+            # The ID of a stopped process may be reused by this one.
+            if pid == os.getpid():
+                stopped.append(pid)
+            elif os.name == "posix":
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    stopped.append(pid)
+                except OSError:
+                    pass
+        if stopped:
+            n = conn.executemany(
+                "UPDATE task SET status = 'pending', lease_until = 0, "
+                "attempts = attempts - 1 WHERE status = 'running' AND host = ? AND pid = ?",
+                [(host, pid) for pid in stopped]).rowcount
+            logging.info(f"Resume {n} tasks interrupted by stopped server processes.")
+
+    def _heartbeat(self):
+        """
+        Renew the leases of the tasks run by this process.
+        """
+        host = socket.gethostname()
+        while not self._stop.wait(self.lease / 3):
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                self._connect().executemany(
+                    "UPDATE task SET lease_until = ? WHERE job_id = ? AND key = ? "
+                    "AND status = 'running' AND host = ? AND pid = ?",
+                    [(time.time() + self.lease, job_id, key, host, os.getpid())
+                     for job_id, key in running])
+            except sqlite3.Error as e:
+                logging.warning(f"Fail to renew the leases of tasks. "
+                                f"{type(e).__name__}: {e}")
+
+    def _claim(self) -> tuple | None:
+        """
+        Mark the next task as running. Jobs are served in the order of submission, and
+        the pages of a home feed job one at a time, because each page continues from the
+        cursor of the previous one.
+        Returns:
+            (job ID, task key, task spec, job kind, job state), or None if there's no task.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("""
+                SELECT task.job_id, task.key, task.spec, job.kind, job.state FROM task
+                JOIN job ON job.id = task.job_id
+                WHERE (task.status = 'pending'
+                       OR (task.status = 'running' AND task.lease_until < :now))
+                  AND job.status IN ('queued', 'running')
+                  AND NOT (job.kind = 'feed' AND task.key LIKE 'feed:%' AND EXISTS (
+                      SELECT 1 FROM task AS other
+                      WHERE other.job_id = task.job_id AND other.key LIKE 'feed:%'
+                        AND other.status = 'running' AND other.lease_until >= :now))
+                ORDER BY job.created_at, task.rowid
+                LIMIT 1
+            """, {"now": now}).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE task SET status = 'running', lease_until = ?, host = ?, pid = ?, "
+                    "attempts = attempts + 1 WHERE job_id = ? AND key = ?",
+                    (now + self.lease, socket.gethostname(), os.getpid(), row[0], row[1]))
+                conn.execute("UPDATE job SET status = 'running', updated_at = ? "
+                             "WHERE id = ? AND status = 'queued'", (now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), row[3], row[4]
+
+    def _run(self, job_id: str, spec: dict, kind: str, state: str | None):
+        """
+        Run one task.
+        Returns:
+            (results as [(kind, key, item)], new tasks, task keys to skip, new job state)
+        """
+        cancel = self._stop
+        if spec['type'] == "detail":
+            try:
+                post = self.cache.get(spec['id']) if self.cache is not None else None
+                if post is None:
+                    post = get_data.get_detail_to_cache(
+                        self.session, self.cookies, spec['id'], spec['xsec_token'],
+                        self.cache, cancel, self.index)
+                item = dict(post, id=spec['id'], status="ok")
+            except get_data.NoteNotFound:
+                item = {"id": spec['id'], "status": "not_found"}
+            return [("details", spec['id'], item)], [], [], None
+        params = json.loads(self._connect().execute(
+            "SELECT params FROM job WHERE id = ?", (job_id,)).fetchone()[0])
+        skipped = []
+        if spec['type'] == "search":
+            posts, has_more = get_data.search_page(self.session, self.cookies,
+                                                   spec['query'], spec['page'], cancel)
+            posts = [dict(post, query=spec['query']) for post in posts]
+            if not has_more:
+                skipped = [f"search:{page}:{spec['query']}"
+                           for page in range(spec['page'] + 1, params['pages'])]
+        else:
+            feed_state = FeedState(**json.loads(state)) if state else FeedState()
+            posts = get_data.feed_pages(self.session, self.cookies, 1, cancel,
+                                        state=feed_state)
+            state = json.dumps(asdict(feed_state), ensure_ascii=False)
+        tasks = [self._detail_task(post['id'], post['xsec_token'])
+                 for post in posts] if params['details'] else []
+        return [("posts", post['id'], post) for post in posts], tasks, skipped, state
+
+    def _finish(self, job_id: str, key: str, results: list, tasks: list, skipped: list,
+                state: str | None):
+        """
+        Commit the results of a task together with its status (the checkpoint).
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO result (job_id, kind, key, item) VALUES (?, ?, ?, ?)",
+                [(job_id, kind, key_, json.dumps(item, ensure_ascii=False))
+                 for kind, key_, item in results])
+            self._add_tasks(conn, job_id, tasks)
+            conn.executemany(
+                "UPDATE task SET status = 'skipped' WHERE job_id = ? AND key = ? "
+                "AND status = 'pending'", [(job_id, key_) for key_ in skipped])
+            conn.execute("UPDATE task SET status = 'done', error = NULL "
+                         "WHERE job_id = ? AND key = ?", (job_id, key))
+            if state is not None:
+                conn.execute("UPDATE job SET state = ? WHERE id = ?", (state, job_id))
+            self._update_job(conn, job_id, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _update_job(conn: sqlite3.Connection, job_id: str, now: float):
+        remaining = conn.execute(
+            "SELECT COUNT(*) FROM task WHERE job_id = ? AND status IN ('pending', 'running')",
+            (job_id,)).fetchone()[0]
+        conn.execute(
+            "UPDATE job SET updated_at = ?, status = CASE WHEN ? = 0 AND status = 'running' "
+            "THEN 'done' ELSE status END WHERE id = ?", (now, remaining, job_id))
+
+    def _fail(self, job_id: str, key: str, error: Exception | None):
+        """
+        Put the task back to the queue, or mark it as failed after "max_attempts".
+        "error" is None if the task is interrupted by closing the queue, which doesn't
+        count as an attempt.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if error is None:
+                conn.execute("UPDATE task SET status = 'pending', lease_until = 0, "
+                             "attempts = attempts - 1 WHERE job_id = ? AND key = ?",
+                             (job_id, key))
+            else:
+                conn.execute(
+                    "UPDATE task SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                    "ELSE 'pending' END, lease_until = 0, error = ? "
+                    "WHERE job_id = ? AND key = ?",
+                    (self.max_attempts, f"{type(error).__name__}: {error}", job_id, key))
+                self._update_job(conn, job_id, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                logging.warning(f"Fail to read the job queue. {type(e).__name__}: {e}")
+                claimed = None
+            if claimed is None:
+                self._wake_up.wait(1)
+                self._wake_up.clear()
+                continue
+            job_id, key, spec, kind, state = claimed
+            with self._lock:
+                self._running.add((job_id, key))
+            try:
+                self._finish(job_id, key, *self._run(job_id, spec, kind, state))
+                self._count("tasks_done")
+            except get_data.Cancelled:
+                self._fail(job_id, key, None)
+            except Exception as e:
+                logging.warning(f"Task {key} of job {job_id} fails. "
+                                f"{type(e).__name__}: {e}")
+                self._count("task_errors")
+                self._fail(job_id, key, e)
+            finally:
+                with self._lock:
+                    self._running.discard((job_id, key))
+
+    def status(self, job_id: str) -> dict | None:
+        """
+        Returns:
+            {"id", "kind", "params", "status", "created_at", "updated_at",
+             "tasks": {task type: {task status: number}},
+             "results": {"posts": number, "details": number},
+             "errors": up to 5 recent errors of failed tasks}, or None if the job doesn't
+            exist.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id, kind, params, status, created_at, updated_at FROM job WHERE id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        tasks = {}
+        for type_, status, n in conn.execute(
+                "SELECT json_extract(spec, '$.type'), status, COUNT(*) FROM task "
+                "WHERE job_id = ? GROUP BY 1, 2", (job_id,)):
+            tasks.setdefault(type_, {})[status] = n
+        results = dict(conn.execute(
+            "SELECT kind, COUNT(*) FROM result WHERE job_id = ? GROUP BY kind",
+            (job_id,)).fetchall())
+        errors = [{"task": key, "error": error} for key, error in conn.execute(
+            "SELECT key, error FROM task WHERE job_id = ? AND status = 'failed' "
+            "ORDER BY rowid DESC LIMIT 5", (job_id,))]
+        return {"id": row[0], "kind": row[1], "params": json.loads(row[2]),
+                "status": row[3], "created_at": row[4], "updated_at": row[5],
+                "tasks": tasks,
+                "results": {"posts": results.get("posts", 0),
+                            "details": results.get("details", 0)},
+                "errors": errors}
+
+    def recent(self, limit: int = 20) -> list[dict]:
+        """
+        Status of the most recently submitted jobs.
+        """
+        return [self.status(job_id) for job_id, in self._connect().execute(
+            "SELECT id FROM job ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()]
+
+    def results(self, job_id: str, kind: ResultKind = "posts", cursor: int = 0,
+                limit: int = 100) -> tuple[list[dict], int]:
+        """
+        Results of a job in the order they are found, after "cursor".
+        Args:
+            kind: "posts" or "details".
+        Returns:
+            (results, cursor after the last result)
+        """
+        rows = self._connect().execute(
+            "SELECT seq, item FROM result WHERE job_id = ? AND kind = ? AND seq > ? "
+            "ORDER BY seq LIMIT ?", (job_id, kind, cursor, limit)).fetchall()
+        return [json.loads(item) for _, item in rows], rows[-1][0] if rows else cursor
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Stop running the tasks of a job. Results found so far are kept.
+        """
+        return self._connect().execute(
+            "UPDATE job SET status = 'cancelled', updated_at = ? "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id)).rowcount > 0
+
+    def close(self):
+        """
+        Stop the workers. The tasks in progress are put back to the queue.
+        """
+        self._stop.set()
+        self._wake_up.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._heartbeat_thread.is_alive():
+            self._heartbeat_thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        jobs = dict(conn.execute("SELECT status, COUNT(*) FROM job GROUP BY status"))
+        tasks = dict(conn.execute("SELECT status, COUNT(*) FROM task GROUP BY status"))
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, workers=len(self._threads), jobs=jobs, tasks=tasks)
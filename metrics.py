@@ -0,0 +1,146 @@
+"""
+Timing of the stages inside tool calls, and counters of downloaded bytes, fetched pages
+and cache hits. Disabled by default; when disabled, "span" returns a shared no-op context
+manager and "count" returns at once, so the cost is negligible.
+
+Stages: sign (xhshow signing), wait (rate limiter), http (round trip; for post details,
+until the useful part of the page is received), parse (HTML and JSON parsing), encode
+(JSON encoding of tool output).
+Endpoints: explore (home page), homefeed, search, detail (post detail page), and tool
+names for "encode".
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Upper bounds of histogram buckets, in seconds.
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+enabled = False
+histograms = {}  # (stage, endpoint) -> [bucket counts..., +Inf count, sum]
+counters = {}  # (name, endpoint) -> value
+lock = threading.Lock()
+no_op = nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+class Span:
+    __slots__ = ("key", "start")
+
+    def __init__(self, stage: str, endpoint: str):
+        self.key = (stage, endpoint)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.key, time.perf_counter() - self.start)
+
+
+def span(stage: str, endpoint: str):
+    if not enabled:
+        return no_op
+    return Span(stage, endpoint)
+
+
+def observe(key: tuple[str, str], seconds: float):
+    with lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+
+def count(name: str, endpoint: str = "", n: float = 1):
+    if not enabled:
+        return
+    with lock:
+        counters[(name, endpoint)] = counters.get((name, endpoint), 0) + n
+
+
+def snapshot() -> dict:
+    """
+    Returns:
+        {"spans": {stage: {endpoint: {"count", "sum", "mean", "p50", "p99"}}},
+         "counters": {name: {endpoint: value}}}
+        Percentiles are upper bounds of histogram buckets.
+    """
+    with lock:
+        histograms_ = {key: list(value) for key, value in histograms.items()}
+        counters_ = dict(counters)
+    spans = {}
+    for (stage, endpoint), histogram in sorted(histograms_.items()):
+        n = sum(histogram[:-1])
+        spans.setdefault(stage, {})[endpoint] = {
+            "count": n,
+            "sum": histogram[-1],
+            "mean": histogram[-1] / n if n else 0.0,
+            "p50": percentile(histogram, 0.5),
+            "p99": percentile(histogram, 0.99),
+        }
+    counters_by_name = {}
+    for (name, endpoint), value in sorted(counters_.items()):
+        counters_by_name.setdefault(name, {})[endpoint] = value
+    return {"enabled": enabled, "spans": spans, "counters": counters_by_name}
+
+
+def percentile(histogram: list, q: float) -> float | None:
+    n = sum(histogram[:-1])
+    if n == 0:
+        return None
+    cumulative = 0
+    for i, bucket_count in enumerate(histogram[:-1]):
+        cumulative += bucket_count
+        if cumulative >= q * n:
+            return buckets[i] if i < len(buckets) else float('inf')
+    return float('inf')
+
+
+def prometheus_text() -> str:
+    with lock:
+        histograms_ = {key: list(value) for key, value in histograms.items()}
+        counters_ = dict(counters)
+    lines = ["# TYPE rednote_stage_seconds histogram"]
+    for (stage, endpoint), histogram in sorted(histograms_.items()):
+        labels = f'stage="{stage}",endpoint="{endpoint}"'
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + ("+Inf",), histogram[:-1]):
+            cumulative += bucket_count
+            lines.append(f'rednote_stage_seconds_bucket{{{labels},le="{bound}"}} '
+                         f'{cumulative}')
+        lines.append(f'rednote_stage_seconds_sum{{{labels}}} {histogram[-1]}')
+        lines.append(f'rednote_stage_seconds_count{{{labels}}} {cumulative}')
+    names = sorted({name for name, _ in counters_})
+    for name in names:
+        lines.append(f"# TYPE rednote_{name}_total counter")
+        for (name_, endpoint), value in sorted(counters_.items()):
+            if name_ == name:
+                lines.append(f'rednote_{name}_total{{endpoint="{endpoint}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temp_path, path)
+
+
+def export_prometheus_periodically(path: str, interval: float = 15):
+    """
+    Write the metrics to a Prometheus text file (for node_exporter's textfile collector)
+    every "interval" seconds in a background thread.
+    """
+    def export():
+        while True:
+            time.sleep(interval)
+            write_prometheus(path)
+
+    threading.Thread(target=export, name="prometheus", daemon=True).start()
@@ -0,0 +1,220 @@
+"""
+Local full-text index of post details fetched by "get_details", so that repeated research
+on the same topics is answered from the posts already fetched without requesting the
+website.
+
+SQLite FTS5 doesn't segment Chinese, Japanese and Korean text into words, so the text is
+tokenized here before indexing: runs of CJK characters become overlapping pairs of
+characters (bigrams), and other text becomes lowercase words. A query is tokenized the
+same way, and its bigrams must appear next to each other, so "咖啡店" matches posts
+containing "咖啡店" but not posts with "咖啡" and "店" far apart.
+"""
+import json
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+from database import connect
+from get_data import timezone_shanghai
+
+note_index_path = "raw/notes.sqlite"
+# Hiragana, katakana, CJK unified ideographs (and extension A), hangul, CJK compatibility
+# ideographs.
+cjk_pattern = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+word_pattern = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str, query: bool = False) -> list[str]:
+    """
+    Args:
+        query: whether "text" is a query. When indexing, the last character of each CJK
+        run is also a token, so that every single character is the start of a token.
+    """
+    tokens = []
+    position = 0
+    for match in cjk_pattern.finditer(text):
+        tokens += word_pattern.findall(text[position:match.start()].lower())
+        run = match.group()
+        tokens += [run[i:i + 2] for i in range(len(run) - 1)]
+        if len(run) == 1 or not query:
+            tokens.append(run[-1])
+        position = match.end()
+    tokens += word_pattern.findall(text[position:].lower())
+    return tokens
+
+
+def match_expression(query: str) -> str:
+    """
+    FTS5 query that matches posts containing every term of "query" (separated by
+    spaces). Returns an empty string if "query" has no searchable characters.
+    """
+    phrases = []
+    for term in query.split():
+        tokens = tokenize(term, query=True)
+        if not tokens:
+            continue
+        if len(tokens) == 1 and len(tokens[0]) == 1 and cjk_pattern.fullmatch(tokens[0]):
+            # A single CJK character is the start of bigrams or the last character.
+            phrases.append(f'"{tokens[0]}"*')
+        else:
+            phrases.append('"' + " ".join(tokens) + '"')
+    return " AND ".join(phrases)
+
+
+def parse_time(text: str) -> float | None:
+    """
+    Parse "2024-05-01", "2024-05-01 08:00:00" or "2024-05-01 08:00:00 +0800" to UNIX
+    timestamp. Time without timezone is in China Standard Time, like "published_time".
+    """
+    if not text:
+        return None
+    for format_ in ("%Y-%m-%d %H:%M:%S %z", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M",
+                    "%Y-%m-%d"):
+        try:
+            time_ = datetime.strptime(text.strip(), format_)
+        except ValueError:
+            continue
+        if time_.tzinfo is None:
+            time_ = time_.replace(tzinfo=timezone_shanghai)
+        return time_.timestamp()
+    raise Exception(f"Cannot parse time {text}; the format should be like "
+                    f"\"2024-05-01\" or \"2024-05-01 08:00:00\".")
+
+
+class NoteIndex:
+    """
+    Post details (the dictionaries made by get_data.get_detail) in SQLite, with an FTS5
+    index of title, description and labels. SQLite in WAL mode lets several server
+    processes read and write the same file. Each thread has its own connection.
+    Args:
+        path: path of the SQLite database.
+    """
+    def __init__(self, path: str = note_index_path):
+        self.path = path
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS note (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                value TEXT NOT NULL,
+                location TEXT NOT NULL,
+                published_at REAL,
+                indexed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS note_published_at ON note (published_at);
+            CREATE TABLE IF NOT EXISTS note_label (
+                note_rowid INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                PRIMARY KEY (label, note_rowid)
+            ) WITHOUT ROWID;
+            CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5(
+                title, description, labels, tokenize='unicode61'
+            );
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def put(self, id_: str, post: dict):
+        """
+        Add the post to the index, or replace it if it's already indexed.
+        """
+        value = json.dumps(
+            {key: post[key] for key in ("url", "title", "description", "images", "labels",
+                                        "location", "published_time") if key in post},
+            ensure_ascii=False,
+        )
+        labels = [label for label in post.get('labels', []) if label]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT rowid FROM note WHERE id = ?", (id_,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM note_fts WHERE rowid = ?", row)
+                conn.execute("DELETE FROM note_label WHERE note_rowid = ?", row)
+                conn.execute("DELETE FROM note WHERE rowid = ?", row)
+            rowid = conn.execute(
+                "INSERT INTO note (id, value, location, published_at, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (id_, value, post.get('location', ''),
+                 parse_time(post.get('published_time', '')), time.time()),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO note_fts (rowid, title, description, labels) "
+                "VALUES (?, ?, ?, ?)",
+                (rowid, " ".join(tokenize(post.get('title', ''))),
+                 " ".join(tokenize(post.get('description', ''))),
+                 " ".join(tokenize(" ".join(labels)))),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO note_label (note_rowid, label) VALUES (?, ?)",
+                [(rowid, label) for label in labels],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def search(self, query: str = "", label: str = "", location: str = "",
+               since: str = "", until: str = "", limit: int = 20) -> list[dict]:
+        """
+        Args:
+            query: words that must appear in the title, description or labels. If
+            empty, the latest posts matching the other filters are returned.
+            label: exact topic label of the post.
+            location: part of the author's location when publishing the post.
+            since, until: range of published time, such as "2024-05-01" or
+            "2024-05-01 08:00:00" (China Standard Time), inclusive.
+            limit: maximum number of posts.
+        Returns:
+            Posts with the keys of get_data.get_detail and "id", most relevant first
+            (or latest first if "query" is empty).
+        """
+        conditions = []
+        parameters = []
+        expression = match_expression(query)
+        if expression:
+            sql = ("SELECT note.id, note.value FROM note_fts "
+                   "JOIN note ON note.rowid = note_fts.rowid")
+            conditions.append("note_fts MATCH ?")
+            parameters.append(expression)
+            # Matches in the title and labels are more relevant than in the description.
+            order = "bm25(note_fts, 3.0, 1.0, 2.0)"
+        else:
+            sql = "SELECT note.id, note.value FROM note"
+            order = "note.published_at DESC"
+        if label:
+            conditions.append("note.rowid IN (SELECT note_rowid FROM note_label "
+                              "WHERE label = ?)")
+            parameters.append(label)
+        if location:
+            conditions.append("instr(note.location, ?) > 0")
+            parameters.append(location)
+        since_timestamp, until_timestamp = parse_time(since), parse_time(until)
+        if since_timestamp is not None:
+            conditions.append("note.published_at >= ?")
+            parameters.append(since_timestamp)
+        if until_timestamp is not None:
+            if len(until.strip()) == len("2024-05-01"):
+                until_timestamp += 86400  # until the end of the day
+                conditions.append("note.published_at < ?")
+            else:
+                conditions.append("note.published_at <= ?")
+            parameters.append(until_timestamp)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order} LIMIT ?"
+        parameters.append(limit)
+        posts = []
+        for id_, value in self._connect().execute(sql, parameters).fetchall():
+            post = json.loads(value)
+            post['id'] = id_
+            posts.append(post)
+        return posts
+
+    def stats(self) -> dict:
+        notes, labels = self._connect().execute(
+            "SELECT (SELECT COUNT(*) FROM note), "
+            "(SELECT COUNT(DISTINCT label) FROM note_label)").fetchone()
+        return {"notes": notes, "labels": labels}
@@ -0,0 +1,44 @@
+"""
+Encoding of tool output. Tables of posts can be projected to the requested fields and
+encoded as columns and rows, so that field names are not repeated in every post.
+JSON is compact (no spaces, non-ASCII characters kept as is), and encoded by "orjson"
+if it's installed.
+"""
+import json
+from typing import Literal, get_args
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Layout = Literal["records", "table"]
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_posts(posts: list[dict], fields: list[str] | None = None,
+                 layout: Layout = "records"):
+    """
+    Args:
+        posts: table of posts as a list of dictionaries.
+        fields: names of the fields to keep, in this order. All fields are kept if None
+        or empty.
+        layout: "records" for a list of objects, or "table" for
+        {"columns": field names, "rows": list of lists of values}. In "table" layout, a
+        field missing in a post is null.
+    Returns:
+        JSON-serializable object.
+    """
+    assert layout in get_args(Layout), \
+        f"Layout must be one of {', '.join(get_args(Layout))}."
+    if not fields:
+        fields = list(dict.fromkeys(key for post in posts for key in post))
+    if layout == "table":
+        return {"columns": fields,
+                "rows": [[post.get(field) for field in fields] for post in posts]}
+    return [{field: post[field] for field in fields if field in post} for post in posts]
@@ -0,0 +1,117 @@
+"""
+Background prefetch of post details. After "search" or "get_feed" returns, the details
+of the first posts are fetched into the detail cache with the spare rate budget, so that
+the following "get_details" call mostly hits the cache.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from get_data import Cancelled, NoteNotFound, get_detail
+
+
+class Prefetcher:
+    """
+    Args:
+        session: HTTP client, such as transport.Transport.
+        cookies: cookies of the account, or accounts.AccountPool.
+        cache: cache.DetailCache where the prefetched posts are saved.
+        index: note_index.NoteIndex where the prefetched posts are also saved, or None.
+        max_pending: maximum number of posts waiting to be prefetched; older ones are
+        dropped when more posts are submitted.
+        max_tracked: maximum number of prefetched post IDs remembered to count how many
+        prefetched posts are used.
+    """
+    def __init__(self, session, cookies, cache, index=None, max_pending: int = 100,
+                 max_tracked: int = 1000):
+        self.session = session
+        self.cookies = cookies
+        self.cache = cache
+        self.index = index
+        self.max_pending = max_pending
+        self.max_tracked = max_tracked
+        self.pending = OrderedDict()  # post ID -> xsec_token
+        self.prefetched = OrderedDict()  # post ID -> None, used as an ordered set
+        self.counters = {"submitted": 0, "dropped": 0, "fetched": 0, "failed": 0,
+                         "used": 0}
+        self._lock = threading.Lock()
+        self._wake_up = threading.Condition(self._lock)
+        self._cancel = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._work, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def submit(self, posts: list[dict], n: int):
+        """
+        Queue the first "n" posts of a listing ("id" and "xsec_token" of each post).
+        Posts already cached are skipped.
+        """
+        candidates = [post for post in posts[:n] if not self.cache.contains(post['id'])]
+        with self._lock:
+            for post in candidates:
+                if post['id'] in self.pending or post['id'] in self.prefetched:
+                    continue
+                self.pending[post['id']] = post['xsec_token']
+                self.counters["submitted"] += 1
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+                self.counters["dropped"] += 1
+            self._wake_up.notify()
+
+    def claim(self, id_list: list[str]):
+        """
+        Called before "get_details" reads the cache. Posts still waiting are no longer
+        prefetched, and prefetched posts are counted as used.
+        """
+        with self._lock:
+            for id_ in id_list:
+                self.pending.pop(id_, None)
+                if id_ in self.prefetched:
+                    del self.prefetched[id_]
+                    self.counters["used"] += 1
+
+    def close(self):
+        """
+        Drop all waiting posts, interrupt the post being prefetched and stop the thread.
+        """
+        with self._lock:
+            self._stop = True
+            self.pending.clear()
+            self._cancel.set()
+            self._wake_up.notify()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, pending=len(self.pending))
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self.pending and not self._stop:
+                    self._wake_up.wait()
+                if self._stop:
+                    return
+                id_, xsec_token = self.pending.popitem(last=False)
+            try:
+                post = get_detail(self.session, self.cookies, id_, xsec_token,
+                                  cancel=self._cancel, low_priority=True)
+            except Cancelled:
+                continue
+            except NoteNotFound:
+                with self._lock:
+                    self.counters["failed"] += 1
+                continue
+            except Exception as e:
+                logging.warning(f"Fail to prefetch post {id_}. {type(e).__name__}: {e}")
+                with self._lock:
+                    self.counters["failed"] += 1
+                continue
+            self.cache.put(id_, post)
+            if self.index is not None:
+                self.index.put(id_, post)
+            with self._lock:
+                self.counters["fetched"] += 1
+                self.prefetched[id_] = None
+                while len(self.prefetched) > self.max_tracked:
+                    self.prefetched.popitem(last=False)
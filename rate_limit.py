@@ -0,0 +1,116 @@
+"""
+Rate limits of requests to xiaohongshu.com. Each account (accounts.Account) has one
+token bucket for each class of endpoints:
+    html: pages of www.xiaohongshu.com (home page and post details)
+    api: JSON APIs of edith.xiaohongshu.com (home feed and search)
+The rate is adaptive: it halves when the website returns an error, and recovers step by
+step when the responses are healthy again.
+"""
+import random
+import threading
+import time
+
+
+class AdaptiveTokenBucket:
+    """
+    Args:
+        rate: requests per second when the responses are healthy.
+        burst: number of requests that can be sent at once after being idle.
+        min_rate: the lowest rate after backing off.
+        jitter: random extra delay of each request, relative to the interval 1 / rate.
+        backoff: the rate is multiplied by this factor after an unhealthy response.
+        recovery: the rate increases by this fraction of "rate" after a healthy response.
+    """
+    def __init__(self, rate: float, burst: float, min_rate: float | None = None,
+                 jitter: float = 0.3, backoff: float = 0.5, recovery: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate / 8 if min_rate is None else min_rate
+        self.jitter = jitter
+        self.backoff = backoff
+        self.recovery = recovery
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token and return the seconds to wait before sending the request. The
+        token is taken immediately even if the caller must wait, so concurrent callers
+        are queued in order.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate)
+            wait += random.uniform(0, self.jitter) / self.rate
+            self.requests += 1
+            self.waited += wait
+        return wait
+
+    def available(self) -> float:
+        """
+        Number of tokens available now; negative if requests are queued.
+        """
+        with self._lock:
+            return min(self.burst,
+                       self.tokens + (time.monotonic() - self.updated_at) * self.rate)
+
+    def reserve_spare(self, spare: float = 1) -> tuple[bool, float]:
+        """
+        Take one token for a low priority request, only if "spare" tokens are still left
+        afterward, so that it never delays requests of tool calls.
+        Returns:
+            (True, seconds to wait before sending) if the token is taken; otherwise (False,
+            seconds to wait before trying again).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens < 1 + spare:
+                return False, (1 + spare - self.tokens) / self.rate
+            self.tokens -= 1
+            wait = random.uniform(0, self.jitter) / self.rate
+            self.requests += 1
+            self.waited += wait
+        return True, wait
+
+    def report(self, healthy: bool):
+        """
+        Adjust the rate according to whether the response is healthy (status code is 200
+        and the API returns "success").
+        """
+        with self._lock:
+            if healthy:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+            else:
+                self.errors += 1
+                self.rate = max(self.min_rate, self.rate * self.backoff)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "max_rate": self.max_rate,
+                "requests": self.requests,
+                "errors": self.errors,
+                "waited_seconds": self.waited,
+            }
+
+
+# Arguments of AdaptiveTokenBucket for each class of endpoints, per account.
+policies = {
+    "html": {"rate": 2, "burst": 4},
+    "api": {"rate": 1, "burst": 2},
+}
+
+
+def new_limiters() -> dict[str, AdaptiveTokenBucket]:
+    return {kind: AdaptiveTokenBucket(**policy) for kind, policy in policies.items()}
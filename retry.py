@@ -0,0 +1,68 @@
+"""
+Retry budget and latency tracking for retries and hedged requests. Retries and hedges
+are extra load on the website, so together they are limited to a fraction of the
+requests, and a failing website is not hit by a storm of retries.
+"""
+import threading
+from collections import deque
+
+
+class RetryBudget:
+    """
+    Each request deposits "ratio" tokens, and each retry or hedged request spends one.
+    Args:
+        ratio: retries allowed per request in the long run.
+        max_tokens: most tokens saved up, which is also the initial amount, so that a few
+        retries are allowed right after starting.
+    """
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.requests = 0
+        self.spent = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                self.denied += 1
+                return False
+            self.tokens -= 1
+            self.spent += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "retries_and_hedges": self.spent,
+                    "denied": self.denied, "tokens": self.tokens}
+
+
+class LatencyTracker:
+    """
+    Latencies of the most recent requests of an endpoint.
+    Args:
+        size: number of latencies kept.
+        min_samples: percentiles are unknown (None) until this number of latencies.
+    """
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self.recent = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self.recent) < self.min_samples:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
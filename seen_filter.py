@@ -0,0 +1,247 @@
+"""
+Post IDs already returned to each agent profile by the listing tools, so that
+"unseen_only" skips them across calls and restarts of the server. The IDs are kept in a
+scalable Bloom filter: a chain of bit arrays, each new one twice as large as the last
+with half the false positive rate, so the filter starts at about 180 KB and takes about
+3.3 MB for a million IDs, while the overall false positive rate (a new post taken as
+seen) stays under twice "error_rate". A lookup checks a fixed number of bits in each
+array, and there are only a few arrays even for millions of IDs.
+The filters are kept in SQLite, and saving a filter merges it with the saved one, so
+that server processes of the same profile don't lose each other's IDs.
+"""
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+
+from database import connect
+
+seen_path = "raw/seen.sqlite"
+
+
+class BloomFilter:
+    """
+    Args:
+        capacity: number of IDs kept at "error_rate".
+        error_rate: probability that an ID not added is reported as added.
+    """
+    def __init__(self, capacity: int, error_rate: float, bits: bytearray | None = None,
+                 count: int = 0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.n_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8) if bits is None else bits
+        assert len(self.bits) == (self.n_bits + 7) // 8, "The size of the bits is wrong."
+        self.count = count
+
+    def _positions(self, h1: int, h2: int):
+        # Double hashing: the positions of k hash functions from two 64-bit hashes.
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def contains(self, h1: int, h2: int) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2))
+
+    def add(self, h1: int, h2: int):
+        for p in self._positions(h1, h2):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def merge(self, bits: bytes, count: int):
+        """
+        Add the IDs of another bit array of the same size (bitwise OR).
+        """
+        assert len(bits) == len(self.bits), "The size of the bits is wrong."
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(bits, "little")
+        self.bits[:] = merged.to_bytes(len(self.bits), "little")
+        # Number of IDs estimated from the number of bits set, since the IDs of the two
+        # arrays may overlap.
+        fill = min(merged.bit_count() / self.n_bits, 1 - 1e-9)
+        estimate = round(-self.n_bits / self.n_hashes * math.log(1 - fill))
+        self.count = max(self.count, count, min(estimate, self.capacity))
+
+
+def hash_id(id_: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(id_.encode("utf-8"), digest_size=16).digest()
+    # The second hash is odd, so that the positions don't repeat within a filter.
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class SeenFilter:
+    """
+    Scalable Bloom filter of post IDs. Thread-safe.
+    Args:
+        capacity: number of IDs of the first bit array.
+        error_rate: false positive rate of the first bit array.
+    """
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.layers = [BloomFilter(capacity, error_rate)]
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __contains__(self, id_: str) -> bool:
+        h1, h2 = hash_id(id_)
+        with self._lock:
+            return any(layer.contains(h1, h2) for layer in self.layers)
+
+    def add_many(self, id_list: list[str]) -> int:
+        """
+        Returns:
+            number of IDs not seen before.
+        """
+        hashes = [hash_id(id_) for id_ in id_list]
+        n_added = 0
+        with self._lock:
+            for h1, h2 in hashes:
+                if any(layer.contains(h1, h2) for layer in self.layers):
+                    continue
+                last = self.layers[-1]
+                if last.count >= last.capacity:
+                    last = BloomFilter(last.capacity * 2, last.error_rate / 2)
+                    self.layers.append(last)
+                last.add(h1, h2)
+                n_added += 1
+            self.dirty = self.dirty or n_added > 0
+        return n_added
+
+    def __len__(self) -> int:
+        return sum(layer.count for layer in self.layers)
+
+    def merge(self, layers: list[tuple[float, float, int, bytes]]) -> list[tuple]:
+        """
+        Add the IDs of another filter of the same "capacity" and "error_rate".
+        Args:
+            layers: (capacity, error_rate, count, bits) of each bit array.
+        Returns:
+            (capacity, error_rate, count, bits) of each bit array after merging.
+        """
+        with self._lock:
+            for i, (capacity, error_rate, count, bits) in enumerate(layers):
+                if i < len(self.layers):
+                    self.layers[i].merge(bits, count)
+                else:
+                    self.layers.append(BloomFilter(capacity, error_rate, bytearray(bits),
+                                                   count))
+            self.dirty = False
+            return [(layer.capacity, layer.error_rate, layer.count, bytes(layer.bits))
+                    for layer in self.layers]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ids": sum(layer.count for layer in self.layers),
+                "layers": len(self.layers),
+                "bytes": sum(len(layer.bits) for layer in self.layers),
+                # Probability that a new post is taken as seen, at the current fill.
+                "false_positive_rate": 1 - math.prod(
+                    1 - (1 - math.exp(-layer.n_hashes * layer.count / layer.n_bits))
+                    ** layer.n_hashes for layer in self.layers),
+            }
+
+
+class SeenStore:
+    """
+    Seen filters of agent profiles, one row per bit array in the SQLite database. They are
+    saved at most once per "save_interval" seconds when changed, and when the store is
+    closed. Saving merges the filter with the saved one in one transaction, which also
+    brings in the IDs added by other processes.
+    """
+    def __init__(self, path: str = seen_path, save_interval: float = 5,
+                 capacity: int = 100_000, error_rate: float = 0.001):
+        self.path = path
+        self.save_interval = save_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filters = {}
+        self._saved_at = {}
+        self._lock = threading.Lock()
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS seen_layer (
+                profile TEXT NOT NULL,
+                layer INTEGER NOT NULL,
+                capacity INTEGER NOT NULL,
+                error_rate REAL NOT NULL,
+                count INTEGER NOT NULL,
+                bits BLOB NOT NULL,
+                PRIMARY KEY (profile, layer)
+            );
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def _layers(self, conn: sqlite3.Connection, profile: str) -> list[tuple]:
+        return conn.execute(
+            "SELECT capacity, error_rate, count, bits FROM seen_layer WHERE profile = ? "
+            "ORDER BY layer", (profile,)).fetchall()
+
+    def _load(self, profile: str) -> SeenFilter:
+        layers = self._layers(self._connect(), profile)
+        if layers:
+            seen = SeenFilter(layers[0][0], layers[0][1])
+            seen.layers = [BloomFilter(capacity, error_rate, bytearray(bits), count)
+                           for capacity, error_rate, count, bits in layers]
+            return seen
+        return SeenFilter(self.capacity, self.error_rate)
+
+    def get(self, profile: str = "") -> SeenFilter:
+        """
+        Args:
+            profile: name of the agent profile, ASCII letters, digits, "_" and "-".
+            Empty for "default".
+        """
+        profile = profile or "default"
+        assert re.fullmatch(r"[A-Za-z0-9_-]{1,64}", profile), \
+            "Profile must be 1 to 64 ASCII letters, digits, \"_\" or \"-\"."
+        with self._lock:
+            seen = self.filters.get(profile)
+            if seen is None:
+                seen = self.filters[profile] = self._load(profile)
+                self._saved_at[profile] = time.monotonic()
+        return seen
+
+    def add(self, profile: str, id_list: list[str]):
+        """
+        Record the posts returned to the profile.
+        """
+        seen = self.get(profile)
+        if not seen.add_many(id_list):
+            return
+        profile = profile or "default"
+        if time.monotonic() - self._saved_at[profile] >= self.save_interval:
+            self._saved_at[profile] = time.monotonic()
+            self.save(profile)
+
+    def save(self, profile: str):
+        seen = self.get(profile)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            layers = seen.merge(self._layers(conn, profile or "default"))
+            conn.executemany(
+                "INSERT INTO seen_layer (profile, layer, capacity, error_rate, count, bits) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (profile, layer) DO UPDATE SET "
+                "count = excluded.count, bits = excluded.bits",
+                [(profile or "default", i, *layer) for i, layer in enumerate(layers)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            seen.dirty = True
+            raise
+
+    def close(self):
+        with self._lock:
+            filters = dict(self.filters)
+        for profile, seen in filters.items():
+            if seen.dirty:
+                self.save(profile)
+
+    def stats(self) -> dict:
+        with self._lock:
+            filters = dict(self.filters)
+        return {profile: seen.stats() for profile, seen in filters.items()}
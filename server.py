@@ -2,18 +2,38 @@ import json
 import logging
 import os
 import sys
+import threading
+import time
+from argparse import ArgumentParser
+from functools import partial
 
-from mcp.server.fastmcp import FastMCP
-from requests import Session
+import anyio
+import uvicorn
+from mcp.server.fastmcp import Context, FastMCP, Image
+from starlette.responses import JSONResponse
 
-from cookies import load_cookies
-from get_data import feed_first_page, feed_subsequent_page, search_page, get_details_
+from accounts import AccountPool
+from cache import DetailCache, MemoryCache
+from cookies import cookies_dir, cookies_path
+import get_data
+import metrics
+import rate_limit
+from feed_session import FeedSessionStore
+from get_data import feed_pages, search_pages, search_many as search_many_, get_details_
+from image_store import ImageStore
+from jobs import JobKind, JobQueue, ResultKind
+from note_index import NoteIndex
+from output import Layout, dumps, encode_posts
+from prefetch import Prefetcher
+from seen_filter import SeenStore
+from transport import HostConfig, Transport
 
 # %% Logging system.
 logging.basicConfig(
     level=logging.INFO,
     format="[%(levelname)s] %(message)s",
-    stream=sys.stdout,
+    # stdout carries MCP messages in stdio mode.
+    stream=sys.stderr,
 )
 error_handler = logging.Logger(name="Error", level=logging.ERROR)
 error_handler.addHandler(logging.StreamHandler(sys.stderr))
@@ -29,13 +49,292 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 sys.excepthook = handle_exception
 
 # %% Initial definitions.
+parser = ArgumentParser()
+parser.add_argument("--detail_workers", type=int, default=4,
+                    help="Number of posts fetched at the same time in \"get_details\".")
+parser.add_argument("--cache_ttl", type=float, default=86400,
+                    help="Seconds that a cached post detail stays valid.")
+parser.add_argument("--cache_max_mb", type=float, default=256,
+                    help="Maximum size of the post detail cache.")
+parser.add_argument("--image_store_max_mb", type=float, default=1024,
+                    help="Maximum size of the images and thumbnails kept by \"get_images\".")
+parser.add_argument("--image_max_mb", type=float, default=20,
+                    help="Maximum size of each image downloaded by \"get_images\".")
+parser.add_argument("--image_workers", type=int, default=8,
+                    help="Number of images downloaded at the same time.")
+parser.add_argument("--job_workers", type=int, default=2,
+                    help="Number of requests of background jobs (\"submit_job\") run at "
+                         "the same time. 0 means that this server only queues jobs, to be "
+                         "run by another server process in the same folder.")
+parser.add_argument("--search_workers", type=int, default=3,
+                    help="Number of searching result pages requested at the same time.")
+parser.add_argument("--deadline", type=float, default=60,
+                    help="Seconds that a tool call may take to fetch from the website. "
+                         "After that, the tool returns the results fetched so far, and "
+                         "the rest are reported as failures.")
+parser.add_argument("--max_pages", type=int, default=20,
+                    help="Maximum number of pages that \"get_feed\" and \"search\" fetch "
+                         "to find \"new_posts\" posts.")
+parser.add_argument("--search_cache_ttl", type=float, default=60,
+                    help="Seconds that a searching result page is reused. 0 means "
+                         "disabled.")
+parser.add_argument("--prefetch", type=int, default=0,
+                    help="After \"search\" and \"get_feed\", prefetch the details of this "
+                         "number of top posts in background. 0 means disabled.")
+parser.add_argument("--http2", action="store_true",
+                    help="Connect to the website with httpx and HTTP/2.")
+parser.add_argument("--cookies_path", default=cookies_path,
+                    help="Path of the cookies file made by cookies.py, used if there is no "
+                         "account in \"--cookies_dir\".")
+parser.add_argument("--cookies_dir", default=cookies_dir,
+                    help="Folder of cookies files, one file per account. Requests are "
+                         "spread over the accounts, and files are reloaded when changed.")
+parser.add_argument("--metrics", action="store_true",
+                    help="Measure the time of each stage in tool calls, available as MCP "
+                         "resource \"stats://metrics\".")
+parser.add_argument("--prometheus_file", default="",
+                    help="Also write the metrics to this Prometheus text file every 15 "
+                         "seconds. Implies \"--metrics\".")
+parser.add_argument("--origin", default="",
+                    help="Send all requests to this origin instead of xiaohongshu.com, such "
+                         "as a local stand-in server (benchmarks/replay_server.py).")
+parser.add_argument("--html_rate", type=float, default=0,
+                    help="Requests per second of each account to pages of the website. 0 "
+                         "keeps the default policy in rate_limit.py.")
+parser.add_argument("--api_rate", type=float, default=0,
+                    help="Requests per second of each account to APIs of the website. 0 "
+                         "keeps the default policy in rate_limit.py.")
+parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio",
+                    help="\"stdio\" serves the MCP client launching this process. "
+                         "\"streamable-http\" keeps running and serves many MCP clients "
+                         "at http://HOST:PORT/mcp, which share connections, caches, rate "
+                         "limits and accounts.")
+parser.add_argument("--host", default="127.0.0.1",
+                    help="Listening address in streamable-http mode.")
+parser.add_argument("--port", type=int, default=8000,
+                    help="Listening port in streamable-http mode.")
+parser.add_argument("--max_concurrent_calls", type=int, default=16,
+                    help="Number of tool calls fetching from the website at the same time. "
+                         "Further calls wait.")
+parser.add_argument("--max_waiting_calls", type=int, default=64,
+                    help="Number of tool calls that may wait. Further calls fail at once "
+                         "with a \"server is busy\" error.")
+parser.add_argument("--shutdown_timeout", type=float, default=30,
+                    help="Seconds that tool calls in progress may take to finish after "
+                         "SIGINT or SIGTERM in streamable-http mode.")
+cmd, _ = parser.parse_known_args()
+
 os.makedirs("raw", exist_ok=True)
-mcp = FastMCP("rednote-assistant")
+for kind, rate in (("html", cmd.html_rate), ("api", cmd.api_rate)):
+    if rate > 0:
+        rate_limit.policies[kind].update(rate=rate, burst=2 * rate)
+if cmd.metrics or cmd.prometheus_file:
+    metrics.enable()
+if cmd.prometheus_file:
+    metrics.export_prometheus_periodically(cmd.prometheus_file)
+mcp = FastMCP("rednote-assistant", host=cmd.host, port=cmd.port)
+start_time = time.time()
+# Tool calls fetching from the website, shared by all clients in streamable-http mode.
+# A cancelled call keeps its token until its worker thread stops.
+calls_limiter = anyio.CapacityLimiter(cmd.max_concurrent_calls)
+# Worker threads of the tool calls.
+threads_limiter = anyio.CapacityLimiter(cmd.max_concurrent_calls)
+# Set when the server is shutting down in streamable-http mode.
+draining = threading.Event()
 with open("role_introduction") as f:
     role = f.read()
-cookies = load_cookies()
+# Passed to get_data in place of cookies; each request uses one of the accounts.
+accounts = AccountPool(directory=cmd.cookies_dir, fallback_path=cmd.cookies_path)
+detail_workers = cmd.detail_workers
+detail_cache = DetailCache(ttl=cmd.cache_ttl,
+                           max_bytes=int(cmd.cache_max_mb * 1024 * 1024))
+search_cache = MemoryCache(ttl=cmd.search_cache_ttl) if cmd.search_cache_ttl > 0 else None
+if cmd.origin:
+    get_data.www_origin = get_data.edith_origin = cmd.origin
+    transport_hosts = {cmd.origin: HostConfig(pool_size=16)}
+else:
+    transport_hosts = None
+# Shared by all tool calls, so that connections are kept alive across calls.
+transport = Transport(hosts=transport_hosts, http2=cmd.http2)
+transport.warm_up()
+# Signing is initialized lazily; prepare it in background before the first tool call.
+threading.Thread(target=get_data.get_signer, name="signer", daemon=True).start()
+feed_sessions = FeedSessionStore()
+# Every post fetched is also kept in the local full-text index for "local_search".
+note_index = NoteIndex()
+prefetcher = Prefetcher(transport, accounts, detail_cache, note_index) \
+    if cmd.prefetch > 0 else None
+image_store = ImageStore(
+    transport, max_bytes=int(cmd.image_store_max_mb * 1024 * 1024),
+    max_workers=cmd.image_workers,
+    headers={"user-agent": get_data.header_explore['user-agent'],
+             "referer": "https://www.xiaohongshu.com/"},
+    origins=[cmd.origin] if cmd.origin else None,
+    max_image_bytes=int(cmd.image_max_mb * 1024 * 1024))
+# IDs of the posts returned to each agent profile, for "unseen_only".
+seen_store = SeenStore()
+# Jobs left unfinished by the last run of the server continue at once.
+job_queue = JobQueue(transport, accounts, workers=cmd.job_workers, cache=detail_cache,
+                     index=note_index)
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run network requests, signing and parsing in a worker thread, so that the event loop
+    keeps serving other tool calls. When the tool call is cancelled by the client, the
+    worker stops before its next request.
+    At most "--max_concurrent_calls" calls run at the same time, counting cancelled calls
+    until their workers stop, and at most "--max_waiting_calls" wait for them.
+    """
+    if draining.is_set():
+        raise Exception("The server is shutting down. Try again later.")
+    if calls_limiter.statistics().tasks_waiting >= cmd.max_waiting_calls:
+        metrics.count("rejected", "busy")
+        raise Exception("The server is busy. Try again later.")
+    cancel = threading.Event()
+    finished = threading.Event()
+
+    def run():
+        try:
+            return func(*args, cancel=cancel, **kwargs)
+        finally:
+            finished.set()
+
+    async with calls_limiter:
+        try:
+            # Abandoned on cancellation, so that "cancel" is set at once instead of after
+            # the worker returns.
+            return await anyio.to_thread.run_sync(run, abandon_on_cancel=True,
+                                                  limiter=threads_limiter)
+        except anyio.get_cancelled_exc_class():
+            cancel.set()
+            with anyio.CancelScope(shield=True):
+                while not finished.is_set():
+                    await anyio.sleep(0.05)
+            raise
+
+
+class PageStream:
+    """
+    "on_page" callback of feed_pages and search_pages, called in the worker thread. If the
+    MCP client asks for progress (with a progress token), the new posts of each page are
+    sent at once as a progress notification, whose message is JSON {"page", "posts"}.
+    Args:
+        ctx: context of the tool call.
+        pages: number of pages requested.
+        n_kept: number of the first posts kept in "kept", such as for the prefetch.
+        profile: agent profile to whose seen filter the posts sent are added.
+    """
+    def __init__(self, ctx: Context | None, pages: int, fields: list[str] | None,
+                 layout: Layout, n_kept: int = 0, profile: str = ""):
+        meta = ctx.request_context.meta if ctx is not None else None
+        self.enabled = meta is not None and meta.progressToken is not None
+        self.ctx = ctx
+        self.pages = pages
+        self.fields = fields
+        self.layout = layout
+        self.n_kept = n_kept
+        self.profile = profile
+        self.kept = []
+        self.n_posts = 0
+
+    def __call__(self, page: int, posts: list[dict]):
+        self.n_posts += len(posts)
+        self.kept += posts[:max(0, self.n_kept - len(self.kept))]
+        if not self.enabled:
+            return
+        message = dumps({"page": page, "posts": encode_posts(posts, self.fields,
+                                                             self.layout)})
+        try:
+            anyio.from_thread.run(partial(self.ctx.report_progress, page, self.pages,
+                                          message))
+        except Exception as e:
+            # Such as when the client is disconnected; the pages are still returned.
+            logging.warning(f"Fail to send progress notification. {type(e).__name__}: {e}")
+            self.enabled = False
+            return
+        seen_store.add(self.profile, [post['id'] for post in posts])
+
+
+def close():
+    """
+    Release the resources shared by tool calls after the server stops.
+    """
+    if prefetcher is not None:
+        prefetcher.close()
+    job_queue.close()
+    seen_store.close()
+    image_store.close()
+    transport.close()
+
+
+class HTTPServer(uvicorn.Server):
+    """
+    On the first SIGINT or SIGTERM, new tool calls are refused and "/health" reports
+    "shutting_down", but connections stay open, so that the tool calls in progress finish
+    and their clients receive the results. The server shuts down when they are finished
+    or after "--shutdown_timeout" seconds, or at once on a second signal.
+    """
+    drain_started = None
+
+    def handle_exit(self, sig, frame):
+        if self.drain_started is not None:
+            super().handle_exit(sig, frame)
+            return
+        self.drain_started = time.monotonic()
+        draining.set()
+        logging.info("Shut down after the tool calls in progress.")
+
+    async def on_tick(self, counter: int) -> bool:
+        if await super().on_tick(counter):
+            return True
+        if self.drain_started is None:
+            return False
+        limiter_stats = calls_limiter.statistics()
+        if limiter_stats.borrowed_tokens == 0 and limiter_stats.tasks_waiting == 0:
+            return True
+        return time.monotonic() > self.drain_started + cmd.shutdown_timeout
+
+
+def serve_http():
+    """
+    Serve MCP clients over streamable HTTP until SIGINT or SIGTERM.
+    """
+    # Tool calls are finished before uvicorn shuts down, so only idle connections and
+    # notification streams are left to close.
+    config = uvicorn.Config(mcp.streamable_http_app(), host=cmd.host, port=cmd.port,
+                            timeout_graceful_shutdown=1, log_level="warning")
+    logging.info(f"Serve MCP clients at http://{cmd.host}:{cmd.port}"
+                 f"{mcp.settings.streamable_http_path}")
+    HTTPServer(config).run()
+
 
 # %% API.
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request):
+    """
+    Health check in streamable-http mode. The status code is 503 when no account is
+    usable or the server is shutting down.
+    """
+    # Reading the cookies files blocks, so it's done in a worker thread.
+    await anyio.to_thread.run_sync(accounts.reload)
+    account_stats = accounts.stats()
+    usable = sum(account["usable"] for account in account_stats.values())
+    if draining.is_set():
+        status = "shutting_down"
+    elif not usable:
+        status = "no_usable_account"
+    else:
+        status = "ok"
+    limiter_stats = calls_limiter.statistics()
+    return JSONResponse({
+        "status": status,
+        "uptime": time.time() - start_time,
+        "accounts": {"usable": usable, "total": len(account_stats)},
+        "calls": {"running": limiter_stats.borrowed_tokens,
+                  "waiting": limiter_stats.tasks_waiting},
+    }, status_code=200 if status == "ok" else 503)
+
+
 @mcp.prompt()
 def rednote_assistant_general_workflow():
     """
@@ -44,8 +343,113 @@ def rednote_assistant_general_workflow():
     return role
 
 
+@mcp.resource("stats://cache")
+def cache_stats():
+    """
+    Hit and miss counters of the post detail cache of this server process, and the size
+    of the cache shared by all processes.
+    """
+    return json.dumps(detail_cache.stats())
+
+
+@mcp.resource("stats://retries")
+def retry_stats():
+    """
+    Number of requests, retries and hedged requests, and retries denied by the retry
+    budget; recent latency of post details, which decides when a request is hedged.
+    """
+    return json.dumps(dict(
+        get_data.retry_budget.stats(),
+        detail_p50=get_data.detail_latency.percentile(0.5),
+        detail_hedge_after=get_data.detail_latency.percentile(get_data.hedge_percentile),
+    ))
+
+
+@mcp.resource("stats://coalescing")
+def coalescing_stats():
+    """
+    Number of requests sent and coalesced (served by an identical request in flight) for
+    each endpoint, and hits and misses of the searching result page cache.
+    """
+    return json.dumps({
+        "singleflight": get_data.flights.stats(),
+        "search_cache": search_cache.stats() if search_cache is not None else None,
+    })
+
+
+@mcp.resource("stats://rate_limit")
+def rate_limit_stats():
+    """
+    For each account: whether it's usable (not expired, not rejected by the website
+    recently), and the current request rate, number of requests and errors, and total
+    waiting time of each class of endpoints ("html" pages and "api" of the website).
+    """
+    return json.dumps(accounts.stats())
+
+
+@mcp.resource("stats://local_index")
+def local_index_stats():
+    """
+    Number of posts and distinct labels in the local full-text index.
+    """
+    return json.dumps(note_index.stats())
+
+
+@mcp.resource("stats://prefetch")
+def prefetch_stats():
+    """
+    Number of posts submitted, fetched, failed and dropped by the background prefetch, and
+    how many prefetched posts are later requested by "get_details".
+    """
+    if prefetcher is None:
+        return json.dumps({"enabled": False})
+    return json.dumps(dict(prefetcher.stats(), enabled=True))
+
+
+@mcp.resource("stats://images")
+def image_stats():
+    """
+    Number of images served from the image store and downloaded, downloads whose content
+    was already stored under another URL, thumbnails made, evictions and failures; the
+    size of the store.
+    """
+    return json.dumps(image_store.stats())
+
+
+@mcp.resource("stats://seen")
+def seen_stats():
+    """
+    For each agent profile used since the server started: the number of post IDs in its
+    seen filter, the size of the filter, and the probability that a new post is taken
+    as seen by "unseen_only".
+    """
+    return json.dumps(seen_store.stats())
+
+
+@mcp.resource("stats://jobs")
+def job_stats():
+    """
+    Number of background jobs and their tasks in each status, and the tasks done and
+    the errors (each retried up to 3 times) since the server started.
+    """
+    return json.dumps(job_queue.stats())
+
+
+@mcp.resource("stats://metrics")
+def hot_path_metrics():
+    """
+    Histograms of the time of each stage (sign, wait, http, parse, encode) for each
+    endpoint, and counters of downloaded bytes, fetched pages and cache hits. Only
+    collected when the server is started with "--metrics".
+    """
+    return json.dumps(metrics.snapshot())
+
+
 @mcp.tool()
-def get_feed(pages: int):
+async def get_feed(pages: int, handle: str = "", fields: list[str] | None = None,
+                   layout: Layout = "records", stream: bool = False,
+                   unseen_only: bool = False, new_posts: int = 0, profile: str = "",
+                   ctx: Context | None = None):
     """
     Retrieves recommended posts for the home page, personalized according to user
     preferences. Each calling may fetch different results, because the server may
@@ -54,37 +458,81 @@ def get_feed(pages: int):
     Args:
         pages: integer, number of pages. The first page has 39 posts, and each subsequent
         pages has 15 records.
+        handle: string, optional. The "handle" returned by a previous call. If provided,
+        continue browsing from where that call stopped, and skip the posts already
+        returned. Otherwise, start from the home page.
+        fields: list of string, optional. Columns of "posts" to return, such as
+        ["id", "xsec_token", "title"]. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
+        stream: boolean, optional. The posts of each page are always sent as a progress
+        notification if the client asks for progress. If true and the client asks for
+        progress, they are only sent that way and "posts" is empty, so that many pages
+        can be fetched with little memory.
+        unseen_only: boolean, optional. If true, skip the posts already returned to
+        "profile" by earlier calls of "get_feed", "search" or "search_many", also before
+        the server restarted. Rarely (less than 1 in 500), a new post is taken as
+        returned and skipped.
+        new_posts: integer, optional. If fewer posts than this are found in "pages"
+        pages (such as when most are skipped by "unseen_only"), continue to fetch pages
+        until there are, up to the server's limit of pages.
+        profile: string, optional. Name of the agent or task (letters, digits, "_" and
+        "-") whose returned posts are remembered separately. The posts returned are
+        always remembered for "unseen_only" of later calls.
     Returns:
-        JSON format of table of recommended posts with the following columns.
-            id: Post unique identifier
-            xsec_token: Token for accessing detailed content
-            title: Post title
-            cover_median_url: Medium-sized cover image URL
-            user_id: Author's unique identifier (not useful)
-            user_name: Author's nickname (not useful)
-            user_xsec_token: Token for author's homepage (not useful)
+        JSON format of an object with the following keys.
+            handle: Pass it to the next call to get more posts.
+            posts: table of recommended posts with the following columns.
+                id: Post unique identifier
+                xsec_token: Token for accessing detailed content
+                title: Post title
+                cover_median_url: Medium-sized cover image URL
+                user_id: Author's unique identifier (not useful)
+                user_name: Author's nickname (not useful)
+                user_xsec_token: Token for author's homepage (not useful)
+            failures: list of the pages that failed, with keys "page" and "error".
+            Empty if all pages are fetched; the posts of earlier pages are still
+            returned.
+            streamed: number of posts sent as progress notifications.
     """
     assert pages >= 1, "Number of pages must be a positive integer."
+    assert new_posts >= 0, "Number of new posts must not be negative."
 
-    session = Session()
-    posts = feed_first_page(session, cookies)
-    if pages == 1:
-        return json.dumps(posts)
-    cursor_score = ""
-    for page in range(1, pages):
-        new_posts, cursor_score = feed_subsequent_page(
-            session=session,
-            cookies=cookies,
-            note_index=len(posts) - 1,
-            page=page,
-            cursor_score=cursor_score
-        )
-        posts += new_posts
-    return json.dumps(posts)
+    seen = await anyio.to_thread.run_sync(seen_store.get, profile)
+    max_pages = max(pages, cmd.max_pages) if new_posts else pages
+    state = await anyio.to_thread.run_sync(feed_sessions.get, handle) if handle else None
+    if state is None:
+        if handle:
+            logging.warning(f"Feed session {handle} doesn't exist or is expired.")
+        state = feed_sessions.create()
+    failures = []
+    on_page = PageStream(ctx, max_pages, fields, layout, cmd.prefetch, profile)
+    try:
+        posts = await run_blocking(feed_pages, transport, accounts, pages, state=state,
+                                   deadline=cmd.deadline, failures=failures,
+                                   on_page=on_page,
+                                   collect=not (stream and on_page.enabled),
+                                   seen=seen if unseen_only else None,
+                                   min_posts=new_posts, max_pages=max_pages)
+    finally:
+        # Pages fetched before an error or cancellation are still recorded.
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(feed_sessions.save, state)
+    await anyio.to_thread.run_sync(seen_store.add, profile, [post['id'] for post in posts])
+    if prefetcher is not None:
+        await anyio.to_thread.run_sync(prefetcher.submit, on_page.kept, cmd.prefetch)
+    with metrics.span("encode", "get_feed"):
+        return dumps({"handle": state.handle,
+                      "posts": encode_posts(posts, fields, layout),
+                      "failures": failures,
+                      "streamed": on_page.n_posts if on_page.enabled else 0})
 
 
 @mcp.tool()
-def search(query: str, pages: int):
+async def search(query: str, pages: int, fields: list[str] | None = None,
+                 layout: Layout = "records", stream: bool = False,
+                 unseen_only: bool = False, new_posts: int = 0, profile: str = "",
+                 ctx: Context | None = None):
     """
     Search posts by keyword or query terms. Use this function when you want to find posts
     on specific topics or keywords.
@@ -93,28 +541,104 @@ def search(query: str, pages: int):
         pages: integer, number of pages. Each page returns 20 posts. The number of pages
         returned may be less than this value, which usually mean there are not enough
         searching results.
+        fields: list of string, optional. Columns of the posts to return, such as
+        ["id", "xsec_token", "title"]. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
+        stream: boolean, optional. The posts of each page are always sent as a progress
+        notification if the client asks for progress. If true and the client asks for
+        progress, they are only sent that way and "posts" is empty, so that many pages
+        can be fetched with little memory.
+        unseen_only: boolean, optional. If true, skip the posts already returned to
+        "profile" by earlier calls of "get_feed", "search" or "search_many", also before
+        the server restarted. Rarely (less than 1 in 500), a new post is taken as
+        returned and skipped.
+        new_posts: integer, optional. If fewer posts than this are found in "pages"
+        pages (such as when most are skipped by "unseen_only"), continue to fetch pages
+        until there are, up to the server's limit of pages.
+        profile: string, optional. Name of the agent or task (letters, digits, "_" and
+        "-") whose returned posts are remembered separately. The posts returned are
+        always remembered for "unseen_only" of later calls.
     Returns:
-        JSON format of table of searching results (posts) with the following columns.
-            id: Post unique identifier
-            xsec_token: Token for accessing detailed content
-            title: Post title
-            cover_median_url: Medium-sized cover image URL
-            user_id: Author's unique identifier (not useful)
-            user_name: Author's nickname (not useful)
-            user_xsec_token: Token for author's homepage (not useful)
-    """
-    session = Session()
-    posts = []
-    for page in range(pages):
-        new_posts, has_more = search_page(session, cookies, query, page)
-        posts += new_posts
-        if not has_more:
-            break
-    return json.dumps(posts)
+        JSON format of an object with the following keys.
+            posts: table of searching results with the following columns.
+                id: Post unique identifier
+                xsec_token: Token for accessing detailed content
+                title: Post title
+                cover_median_url: Medium-sized cover image URL
+                user_id: Author's unique identifier (not useful)
+                user_name: Author's nickname (not useful)
+                user_xsec_token: Token for author's homepage (not useful)
+            failures: list of the pages that failed, with keys "page" (starts from 1)
+            and "error". Empty if all pages are fetched; the posts of the other pages
+            are still returned.
+            streamed: number of posts sent as progress notifications.
+    """
+    assert new_posts >= 0, "Number of new posts must not be negative."
+    seen = await anyio.to_thread.run_sync(seen_store.get, profile)
+    max_pages = max(pages, cmd.max_pages) if new_posts else pages
+    failures = []
+    on_page = PageStream(ctx, max_pages, fields, layout, cmd.prefetch, profile)
+    posts = await run_blocking(search_pages, transport, accounts, query, pages,
+                               max_workers=cmd.search_workers, cache=search_cache,
+                               deadline=cmd.deadline, failures=failures,
+                               on_page=on_page, collect=not (stream and on_page.enabled),
+                               seen=seen if unseen_only else None, min_posts=new_posts,
+                               max_pages=max_pages)
+    await anyio.to_thread.run_sync(seen_store.add, profile, [post['id'] for post in posts])
+    if prefetcher is not None:
+        await anyio.to_thread.run_sync(prefetcher.submit, on_page.kept, cmd.prefetch)
+    with metrics.span("encode", "search"):
+        return dumps({"posts": encode_posts(posts, fields, layout), "failures": failures,
+                      "streamed": on_page.n_posts if on_page.enabled else 0})
 
 
 @mcp.tool()
-def get_details(id_list: list[str], xsec_token_list: list[str]):
+async def search_many(queries: list[str], pages: int, fields: list[str] | None = None,
+                      layout: Layout = "records", unseen_only: bool = False,
+                      profile: str = ""):
+    """
+    Search several queries in one call, such as a brand with each of its products. Use
+    this function instead of calling "search" repeatedly for related keywords.
+    Args:
+        queries: list of string, the inputs to the searching box.
+        pages: integer, number of pages of each query. Each page returns 20 posts.
+        fields: list of string, optional. Columns of the posts to return, such as
+        ["id", "xsec_token", "title"]. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
+        unseen_only: boolean, optional. The same as in "search".
+        profile: string, optional. The same as in "search".
+    Returns:
+        JSON format of an object with the following keys.
+            results: list of the searching results of each query, with keys "query",
+            "status" ("ok", "partial" if some pages failed, or "error" if all pages
+            failed), "posts" and "failures" (the same as the result of "search").
+            merged: table of posts of all queries without duplicates, with the same
+            columns as the result of "search", and "queries": the queries that matched
+            the post.
+    """
+    assert queries, "At least one query is required."
+    seen = await anyio.to_thread.run_sync(seen_store.get, profile)
+    result = await run_blocking(search_many_, transport, accounts, queries, pages,
+                                max_workers=cmd.search_workers, cache=search_cache,
+                                deadline=cmd.deadline, seen=seen if unseen_only else None)
+    await anyio.to_thread.run_sync(seen_store.add, profile,
+                                   [post['id'] for post in result['merged']])
+    if prefetcher is not None:
+        await anyio.to_thread.run_sync(prefetcher.submit, result['merged'], cmd.prefetch)
+    with metrics.span("encode", "search_many"):
+        for query_result in result['results']:
+            query_result['posts'] = encode_posts(query_result['posts'], fields, layout)
+        if fields and "queries" not in fields:
+            fields = fields + ["queries"]
+        result['merged'] = encode_posts(result['merged'], fields, layout)
+        return dumps(result)
+
+
+@mcp.tool()
+async def get_details(id_list: list[str], xsec_token_list: list[str],
+                      fields: list[str] | None = None, layout: Layout = "records"):
     """
     Retrieves detailed content of a list of posts, identified by the list of "id" and
     the corresponding list of "xsec_token". Use this function to access complete post
@@ -123,6 +647,10 @@ def get_details(id_list: list[str], xsec_token_list: list[str]):
         id_list: list of string, the list of post IDs.
         xsec_token_list: list of string, the list of access tokens corresponding to the
         post IDs.
+        fields: list of string, optional. Columns of the posts to return, such as
+        ["id", "title", "published_time"]. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
     Returns:
         JSON format of detailed content of the requested posts with the following columns.
             url: URL link of the post
@@ -132,11 +660,191 @@ def get_details(id_list: list[str], xsec_token_list: list[str]):
             labels: Topic labels categorizing the post
             published_time: The time when the post is published
             location: The location of the author when publishing the post
+            id: Post unique identifier
+            status: "ok" if fetched, "not_found" if the post doesn't exist, "error" if
+            failed to fetch, "timeout" if not fetched in time (the reason is in "error"
+            column). Only "id" and "status" are available for posts which are not "ok".
+            Try the posts with "error" or "timeout" again later if needed.
+    """
+    if prefetcher is not None:
+        prefetcher.claim(id_list)
+    posts = await run_blocking(get_details_, transport, accounts, id_list,
+                               xsec_token_list, max_workers=detail_workers,
+                               cache=detail_cache, index=note_index,
+                               deadline=cmd.deadline)
+    with metrics.span("encode", "get_details"):
+        return dumps(encode_posts(posts, fields, layout))
+
+
+@mcp.tool()
+async def get_images(urls: list[str], max_side: int = 512, include_data: bool = True):
+    """
+    Download images of posts, such as "cover_median_url" of "search" and "get_feed", or
+    "images" of "get_details". Images are kept on this computer, so asking for the same
+    image again is fast and doesn't download it again.
+    Args:
+        urls: list of string, URLs of the images, which must be on the image hosts of
+        xiaohongshu.com (xhscdn.com).
+        max_side: integer, images are downscaled so that their width and height are at
+        most this number of pixels, which keeps them small. 0 for the original size.
+        include_data: boolean, whether to return the images themselves. If false, only
+        the paths of the image files on this computer are returned.
+    Returns:
+        JSON format of the images with the following columns, followed by the images with
+        status "ok" in the same order if "include_data" is true.
+            url: URL of the image
+            status: "ok" if downloaded, "error" if failed (the reason is in "error"
+            column)
+            path: path of the image file on this computer
+            hash: SHA-256 of the image file, the same for identical images
+            bytes: size of the image file
+            content_type: type of the image, such as "image/jpeg"
+            thumbnail: whether the image is downscaled
+    """
+    results = await run_blocking(image_store.get_many, urls, max_side,
+                                 include_data=include_data)
+    images = [Image(data=result.pop('data'), format=result['content_type'].split("/")[-1])
+              for result in results if 'data' in result]
+    return [dumps(results), *images] if images else dumps(results)
+
+
+@mcp.tool()
+async def submit_job(kind: JobKind, queries: list[str] | None = None, pages: int = 1,
+                     id_list: list[str] | None = None,
+                     xsec_token_list: list[str] | None = None, details: bool = False):
+    """
+    Start collecting many posts in background, for collections too large for one call of
+    "search", "get_feed" or "get_details", such as 50 pages of several queries with the
+    details of every post. It returns a job ID at once; check the progress with
+    "job_status" and read the posts with "job_results" while the job runs. Jobs continue
+    after the server restarts, without fetching finished pages or posts again.
+    Args:
+        kind: string, "search" for the first "pages" pages of each query of "queries",
+        "feed" for "pages" pages of the home feed, or "details" for the posts of "id_list"
+        and "xsec_token_list".
+        queries: list of string, the queries of a "search" job.
+        pages: integer, number of pages of each query, or of the home feed.
+        id_list: list of string, the post IDs of a "details" job.
+        xsec_token_list: list of string, the access tokens corresponding to "id_list".
+        details: boolean, for "search" and "feed" jobs, also fetch the details of every
+        post found.
+    Returns:
+        JSON format of an object with key "job_id".
+    """
+    job_id = await anyio.to_thread.run_sync(partial(
+        job_queue.submit, kind, queries, pages, id_list, xsec_token_list, details))
+    return dumps({"job_id": job_id})
+
+
+@mcp.tool()
+async def job_status(job_id: str = ""):
+    """
+    Progress of a job submitted by "submit_job".
+    Args:
+        job_id: string, the ID of the job. If empty, the status of the 20 latest jobs is
+        returned.
+    Returns:
+        JSON format of an object (or a list of them) with the following keys.
+            id, kind, params: the job and its parameters
+            status: "queued", "running", "done" or "cancelled"
+            tasks: number of requests of each type ("search", "feed" or "detail") in
+            each status: "pending", "running", "done", "failed" (after 3 attempts) or
+            "skipped" (pages after the last page of the results)
+            results: number of posts and post details found so far
+            errors: the latest errors of failed requests
+    """
+    if not job_id:
+        return dumps(await anyio.to_thread.run_sync(job_queue.recent))
+    status = await anyio.to_thread.run_sync(job_queue.status, job_id)
+    assert status is not None, f"Job {job_id} doesn't exist."
+    return dumps(status)
+
+
+@mcp.tool()
+async def job_results(job_id: str, kind: ResultKind = "posts", cursor: int = 0,
+                      limit: int = 100, fields: list[str] | None = None,
+                      layout: Layout = "records"):
+    """
+    Read the results of a job submitted by "submit_job", in pages. It can be called while
+    the job runs; call it again with "next_cursor" to read the following results.
+    Args:
+        job_id: string, the ID of the job.
+        kind: string, "posts" for the posts found by "search" and "feed" jobs (columns of
+        "search", and "query" for "search" jobs), or "details" for the details of posts
+        (columns of "get_details").
+        cursor: integer, 0 for the first page, or "next_cursor" of the previous call.
+        limit: integer, maximum number of posts.
+        fields: list of string, optional. Columns of the posts to return, such as
+        ["id", "title"], which both kinds have. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
+    Returns:
+        JSON format of an object with the following keys.
+            posts: table of posts.
+            next_cursor: pass it to the next call to read the following posts. If
+            "posts" is empty, all posts found so far are read; call again later if the
+            job is still running.
+    """
+    assert limit >= 1, "Limit must be a positive integer."
+    posts, next_cursor = await anyio.to_thread.run_sync(partial(
+        job_queue.results, job_id, kind, cursor, limit))
+    with metrics.span("encode", "job_results"):
+        return dumps({"posts": encode_posts(posts, fields, layout),
+                      "next_cursor": next_cursor})
+
+
+@mcp.tool()
+async def cancel_job(job_id: str):
+    """
+    Stop a job submitted by "submit_job". The results found so far are kept.
+    Args:
+        job_id: string, the ID of the job.
+    Returns:
+        JSON format of an object with key "cancelled", false if the job had already
+        finished or doesn't exist.
+    """
+    return dumps({"cancelled": await anyio.to_thread.run_sync(job_queue.cancel, job_id)})
+
+
+@mcp.tool()
+async def local_search(query: str = "", label: str = "", location: str = "",
+                       since: str = "", until: str = "", limit: int = 20,
+                       fields: list[str] | None = None, layout: Layout = "records"):
+    """
+    Search posts whose details were read before by "get_details", without visiting the
+    website. It returns in milliseconds, so use it before "search" when researching a
+    topic again. The results are limited to posts read before, so use "search" if they
+    are not enough.
+    Args:
+        query: string, words that must appear in the title, description or labels,
+        separated by spaces. If empty, the latest posts matching the filters are
+        returned.
+        label: string, a topic label that the post must have, exactly.
+        location: string, part of the location of the author when publishing the post.
+        since: string, the earliest published time, such as "2024-05-01" or
+        "2024-05-01 08:00:00" (China Standard Time).
+        until: string, the latest published time, in the same format as "since".
+        limit: integer, maximum number of posts.
+        fields: list of string, optional. Columns of the posts to return, such as
+        ["id", "title", "published_time"]. All columns are returned if omitted.
+        layout: string, "records" (default) for a list of objects, or "table" for
+        {"columns": [...], "rows": [[...], ...]} which is shorter for many posts.
+    Returns:
+        JSON format of detailed content of the posts, most relevant first, with the same
+        columns as the result of "get_details" except "status".
     """
-    session = Session()
-    posts = get_details_(session, cookies, id_list, xsec_token_list)
-    return json.dumps(posts)
+    posts = await anyio.to_thread.run_sync(partial(
+        note_index.search, query, label=label, location=location, since=since,
+        until=until, limit=limit))
+    with metrics.span("encode", "local_search"):
+        return dumps(encode_posts(posts, fields, layout))
 
 
 if __name__ == '__main__':
-    mcp.run()
+    try:
+        if cmd.transport == "streamable-http":
+            serve_http()
+        else:
+            mcp.run()
+    finally:
+        close()
@@ -0,0 +1,89 @@
+"""
+Coalescing of identical requests in flight. When several tool calls (or agents) ask for
+the same post, searching result page or home page at the same moment, only the first one
+sends the request, and the others wait for it and share its parsed result, so that the
+rate budget isn't spent twice.
+"""
+import threading
+
+import metrics
+
+
+class Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Keys are tuples starting with the endpoint, such as ("detail", account, post ID).
+    Results are shared by all callers, so they must not be modified.
+    Args:
+        cancelled: exception raised when a tool call is cancelled. If the caller sending
+        the request is cancelled, the waiting callers try again instead of failing.
+    """
+    def __init__(self, cancelled: type[Exception]):
+        self.cancelled = cancelled
+        self.flights = {}
+        self.counters = {}  # endpoint -> {"requests", "coalesced"}
+        self._lock = threading.Lock()
+
+    def _count(self, endpoint: str, name: str):
+        counters = self.counters.setdefault(endpoint, {"requests": 0, "coalesced": 0})
+        counters[name] += 1
+
+    def do(self, key: tuple, func, cancel=None, lead: bool = True):
+        """
+        Call "func" without arguments, or wait for the call in flight with the same key.
+        Args:
+            cancel: threading.Event which is set when the tool call is cancelled, or
+            None. Only this caller stops waiting; the call in flight continues for the
+            others.
+            lead: whether this caller may send the request for others. Low-priority
+            callers (prefetch) join a call in flight, but don't make others wait for
+            them.
+        """
+        while True:
+            with self._lock:
+                flight = self.flights.get(key)
+                leader = flight is None and lead
+                if leader:
+                    flight = self.flights[key] = Flight()
+                if flight is None or leader:
+                    self._count(key[0], "requests")
+            if flight is None:
+                return func()
+            if leader:
+                try:
+                    flight.result = func()
+                    return flight.result
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self.flights[key]
+                    flight.done.set()
+            while not flight.done.wait(0.1):
+                if cancel is not None and cancel.is_set():
+                    raise self.cancelled("The tool call is cancelled.")
+            if isinstance(flight.error, self.cancelled):
+                continue
+            with self._lock:
+                self._count(key[0], "coalesced")
+            metrics.count("coalesced", key[0])
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self.flights),
+                "endpoints": {endpoint: dict(counters)
+                              for endpoint, counters in self.counters.items()},
+            }
@@ -0,0 +1,144 @@
+"""
+Offline tests of the size accounting of cache and image_store, which get images from the
+local stand-in server. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from benchmarks.replay_server import ReplayServer
+from cache import DetailCache, MemoryCache
+from image_store import ImageStore
+from transport import HostConfig, Transport
+
+
+def summed_size(path: str, table: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestDetailCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.path = os.path.join(self.temp_dir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_total_size(self):
+        cache = DetailCache(self.path)
+        cache.put("a", {"title": "x" * 100})
+        cache.put("b", {"title": "y"})
+        # Overwriting changes the size instead of adding to it.
+        cache.put("a", {"title": "x"})
+        self.assertEqual(cache.stats()["bytes"], summed_size(self.path, "detail"))
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.get("a"), {"title": "x"})
+        # The total is kept by another process opening the same file.
+        self.assertEqual(DetailCache(self.path).stats()["bytes"], cache.stats()["bytes"])
+
+    def test_evict(self):
+        cache = DetailCache(self.path, max_bytes=1000)
+        for i in range(30):
+            cache.put(str(i), {"text": "x" * 90})
+            time.sleep(0.001)
+        stats = cache.stats()
+        self.assertEqual(stats["bytes"], summed_size(self.path, "detail"))
+        self.assertLessEqual(stats["bytes"], 1000)
+        self.assertGreater(stats["evictions"], 0)
+        # Least recently used first.
+        self.assertTrue(cache.contains("29"))
+        self.assertFalse(cache.contains("0"))
+
+    def test_ttl(self):
+        cache = DetailCache(self.path, ttl=0.05, expire_interval=2)
+        cache.put("a", {})
+        self.assertTrue(cache.contains("a"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        # The next put removes expired posts.
+        cache.put("b", {})
+        cache.put("c", {})
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.stats()["bytes"], summed_size(self.path, "detail"))
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_max_entries(self):
+        cache = MemoryCache(max_entries=2)
+        for key in "abc":
+            cache.put(key, key)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual([cache.get("b"), cache.get("c")], ["b", "c"])
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=0.05)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestImageStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ReplayServer().start()
+        cls.transport = Transport(hosts={cls.server.origin: HostConfig(pool_size=4)})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.transport.close()
+        cls.server.stop()
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def new_store(self, **kwargs) -> ImageStore:
+        store = ImageStore(self.transport, directory=self.temp_dir.name,
+                           origins=[self.server.origin], **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def index_size(self) -> int:
+        return summed_size(os.path.join(self.temp_dir.name, "index.sqlite"), "image")
+
+    def test_total_size(self):
+        store = self.new_store()
+        urls = [f"{self.server.origin}/images/{i}.png" for i in range(5)]
+        results = store.get_many(urls + urls[:2])
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+        stats = store.stats()
+        self.assertEqual(stats["downloads"], 5)
+        self.assertEqual(stats["bytes"], self.index_size())
+        self.assertEqual(stats["bytes"], sum(
+            os.path.getsize(store.path(hash_)) for hash_ in {r["hash"] for r in results}))
+
+    def test_evict(self):
+        store = self.new_store()
+        url = f"{self.server.origin}/images/0.png"
+        image_bytes = store.get(url)["bytes"]
+        store.max_bytes = image_bytes * 3
+        for i in range(1, 10):
+            store.get(f"{self.server.origin}/images/{i}.png")
+        stats = store.stats()
+        self.assertLessEqual(stats["bytes"], store.max_bytes)
+        self.assertEqual(stats["bytes"], self.index_size())
+        self.assertGreater(stats["evictions"], 0)
+        # An evicted image is downloaded again.
+        downloads = stats["downloads"]
+        self.assertEqual(store.get(url)["bytes"], image_bytes)
+        self.assertEqual(store.stats()["downloads"], downloads + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
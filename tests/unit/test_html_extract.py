@@ -0,0 +1,105 @@
+"""
+Offline tests of html_extract. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import glob
+import os
+import unittest
+
+from benchmarks.fixtures import fixtures_dir
+from html_extract import (InitialStateScanner, find_initial_state, find_initial_state_span,
+                          find_og_images, js_object_to_json)
+
+page = ('<html><head><meta name="og:image" content="http://a.xhscdn.com/1.jpg">'
+        '<script>if(window.__INITIAL_STATE__){}</script></head><body>'
+        '<script>window.__INITIAL_STATE__ = {"a":1,"b":undefined,"c":"<\\/script>"}</script>'
+        '<script>var x = 1;</script></body></html>')
+
+
+def scan(html_content: str, chunk_size: int) -> InitialStateScanner:
+    data = html_content.encode("utf-8")
+    scanner = InitialStateScanner()
+    for i in range(0, len(data), chunk_size):
+        if scanner.feed(data[i:i + chunk_size]):
+            break
+    return scanner
+
+
+class TestFindInitialState(unittest.TestCase):
+    def test_assignment_after_other_use(self):
+        self.assertEqual(find_initial_state(page), {"a": 1, "b": None, "c": "</script>"})
+
+    def test_missing_script(self):
+        self.assertIsNone(find_initial_state("<html><script>var x = 1;</script></html>"))
+        self.assertIsNone(find_initial_state(
+            "<script>if(window.__INITIAL_STATE__){}</script>"))
+
+    def test_script_end_in_string(self):
+        # "</script>" can only appear escaped inside the script, as "<\/script>".
+        html_content = ('<script>window.__INITIAL_STATE__={"a":"x<\\/script>y"}</script>'
+                        '<script>{}</script>')
+        start, end = find_initial_state_span(html_content)
+        self.assertEqual(html_content[start:end], '{"a":"x<\\/script>y"}')
+
+    def test_fixtures(self):
+        paths = glob.glob(os.path.join(fixtures_dir, "*.html"))
+        self.assertTrue(paths)
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                html_content = f.read()
+            self.assertIsInstance(find_initial_state(html_content), dict, path)
+
+
+class TestInitialStateScanner(unittest.TestCase):
+    def test_every_chunk_size(self):
+        # Chunk boundaries fall inside the marker, the whitespace before "=" and
+        # "</script>".
+        end = page.index("</script>", page.index("= {")) + len("</script>")
+        for chunk_size in range(1, 40):
+            scanner = scan(page, chunk_size)
+            self.assertEqual(scanner.end, end, chunk_size)
+            text = bytes(scanner.data[:scanner.end]).decode("utf-8")
+            self.assertEqual(find_initial_state(text)["a"], 1, chunk_size)
+
+    def test_long_whitespace_before_assignment(self):
+        html_content = "<script>window.__INITIAL_STATE__" + " " * 100 + '={"a":1}</script>'
+        scanner = scan(html_content, 7)
+        self.assertEqual(scanner.end, len(html_content))
+
+    def test_missing_script(self):
+        scanner = scan("<script>if(window.__INITIAL_STATE__){}</script><p>x</p>", 5)
+        self.assertEqual(scanner.end, -1)
+
+    def test_fixtures(self):
+        for path in glob.glob(os.path.join(fixtures_dir, "*.html")):
+            with open(path, encoding="utf-8") as f:
+                html_content = f.read()
+            scanner = scan(html_content, 4096)
+            text = bytes(scanner.data[:scanner.end]).decode("utf-8")
+            self.assertEqual(find_initial_state(text), find_initial_state(html_content),
+                             path)
+
+
+class TestJsObjectToJson(unittest.TestCase):
+    def test_undefined_outside_strings(self):
+        self.assertEqual(js_object_to_json('{"a":undefined,"b":"undefined \\" undefined"}'),
+                         '{"a":null,"b":"undefined \\" undefined"}')
+
+    def test_no_undefined(self):
+        js_str = '{"a":1}'
+        self.assertIs(js_object_to_json(js_str), js_str)
+
+
+class TestFindOgImages(unittest.TestCase):
+    def test_head_only(self):
+        html_content = ('<head><meta content=\'http://a/1.jpg?x=1&amp;y=2\' name="og:image">'
+                        '<meta name="og:title" content="t"></head>'
+                        '<meta name="og:image" content="http://a/2.jpg">')
+        self.assertEqual(find_og_images(html_content), ["http://a/1.jpg?x=1&y=2"])
+
+    def test_page(self):
+        self.assertEqual(find_og_images(page), ["http://a.xhscdn.com/1.jpg"])
+
+
+if __name__ == '__main__':
+    unittest.main()
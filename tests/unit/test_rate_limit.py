@@ -0,0 +1,54 @@
+"""
+Offline tests of rate_limit. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import unittest
+
+from rate_limit import AdaptiveTokenBucket, new_limiters, policies
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+    def test_burst(self):
+        bucket = AdaptiveTokenBucket(rate=10, burst=3, jitter=0)
+        waits = [bucket.reserve() for _ in range(5)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        # Queued in order, one interval apart.
+        self.assertAlmostEqual(waits[3], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[4], 0.2, delta=0.01)
+        self.assertLess(bucket.available(), 0)
+
+    def test_jitter(self):
+        bucket = AdaptiveTokenBucket(rate=10, burst=100, jitter=0.5)
+        waits = [bucket.reserve() for _ in range(50)]
+        self.assertTrue(all(0 <= wait <= 0.05 for wait in waits))
+
+    def test_backoff_and_recovery(self):
+        bucket = AdaptiveTokenBucket(rate=8, burst=1, min_rate=1, backoff=0.5, recovery=0.25)
+        for _ in range(10):
+            bucket.report(False)
+        self.assertEqual(bucket.rate, 1)
+        bucket.report(True)
+        self.assertEqual(bucket.rate, 3)
+        for _ in range(10):
+            bucket.report(True)
+        self.assertEqual(bucket.rate, 8)
+        self.assertEqual(bucket.stats()["errors"], 10)
+
+    def test_reserve_spare(self):
+        bucket = AdaptiveTokenBucket(rate=10, burst=3, jitter=0)
+        self.assertEqual(bucket.reserve_spare(1), (True, 0))
+        self.assertEqual(bucket.reserve_spare(1), (True, 0))
+        taken, wait = bucket.reserve_spare(1)
+        self.assertFalse(taken)
+        self.assertAlmostEqual(wait, 0.1, delta=0.01)
+        # Requests of tool calls still get the last token at once.
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_new_limiters(self):
+        limiters = new_limiters()
+        self.assertEqual(set(limiters), set(policies))
+        self.assertIsNot(limiters["html"], new_limiters()["html"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Offline tests of retry. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import unittest
+
+from retry import LatencyTracker, RetryBudget
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_initial_tokens(self):
+        budget = RetryBudget(ratio=0.2, max_tokens=3)
+        self.assertEqual([budget.try_spend() for _ in range(4)], [True, True, True, False])
+        self.assertEqual(budget.stats()["denied"], 1)
+
+    def test_deposit(self):
+        budget = RetryBudget(ratio=0.25, max_tokens=2)
+        budget.try_spend()
+        budget.try_spend()
+        for _ in range(4):
+            budget.deposit()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        self.assertEqual(budget.stats()["requests"], 4)
+        self.assertEqual(budget.stats()["retries_and_hedges"], 3)
+
+    def test_max_tokens(self):
+        budget = RetryBudget(ratio=1, max_tokens=2)
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.stats()["tokens"], 2)
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_min_samples(self):
+        tracker = LatencyTracker(min_samples=5)
+        for seconds in range(4):
+            tracker.add(seconds)
+        self.assertIsNone(tracker.percentile(0.5))
+        tracker.add(4)
+        self.assertEqual(tracker.percentile(0.5), 2)
+
+    def test_percentile(self):
+        tracker = LatencyTracker(min_samples=1)
+        for seconds in reversed(range(100)):
+            tracker.add(seconds / 100)
+        self.assertEqual(tracker.percentile(0.95), 0.95)
+        self.assertEqual(tracker.percentile(1), 0.99)
+
+    def test_recent_only(self):
+        tracker = LatencyTracker(size=10, min_samples=1)
+        for _ in range(10):
+            tracker.add(100)
+        for _ in range(10):
+            tracker.add(1)
+        self.assertEqual(tracker.percentile(0.99), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Offline tests of seen_filter. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import os
+import tempfile
+import unittest
+
+from seen_filter import SeenFilter, SeenStore
+
+
+def ids(prefix: str, n: int) -> list[str]:
+    return [f"{prefix}{i:024x}" for i in range(n)]
+
+
+class TestSeenFilter(unittest.TestCase):
+    def test_add_many(self):
+        seen = SeenFilter(capacity=1000)
+        self.assertEqual(seen.add_many(ids("a", 100)), 100)
+        self.assertEqual(seen.add_many(ids("a", 150)), 50)
+        self.assertEqual(len(seen), 150)
+        self.assertTrue(all(id_ in seen for id_ in ids("a", 150)))
+        self.assertTrue(seen.dirty)
+
+    def test_growth_and_false_positives(self):
+        seen = SeenFilter(capacity=1000, error_rate=0.01)
+        seen.add_many(ids("a", 5000))
+        self.assertEqual(seen.stats()["layers"], 3)
+        self.assertTrue(all(id_ in seen for id_ in ids("a", 5000)))
+        # The overall rate stays under twice the rate of the first bit array.
+        false_positives = sum(id_ in seen for id_ in ids("b", 20000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertLess(seen.stats()["false_positive_rate"], 0.02)
+
+
+class TestSeenStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.path = os.path.join(self.temp_dir.name, "seen.sqlite")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_reload(self):
+        store = SeenStore(self.path, save_interval=3600, capacity=1000)
+        store.add("agent", ids("a", 10))
+        store.close()
+        seen = SeenStore(self.path, capacity=1000).get("agent")
+        self.assertTrue(all(id_ in seen for id_ in ids("a", 10)))
+        self.assertNotIn(ids("b", 1)[0], seen)
+        self.assertEqual(len(SeenStore(self.path, capacity=1000).get("other")), 0)
+
+    def test_merge_processes(self):
+        # Two stores stand for two server processes of the same profile.
+        first = SeenStore(self.path, save_interval=3600, capacity=1000)
+        second = SeenStore(self.path, save_interval=3600, capacity=1000)
+        first.add("", ids("a", 100))
+        second.add("", ids("b", 1500))
+        first.save("")
+        second.save("")
+        first.save("")
+        for store in (first, second):
+            seen = store.get("")
+            self.assertTrue(all(id_ in seen for id_ in ids("a", 100) + ids("b", 1500)))
+            self.assertEqual(seen.stats()["layers"], 2)
+            self.assertFalse(seen.dirty)
+
+    def test_profile_name(self):
+        store = SeenStore(self.path)
+        self.assertIs(store.get(""), store.get("default"))
+        self.assertRaises(AssertionError, store.get, "../x")
+
+
+if __name__ == '__main__':
+    unittest.main()
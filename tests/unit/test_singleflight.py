@@ -0,0 +1,109 @@
+"""
+Offline tests of singleflight. Run from the root folder of this program:
+    python -m unittest discover tests/unit
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from singleflight import SingleFlight
+
+
+class Cancelled(Exception):
+    pass
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight(Cancelled)
+        self.executor = ThreadPoolExecutor(max_workers=8)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_coalesce(self):
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait(5)
+            return {"id": "a"}
+
+        futures = [self.executor.submit(self.flights.do, ("detail", "a"), func)
+                   for _ in range(5)]
+        time.sleep(0.2)
+        release.set()
+        results = [future.result(5) for future in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.flights.stats()["endpoints"]["detail"],
+                         {"requests": 1, "coalesced": 4})
+        self.assertEqual(self.flights.stats()["in_flight"], 0)
+
+    def test_different_keys(self):
+        results = [self.flights.do(("detail", id_), lambda id_=id_: id_) for id_ in "ab"]
+        self.assertEqual(results, ["a", "b"])
+
+    def test_error_shared(self):
+        release = threading.Event()
+
+        def func():
+            release.wait(5)
+            raise ValueError("failed")
+
+        futures = [self.executor.submit(self.flights.do, ("detail", "a"), func)
+                   for _ in range(3)]
+        time.sleep(0.2)
+        release.set()
+        for future in futures:
+            self.assertRaises(ValueError, future.result, 5)
+
+    def test_cancelled_leader(self):
+        # The waiting caller sends the request itself instead of failing.
+        release = threading.Event()
+        calls = []
+
+        def leader():
+            calls.append("leader")
+            release.wait(5)
+            raise Cancelled()
+
+        def follower():
+            calls.append("follower")
+            return "ok"
+
+        leading = self.executor.submit(self.flights.do, ("detail", "a"), leader)
+        time.sleep(0.1)
+        following = self.executor.submit(self.flights.do, ("detail", "a"), follower)
+        time.sleep(0.1)
+        release.set()
+        self.assertRaises(Cancelled, leading.result, 5)
+        self.assertEqual(following.result(5), "ok")
+        self.assertEqual(calls, ["leader", "follower"])
+
+    def test_cancel_waiting(self):
+        release = threading.Event()
+        leading = self.executor.submit(self.flights.do, ("detail", "a"),
+                                       lambda: release.wait(5))
+        time.sleep(0.1)
+        cancel = threading.Event()
+        following = self.executor.submit(self.flights.do, ("detail", "a"), lambda: None,
+                                         cancel)
+        cancel.set()
+        self.assertRaises(Cancelled, following.result, 5)
+        release.set()
+        self.assertTrue(leading.result(5))
+
+    def test_low_priority(self):
+        # Without a call in flight, a low-priority caller calls alone, without
+        # registering a flight for others to wait on.
+        inside = []
+        self.assertEqual(self.flights.do(("detail", "a"), lambda: inside.append(
+            self.flights.stats()["in_flight"]) or "ok", lead=False), "ok")
+        self.assertEqual(inside, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
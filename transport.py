@@ -0,0 +1,147 @@
+"""
+Process-wide HTTP client shared by all tool calls. Connections to each host of
+xiaohongshu.com are pooled and kept alive across calls, so only the first request pays
+for DNS, TCP and TLS handshakes.
+
+The object has the same "get" and "post" interface as requests.Session, so it can be
+passed to the functions in get_data as "session". With "stream=True", the body is read
+on demand, by "iter_content" of requests or "iter_bytes" of httpx.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass
+class HostConfig:
+    # Maximum number of connections kept in the pool.
+    pool_size: int = 8
+    # Seconds that an idle connection is kept open (only effective with httpx).
+    keepalive_expiry: float = 60
+    # Seconds of connecting and reading timeout.
+    timeout: float = 20
+
+
+default_hosts = {
+    # HTML pages: home page and post details, fetched by several workers at once.
+    "https://www.xiaohongshu.com": HostConfig(pool_size=16, keepalive_expiry=90),
+    # JSON APIs: home feed and search, one request per page.
+    "https://edith.xiaohongshu.com": HostConfig(pool_size=8, keepalive_expiry=60),
+}
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Transport:
+    """
+    Pooled HTTP client. It uses requests by default; with "http2" enabled, it uses one
+    httpx client per host of "hosts", and one more shared by all other hosts (such as
+    the image CDN), which speak HTTP/2 if package "h2" is installed.
+    Cookies are never remembered from responses; each request sends the cookies given
+    to it explicitly.
+    Args:
+        hosts: connection pool configuration of each origin.
+        http2: whether to use httpx and HTTP/2.
+    """
+    def __init__(self, hosts: dict[str, HostConfig] | None = None, http2: bool = False):
+        self.hosts = dict(default_hosts if hosts is None else hosts)
+        self.http2 = http2
+        self._lock = threading.Lock()
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logging.warning("Package \"h2\" is not installed, so httpx uses HTTP/1.1.")
+                self._h2_available = False
+            else:
+                self._h2_available = True
+            self._clients = {}
+        else:
+            self.session = requests.Session()
+            self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            for origin, config in self.hosts.items():
+                self.session.mount(origin, HTTPAdapter(
+                    pool_connections=1, pool_maxsize=config.pool_size))
+
+    def _config(self, url: str) -> HostConfig:
+        return self.hosts.get(origin_of(url), HostConfig())
+
+    def _httpx_client(self, url: str):
+        import httpx
+
+        # Other hosts share one client, so that the number of clients is bounded.
+        origin = origin_of(url) if origin_of(url) in self.hosts else ""
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None:
+                config = self._config(url)
+                client = httpx.Client(
+                    http2=self._h2_available,
+                    timeout=config.timeout,
+                    limits=httpx.Limits(
+                        max_connections=config.pool_size,
+                        max_keepalive_connections=config.pool_size,
+                        keepalive_expiry=config.keepalive_expiry,
+                    ),
+                )
+                self._clients[origin] = client
+        return client
+
+    def request(self, method: str, url: str, headers: dict | None = None,
+                cookies: dict | None = None, **kwargs):
+        if not self.http2:
+            kwargs.setdefault("timeout", self._config(url).timeout)
+            return self.session.request(method, url, headers=headers, cookies=cookies,
+                                        **kwargs)
+        headers = dict(headers or {})
+        if cookies:
+            headers["cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        if "data" in kwargs:
+            kwargs["content"] = kwargs.pop("data")
+        # Same as requests.
+        follow_redirects = kwargs.pop("allow_redirects", True)
+        stream = kwargs.pop("stream", False)
+        client = self._httpx_client(url)
+        request = client.build_request(method, url, headers=headers, **kwargs)
+        return client.send(request, stream=stream, follow_redirects=follow_redirects)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def warm_up(self, background: bool = True):
+        """
+        Open one connection to each host, so that the first tool call doesn't pay for
+        the handshakes.
+        """
+        def warm_up_():
+            for origin in self.hosts:
+                try:
+                    self.request("HEAD", origin + "/")
+                except Exception as e:
+                    logging.warning(f"Fail to warm up connection to {origin}. "
+                                    f"{type(e).__name__}: {e}")
+
+        if background:
+            threading.Thread(target=warm_up_, name="warm-up", daemon=True).start()
+        else:
+            warm_up_()
+
+    def close(self):
+        if self.http2:
+            with self._lock:
+                for client in self._clients.values():
+                    client.close()
+                self._clients.clear()
+        else:
+            self.session.close()
@@ -4,8 +4,6 @@ import random
 import re
 import string
 
-from bs4 import BeautifulSoup
-
 
 def extract_initial_state(html_content: str) -> dict | None:
     """
@@ -16,6 +14,8 @@ def extract_initial_state(html_content: str) -> dict | None:
     Returns:
 
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
 
     for script in soup.find_all("script"):